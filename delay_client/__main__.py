@@ -1,19 +1,19 @@
-""" Main application """
+""" Main application
+
+Only the modules needed to relay messages are imported at startup; the
+test traffic generator imports its own modules when it runs.
+"""
 
-import struct
 import time
-import random
 import socket
-import os
 import logging
 
 # pylint: disable=E0401
-from delay_server.delay.delay import CommDelay
-from delay_server.delay.queue import DelayQueue
-from delay_server.delay.producer import ProducerThread
-from delay_server.delay.consumer import ConsumerThread
-from delay_server.delay.config import DelayConfig
-from delay_server.util.crc16 import CRC16
+from delay_client.delay.delay import CommDelay
+from delay_client.delay.queue import DelayQueue
+from delay_client.delay.producer import ProducerThread
+from delay_client.delay.consumer import ConsumerThread
+from delay_client.delay.config import DelayConfig
 
 
 def test_client():
@@ -22,26 +22,16 @@ def test_client():
     client_sock.connect(('', 1001))
 
 
-if __name__ == "__main__":
+def send_test_traffic(sock: socket.socket, count: int) -> None:
+    """Send random packets over a connected socket."""
+    # pylint: disable=C0415
+    import os
+    import random
+    import struct
+    from delay_client.util.crc16 import CRC16
 
-    logging.basicConfig(format='%(asctime)s:%(name)s:%(levelname)s:%(message)s', \
-        filemode='w', level=logging.DEBUG, filename='DelayServer2.log')
-    logging.info('Created logger')
-    delay = CommDelay().set_override(5)
-    config = DelayConfig()
-
-    queue = DelayQueue()
-    consumer = ConsumerThread(int(config.get('mcc', 'post_recv')), queue)
-    consumer.start_thread()
-    producer = ProducerThread(int(config.get('hab', 'port_send')), queue)
-    producer.start_thread()
-
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect(('127.0.0.1', int(config.get('mcc', 'post_recv'))))
-    time.sleep(0.1)
-    print("Send packet_data")
     i = 0
-    while i < 1:
+    while i < count:
         num_bytes = random.randint(3, 10)
         packed_data = struct.pack('! I', num_bytes)
         crc = CRC16.calc_crc(packed_data)
@@ -58,6 +48,29 @@ if __name__ == "__main__":
         if random.randint(1, 100) < 1:
             time.sleep(0.001)
         i += 1
+
+
+if __name__ == "__main__":
+
+    logging.basicConfig(format='%(asctime)s:%(name)s:%(levelname)s:%(message)s', \
+        filemode='w', level=logging.DEBUG, filename='DelayServer2.log')
+    logging.info('Created logger')
+    delay = CommDelay().set_override(5)
+    config = DelayConfig()
+
+    queue = DelayQueue()
+    consumer = ConsumerThread(int(config.get('mcc', 'port_recv')), queue,
+                              float(config.get('batch', 'window') or 0),
+                              int(config.get('batch', 'protocol') or 1))
+    consumer.start_thread()
+    producer = ProducerThread(int(config.get('hab', 'port_send')), queue)
+    producer.start_thread()
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect(('127.0.0.1', int(config.get('mcc', 'port_recv'))))
+    time.sleep(0.1)
+    print("Send packet_data")
+    send_test_traffic(sock, 1)
     print("End of packet_data")
     sock.close()
 
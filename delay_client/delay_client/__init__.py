@@ -0,0 +1 @@
+"""Delay Client package."""
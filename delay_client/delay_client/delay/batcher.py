@@ -0,0 +1,266 @@
+"""Pack messages into protocol version 2 batches."""
+import logging
+import select
+import socket
+import threading
+import time
+
+from delay_common import codec
+from delay_common.exceptions import SocketSendEmptyMessage
+from delay_common.fragment import encode_fragments
+
+
+class MessageBatcher:
+    """Send messages to the Delay Server, batching them when possible.
+
+    Call :meth:`negotiate` once the socket is connected. If the server
+    echoes the hello packet, messages passed to :meth:`send` are held for up
+    to the latency window and sent together in a single version 2 batch
+    (see :mod:`delay_common.codec`). The batch is sent early if the next
+    message does not fit. Messages too long for a batch are sent right away
+    as fragments (see :mod:`delay_common.fragment`). Otherwise, or if the
+    window is zero, every message is sent immediately as a version 1 packet.
+
+    Older servers do not reply to the hello packet and forward it to their
+    clients as a regular message, so only call :meth:`negotiate` when the
+    peer is known to support version 2 (``[batch] protocol = 2``).
+
+    :meth:`negotiate` waits for the reply. Threads serving several
+    connections call :meth:`start_negotiation` instead, pass the data
+    received to :meth:`feed` and call :meth:`poll` periodically. Messages
+    sent in the meantime are held until the version is known.
+    """
+
+    # Time (in sec) to wait for the server to answer the hello packet.
+    _TIMEOUT = 0.5
+
+    # Largest batch data length.
+    MAX_BATCH_LEN = codec.MAX_MSG_LEN - codec.FOOTER_SIZE
+
+    def __init__(self, sock: socket.socket, window: float = 0.005,
+                 logger: logging.Logger = None, timeout: float = None):
+        """Initialize.
+
+        Args:
+            sock (socket.socket): Socket connected to the Delay Server.
+            window (float): Optional; Maximum time (in sec) a message is
+                held waiting for others to share its batch. Use 0 to
+                disable batching.
+            logger (logging.Logger): Optional; Logger associated with parent
+                class.
+            timeout (float): Optional; Time (in sec) to wait for the hello
+                reply.
+
+        Raises:
+            ValueError: Negative window.
+        """
+        if window < 0:
+            raise ValueError("Batch window cannot be negative.")
+
+        self._sock = sock
+        self._window = window
+
+        self._logger = logger
+        if self._logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+
+        if timeout is not None:
+            self._TIMEOUT = timeout
+
+        self._encoder = codec.FrameEncoder()
+        self._version = 1
+
+        # Reply decoder, deadline and messages held while negotiating.
+        self._hello_decoder = None
+        self._hello_deadline = None
+        self._held = []
+
+        # Pending messages, their batch data length and sequence number of
+        # the next batch. Protected by the condition lock.
+        self._cond = threading.Condition()
+        self._pending = []
+        self._pending_len = codec.SEC_HEADER_SIZE
+        self._deadline = None
+        self._seq = 0
+
+        # ID of the next fragmented message.
+        self._msg_id = 0
+
+        self._stop = False
+        self._thread = None
+
+    @property
+    def version(self) -> int:
+        """Protocol version in use."""
+        return self._version
+
+    @property
+    def negotiating(self) -> bool:
+        """True while waiting for the server to answer the hello packet."""
+        return self._hello_deadline is not None
+
+    def negotiate(self) -> int:
+        """Negotiate protocol version 2 with the server. Waits for the
+        reply.
+
+        Returns:
+            int: Protocol version in use.
+        """
+        if not self.start_negotiation():
+            return self._version
+        while self.negotiating:
+            remaining = self._hello_deadline - time.monotonic()
+            sock_read = []
+            if remaining > 0:
+                sock_read, _, _ = select.select([self._sock], [], [],
+                                                remaining)
+            if not sock_read:
+                self._finish(1)
+            else:
+                self.feed(self._sock.recv(1024))
+        return self._version
+
+    def start_negotiation(self) -> bool:
+        """Offer protocol version 2 without waiting for the reply.
+
+        Returns:
+            bool: True if waiting for the reply. False if batching is
+                disabled.
+        """
+        if self._window == 0:
+            return False
+        self._encoder.send(self._sock, codec.HELLO_V2)
+        self._hello_decoder = codec.FrameDecoder(logger=self._logger)
+        self._hello_deadline = time.monotonic() + self._TIMEOUT
+        return True
+
+    def feed(self, data) -> None:
+        """Process data received from the server while negotiating.
+
+        Args:
+            data (bytes-like): Data received. Empty if the server closed
+                the connection, which falls back to version 1.
+        """
+        if not self.negotiating:
+            return
+        if not data:
+            self._finish(1)
+            return
+        for frame in self._hello_decoder.feed(data):
+            if frame == codec.HELLO_V2:
+                self._finish(2)
+                return
+
+    def poll(self) -> None:
+        """Fall back to version 1 if the reply did not arrive in time."""
+        if self.negotiating and time.monotonic() >= self._hello_deadline:
+            self._finish(1)
+
+    def _finish(self, version: int) -> None:
+        """Complete the negotiation and send the messages held."""
+        self._version = version
+        self._hello_decoder = None
+        self._hello_deadline = None
+        if self._version == 2:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._logger.info('Using protocol version %d.', self._version)
+
+        held = self._held
+        self._held = []
+        for msg in held:
+            try:
+                self.send(msg)
+            except codec.SocketSendPktInvalidLength as e:
+                self._logger.warning('Dropped invalid msg %s',
+                                     type(e).__name__)
+
+    def send(self, msg) -> None:
+        """Send a message.
+
+        Args:
+            msg (bytes-like): Message.
+
+        Raises:
+            SocketSendEmptyMessage: Message length cannot be zero.
+            SocketSendPktInvalidLength: Message exceeds allowed length for
+                protocol version 1.
+        """
+        if self.negotiating:
+            if len(msg) == 0:
+                raise SocketSendEmptyMessage("Cannot send empty message.")
+            self._held.append(bytes(msg))
+            return
+
+        if self._version == 1:
+            self._encoder.send(self._sock, msg)
+            return
+
+        msg_len = codec.MSG_HEADER_SIZE + len(msg)
+        if len(msg) == 0:
+            raise SocketSendEmptyMessage("Cannot send empty message.")
+
+        if codec.SEC_HEADER_SIZE + msg_len > self.MAX_BATCH_LEN:
+            with self._cond:
+                # Keep messages in order.
+                self._flush()
+                msg_id = self._msg_id
+                self._msg_id = (self._msg_id + 1) & 0xFFFFFFFF
+                for frag in encode_fragments(msg_id, msg):
+                    self._encoder.send(self._sock, frag)
+            return
+
+        with self._cond:
+            if self._pending_len + msg_len > self.MAX_BATCH_LEN:
+                self._flush()
+            self._pending.append(bytes(msg))
+            self._pending_len += msg_len
+            if self._deadline is None:
+                self._deadline = time.monotonic() + self._window
+                self._cond.notify()
+
+    def flush(self) -> None:
+        """Send pending messages now."""
+        with self._cond:
+            self._flush()
+
+    def close(self) -> None:
+        """Send pending messages and stop the flush thread."""
+        if self.negotiating:
+            self._finish(1)
+        with self._cond:
+            self._flush()
+            self._stop = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _flush(self) -> None:
+        """Send pending messages as one batch. Must hold the lock."""
+        if self._pending:
+            data = codec.encode_batch(self._seq, self._pending)
+            self._seq = (self._seq + 1) & 0xFFFFFFFF
+            self._pending = []
+            self._pending_len = codec.SEC_HEADER_SIZE
+            self._encoder.send(self._sock, data)
+        self._deadline = None
+
+    def _run(self) -> None:
+        """Flush each batch once its window expires."""
+        with self._cond:
+            while not self._stop:
+                if self._deadline is None:
+                    self._cond.wait()
+                    continue
+                remaining = self._deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                try:
+                    self._flush()
+                except OSError as e:
+                    self._logger.warning('Send error %s', e)
+                    self._pending = []
+                    self._pending_len = codec.SEC_HEADER_SIZE
+                    self._deadline = None
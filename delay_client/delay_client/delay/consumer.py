@@ -2,15 +2,36 @@
 import logging
 import select
 
+from delay_client.delay.batcher import MessageBatcher
 from delay_client.delay.server import SocketServer
+from delay_common import codec
 
 
 class ConsumerThread(SocketServer):
-    """Consumer Thread."""
+    """Consumer Thread.
 
-    def __init__(self, p_port, p_queue):
-        """Initialize thread."""
+    Messages are sent to each connection through a
+    :class:`delay_client.delay.batcher.MessageBatcher`, which packs them
+    into protocol version 2 batches if the peer negotiated it. Replies to
+    the negotiation are read in the main loop, so that a new connection
+    does not hold up the others.
+    """
+
+    def __init__(self, p_port, p_queue, batch_window=0, protocol=1):
+        """Initialize thread.
+
+        Args:
+            p_port (int): Port to send messages.
+            p_queue (DelayQueue): Queue holding the messages to send.
+            batch_window (float): Maximum time (in sec) a message waits to
+                share a batch. Use 0 to disable batching.
+            protocol (int): Highest protocol version offered to new
+                connections. Only offer version 2 if every peer supports
+                it: older servers forward the hello packet as a message.
+        """
         SocketServer.__init__(self, "Consumer", p_port, p_queue)
+        self._batch_window = batch_window
+        self._protocol = protocol
 
     def run(self, **kwargs):
         """Thread."""
@@ -19,9 +40,10 @@ class ConsumerThread(SocketServer):
         if not self._validate_thread_param(**kwargs):
             return
 
+        batchers = dict()
         i = 0
         while not kwargs['stop'].isSet():
-            sock_read, sock_write, sock_exception = \
+            sock_read, _, sock_exception = \
                 select.select(kwargs['connections'],
                               kwargs['connections'],
                               kwargs['connections'],
@@ -32,12 +54,67 @@ class ConsumerThread(SocketServer):
                     i_client_socket, i_client_address = kwargs['sock'].accept()
                     kwargs['connections'].append(i_client_socket)
                     logger.info('New connection from %s', i_client_address)
+                    batchers[i_client_socket] = \
+                        self._add_batcher(i_client_socket)
+                elif i_sock in batchers and batchers[i_sock].negotiating:
+                    self._recv_hello(i_sock, batchers[i_sock])
+            for batcher in batchers.values():
+                batcher.poll()
             data = kwargs['queue'].pop()
             if data is not None:
-                for i_sock in sock_write:
-                    self._send(i_sock, data)
+                # Includes connections accepted since the select.
+                for batcher in batchers.values():
+                    self._send_batched(batcher, data)
             for i_sock in sock_exception:
                 print(f"Removing {i_sock}")
                 kwargs['connections'].remove(i_sock)
+                self._close_batcher(batchers.pop(i_sock, None))
                 i += 1
+
+        # Send messages still waiting for their batch.
+        for batcher in batchers.values():
+            self._close_batcher(batcher)
         logger.debug('Consumed %d msgs', i)
+
+    def _add_batcher(self, sock):
+        """Create the batcher of a new connection and offer protocol
+        version 2 if enabled."""
+        batcher = MessageBatcher(sock, self._batch_window, self._logger)
+        if self._protocol >= 2:
+            try:
+                batcher.start_negotiation()
+            except OSError as err:
+                self._logger.warning('Negotiation failed %s', err)
+        return batcher
+
+    def _recv_hello(self, sock, batcher):
+        """Pass the reply to the negotiation to the batcher of a
+        connection."""
+        try:
+            data = sock.recv(1024)
+        except OSError as err:
+            self._logger.warning('Negotiation failed %s', err)
+            data = b''
+        batcher.feed(data)
+
+    def _send_batched(self, batcher, data):
+        """Send a message through a batcher. Returns False on error."""
+        try:
+            batcher.send(data)
+        except (TypeError, codec.SocketSendEmptyMessage,
+                codec.SocketSendPktInvalidLength) as err:
+            self._logger.warning('Invalid msg %s', type(err).__name__)
+            return False
+        except OSError as err:
+            self._logger.warning('Send error %s', err)
+            return False
+        return True
+
+    def _close_batcher(self, batcher):
+        """Send pending messages and stop the batcher."""
+        if batcher is None:
+            return
+        try:
+            batcher.close()
+        except OSError as err:
+            self._logger.warning('Send error %s', err)
@@ -31,8 +31,12 @@ class ProducerThread(SocketServer):
                     kwargs['connections'].append(i_client_socket)
                     logger.info('New connection from %s', i_client_address)
                 else:
-                    msg = self._receive(i_sock)
-                    if msg is not None:
+                    msgs = self._receive(i_sock)
+                    if msgs is None:
+                        kwargs['connections'].remove(i_sock)
+                        i_sock.close()
+                        continue
+                    for msg in msgs:
                         kwargs['queue'].push(msg)
                         i += 1
             for i_sock in sock_exception:
@@ -1,13 +1,11 @@
 """Abstract socket server."""
 import abc
 import threading
-import struct
 import socket
 import logging
 
-# TODO: Convert code for bytearray (mutable) instead of bytes (immutable)
-
-from delay_client.util.crc16 import CRC16
+from delay_common import codec
+from delay_common.fragment import Reassembler
 
 
 class SocketServer(abc.ABC, threading.Thread):
@@ -15,13 +13,13 @@ class SocketServer(abc.ABC, threading.Thread):
 
     # https://steelkiwi.com/blog/working-tcp-sockets/
 
-    _HEADER_DEF = '! I'
-    HEADER_SIZE = struct.calcsize(_HEADER_DEF)
+    HEADER_SIZE = codec.HEADER_SIZE
+
+    FOOTER_SIZE = codec.FOOTER_SIZE
 
-    _FOOTER_DEF = '! H'
-    FOOTER_SIZE = struct.calcsize(_FOOTER_DEF)
+    MAX_MSG_LEN = codec.MAX_MSG_LEN
 
-    MAX_MSG_LEN = 1024
+    _RECV_SIZE = 65536
 
     _SOCKET_TIMEOUT = 0.01
 
@@ -42,6 +40,15 @@ class SocketServer(abc.ABC, threading.Thread):
         self._thread_param['connections'] = []
         self._thread = None
 
+        # Packet encoder and a packet decoder for each connection.
+        # See delay_common.codec.
+        self._encoder = codec.FrameEncoder(SocketServer.MAX_MSG_LEN)
+        self._decoders = dict()
+
+        # Connections that negotiated protocol version 2 and their large
+        # message reassembly. See delay_common.fragment.
+        self._reassemblers = dict()
+
     @staticmethod
     def create_socket(port, timeout=0.1):
         """Create socket and start listening for connections."""
@@ -103,115 +110,83 @@ class SocketServer(abc.ABC, threading.Thread):
         return True
 
     def _send(self, sock, raw_data):
-        """Send a message."""
-        # Disable pylint warning for "Too many return statements"
-        # pylint: disable=R0911
-
+        """Send a message. Returns bytes sent or None on error."""
         if sock is None or raw_data is None:
             return None
 
         logger = logging.getLogger(self.__class__.__name__)
 
-        if not isinstance(raw_data, bytearray):
-            logger.warning('Wrong msg type')
-            return None
-
-        msg_len = len(raw_data) + SocketServer.FOOTER_SIZE
-        if msg_len > SocketServer.MAX_MSG_LEN:
-            logger.warning('Msg too long')
-            return None
-        if msg_len == SocketServer.FOOTER_SIZE:
-            logger.warning('Msg is empty')
-            return None
-
         try:
-            raw_hdr = bytearray(struct.pack(
-                SocketServer._HEADER_DEF, msg_len))
-            raw_msg = raw_hdr + raw_data
-            calc_crc = CRC16.calc_crc(raw_msg)
-            raw_ftr = bytearray(struct.pack(
-                SocketServer._FOOTER_DEF, calc_crc))
-        except struct.error:
-            logger.warning('Msg parse error')
+            buffers = self._encoder.encode(raw_data)
+        except (TypeError, codec.SocketSendEmptyMessage,
+                codec.SocketSendPktInvalidLength) as err:
+            logger.warning('Invalid msg %s', type(err).__name__)
             return None
 
-        raw_msg += raw_ftr
-        bytes_sent = sock.send(raw_msg)
-        if bytes_sent < msg_len:
-            logger.warning('Partial message sent')
+        # Send header, data and footer without concatenating them.
+        bytes_sent = codec.send_buffers(sock, buffers)
+        if bytes_sent < sum(len(buf) for buf in buffers):
+            logger.warning('Partial message sent (%d bytes)', bytes_sent)
             return None
 
         return bytes_sent
 
     def _receive(self, sock):
-        """Receive a message."""
-        # Disable pylint warning for "Too many return statements"
-        # pylint: disable=R0911
-
-        if sock is None:
-            return None
-
-        raw_hdr = sock.recv(SocketServer.HEADER_SIZE)
-
-        # Check for empty message header
-        if not raw_hdr:
-            return None
-
-        logger = logging.getLogger(self.__class__.__name__)
-
-        # Check for incomplete message header
-        if len(raw_hdr) < SocketServer.HEADER_SIZE:
-            logger.warning('MsgHdr len=%d < exp=%d',
-                           len(raw_hdr), SocketServer.HEADER_SIZE)
-            return None
+        """Receive available data and return the list of complete messages.
 
-        # Parse message header
-        try:
-            # Unpack the header.
-            msg_hdr = struct.unpack(SocketServer._HEADER_DEF, raw_hdr)
-            # Extract message length
-            msg_size = int(msg_hdr[0])
-        except struct.error:
-            logger.warning('MsgHdr parse error')
-            return None
+        A connection switches to protocol version 2 when the peer sends the
+        hello packet, which is echoed back. Version 2 batches are split into
+        their messages, and fragmented messages are returned once every
+        fragment arrived.
 
-        # Validate message length
-        if msg_size > SocketServer.MAX_MSG_LEN:
-            logger.warning('MsgData invalid len=%d', msg_size)
+        Returns None if the connection was closed.
+        """
+        if sock is None:
             return None
 
-        # Get message data
-        raw_data = sock.recv(msg_size)
-
-        # Check for empty message data
+        raw_data = sock.recv(SocketServer._RECV_SIZE)
         if not raw_data:
-            logger.warning('MsgData is empty')
-            return None
-
-        # Check for incomplete message data
-        if len(raw_data) < msg_size:
-            logger.warning('MsgData len=%d < exp=%d', len(raw_data), msg_size)
-            return None
-
-        # Parse message data/footer
-        try:
-            struct_def = '! ' + str(msg_size-SocketServer.FOOTER_SIZE) + 's H'
-            msg_data = struct.unpack(struct_def, raw_data)
-            msg_crc = msg_data[1]
-        except struct.error:
-            logger.warning('MsgData parse error')
-            return None
-
-        calc_crc = CRC16.calc_crc(raw_hdr)
-        calc_crc = CRC16.calc_crc(msg_data[0], calc_crc)
-
-        if calc_crc != msg_crc:
-            self._logger.warning("Msg CRC recv=%04x != exp=%04x",
-                                 msg_crc, calc_crc)
-            return None
-
-        # Returns mutable bytearray
-        return bytearray(raw_data[:-2])
+            self._decoders.pop(sock, None)
+            reassembler = self._reassemblers.pop(sock, None)
+            if reassembler is not None:
+                reassembler.clear()
+            return None
+
+        decoder = self._decoders.get(sock)
+        if decoder is None:
+            decoder = codec.FrameDecoder(SocketServer.MAX_MSG_LEN,
+                                         logger=self._logger)
+            self._decoders[sock] = decoder
+        frames = decoder.feed(raw_data)
+
+        msgs = []
+        reassembler = self._reassemblers.get(sock)
+        for frame in frames:
+            if frame == codec.HELLO_V2:
+                reassembler = Reassembler(logger=self._logger)
+                self._reassemblers[sock] = reassembler
+                self._send(sock, codec.HELLO_V2)
+                self._logger.info('Connection %s negotiated protocol '
+                                  'version 2.', sock.fileno())
+            elif reassembler is None:
+                msgs.append(frame)
+            elif frame[0] == codec.TYPE_FRAGMENT:
+                try:
+                    msg = reassembler.add(frame)
+                except ValueError as err:
+                    self._logger.warning('Dropped fragment. %s', err)
+                    continue
+                if msg is not None:
+                    msgs.append(msg.read())
+                    msg.release()
+            else:
+                try:
+                    _, batch = codec.decode_batch(frame)
+                except ValueError as err:
+                    self._logger.warning('Dropped invalid batch. %s', err)
+                    continue
+                msgs.extend(bytes(msg) for msg in batch)
+        return msgs
 
     def _validate_thread_param(self, **kwargs):
         """Validate thread parameters."""
@@ -1,4 +1,5 @@
 """Implementation of CRC-16 CCITT-FALSE Algorithm."""
+from delay_common.codec import crc16
 
 
 class CRC16:
@@ -17,12 +18,4 @@ class CRC16:
         if crc is None:
             crc = CRC16.__CRC_CCITT_INIT
 
-        for byte in data:
-            crc ^= (byte << 8)
-            for _ in range(0, 8):
-                if crc & 0x8000:
-                    crc = (crc << 1) ^ CRC16.__CRC_CCITT_POLY
-                else:
-                    crc = (crc << 1)
-            crc &= 0xFFFF
-        return crc
+        return crc16(data, crc)
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Test protocol version 2 message batching."""
+import unittest
+import socket
+import sys
+import time
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_client.delay.batcher import MessageBatcher
+from delay_common import codec
+from delay_common.exceptions import SocketSendEmptyMessage
+from delay_common.fragment import Reassembler
+
+
+@unittest.skipIf(sys.platform.startswith("win"),
+                 "Will not work on Windows")
+class TestMessageBatcher(TestClass):
+    """Test MessageBatcher against a socket pair."""
+
+    def setUp(self):
+        self._client, self._server = socket.socketpair()
+        self._encoder = codec.FrameEncoder()
+        self._decoder = codec.FrameDecoder()
+
+    def tearDown(self):
+        self._client.close()
+        self._server.close()
+
+    def _recv(self, num_frames: int) -> list:
+        frames = []
+        self._server.settimeout(1)
+        while len(frames) < num_frames:
+            frames.extend(self._decoder.feed(self._server.recv(4096)))
+        return frames
+
+    def _negotiate(self, batcher: MessageBatcher) -> None:
+        hello = self._encoder.encode_bytes(codec.HELLO_V2)
+        self._server.sendall(hello)
+        self.assertEqual(batcher.negotiate(), 2)
+        self.assertEqual(self._recv(1), [codec.HELLO_V2])
+
+    def test_init(self):
+        with self.assertRaises(ValueError):
+            MessageBatcher(self._client, -1)
+
+    def test_fallback_v1(self):
+        # Server does not answer the hello packet.
+        batcher = MessageBatcher(self._client, timeout=0.01)
+        self.assertEqual(batcher.negotiate(), 1)
+        batcher.send(b'abc')
+        self.assertEqual(self._recv(2), [codec.HELLO_V2, b'abc'])
+        batcher.close()
+
+        # Batching disabled.
+        batcher = MessageBatcher(self._client, 0)
+        self.assertEqual(batcher.negotiate(), 1)
+        batcher.send(b'xyz')
+        self.assertEqual(self._recv(1), [b'xyz'])
+
+    def test_start_negotiation(self):
+        # Messages are held until the reply arrives.
+        batcher = MessageBatcher(self._client, 0.01)
+        self.assertTrue(batcher.start_negotiation())
+        self.assertTrue(batcher.negotiating)
+        batcher.send(b'a')
+        batcher.poll()
+        self.assertEqual(self._recv(1), [codec.HELLO_V2])
+        with self.assertRaises(SocketSendEmptyMessage):
+            batcher.send(b'')
+
+        self._server.sendall(self._encoder.encode_bytes(codec.HELLO_V2))
+        self._client.settimeout(1)
+        batcher.feed(self._client.recv(1024))
+        self.assertFalse(batcher.negotiating)
+        self.assertEqual(batcher.version, 2)
+        _, msgs = codec.decode_batch(self._recv(1)[0])
+        self.assertEqual([bytes(i) for i in msgs], [b'a'])
+        batcher.close()
+
+        # Without a reply, held messages are sent as version 1 packets.
+        batcher = MessageBatcher(self._client, 0.01, timeout=0.01)
+        batcher.start_negotiation()
+        batcher.send(b'b')
+        time.sleep(0.02)
+        batcher.poll()
+        self.assertEqual(batcher.version, 1)
+        self.assertEqual(self._recv(2), [codec.HELLO_V2, b'b'])
+
+        # Or if the connection closed.
+        batcher = MessageBatcher(self._client, 0.01)
+        batcher.start_negotiation()
+        batcher.feed(b'')
+        self.assertFalse(batcher.negotiating)
+        self.assertEqual(batcher.version, 1)
+
+    def test_window(self):
+        batcher = MessageBatcher(self._client, 0.05)
+        self._negotiate(batcher)
+
+        start = time.monotonic()
+        for msg in (b'a', b'bc', b'def'):
+            batcher.send(msg)
+        frame = self._recv(1)[0]
+        self.assertGreaterEqual(time.monotonic() - start, 0.04)
+        seq, msgs = codec.decode_batch(frame)
+        self.assertEqual(seq, 0)
+        self.assertEqual([bytes(i) for i in msgs], [b'a', b'bc', b'def'])
+
+        batcher.send(b'g')
+        batcher.close()
+        seq, msgs = codec.decode_batch(self._recv(1)[0])
+        self.assertEqual(seq, 1)
+        self.assertEqual([bytes(i) for i in msgs], [b'g'])
+
+    def test_full_batch(self):
+        batcher = MessageBatcher(self._client, 10)
+        self._negotiate(batcher)
+
+        with self.assertRaises(SocketSendEmptyMessage):
+            batcher.send(b'')
+
+        # Batch is sent as soon as the next message does not fit.
+        msg = b'\x01' * 500
+        for _ in range(3):
+            batcher.send(msg)
+        frames = self._recv(1)
+        _, msgs = codec.decode_batch(frames[0])
+        self.assertEqual(len(msgs), 2)
+        batcher.close()
+        _, msgs = codec.decode_batch(self._recv(1)[0])
+        self.assertEqual(len(msgs), 1)
+
+    def test_large_message(self):
+        batcher = MessageBatcher(self._client, 10)
+        self._negotiate(batcher)
+
+        # Pending batch is sent before the fragments.
+        msg = bytes(range(256)) * 20
+        batcher.send(b'a')
+        batcher.send(msg)
+        frames = self._recv(7)
+        _, msgs = codec.decode_batch(frames[0])
+        self.assertEqual([bytes(i) for i in msgs], [b'a'])
+
+        reassembler = Reassembler()
+        for frame in frames[1:-1]:
+            self.assertIsNone(reassembler.add(frame))
+        ret = reassembler.add(frames[-1])
+        self.assertEqual(ret.read(), msg)
+        ret.release()
+        batcher.close()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Packet protocol conformance for the Delay Client."""
+import unittest
+import socket
+import sys
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_client.delay.server import SocketServer
+from delay_common.conformance import CodecConformance
+
+
+class _Server(SocketServer):
+    """Concrete SocketServer without a thread body."""
+
+    def run(self, **kwargs):
+        pass
+
+
+@unittest.skipIf(sys.platform.startswith("win"),
+                 "Will not work on Windows")
+class TestCodecConformance(CodecConformance, TestClass):
+    """Run the shared conformance suite on SocketServer."""
+
+    def setUp(self):
+        self._server = _Server("Test", None, None)
+        self._sock_send, self._sock_recv = socket.socketpair()
+
+    def tearDown(self):
+        self._sock_send.close()
+        self._sock_recv.close()
+
+    def encode(self, data: bytes) -> bytes:
+        num_bytes = self._server._send(self._sock_send, bytearray(data))
+        if num_bytes is None:
+            return None
+        return self._sock_recv.recv(num_bytes, socket.MSG_WAITALL)
+
+    def decode(self, chunks: list) -> list:
+        ret = []
+        for chunk in chunks:
+            self._sock_send.sendall(chunk)
+            ret.extend(bytes(msg) for msg in
+                       self._server._receive(self._sock_recv))
+        return ret
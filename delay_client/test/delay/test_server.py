@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Test protocol version 2 on the Delay Client socket servers."""
+import unittest
+import socket
+import sys
+import time
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_client.delay.consumer import ConsumerThread
+from delay_client.delay.delay import CommDelay
+from delay_client.delay.queue import DelayQueue
+from delay_client.delay.server import SocketServer
+from delay_common import codec
+from delay_common.fragment import encode_fragments
+
+
+class _Server(SocketServer):
+    """Concrete SocketServer without a thread body."""
+
+    def run(self, **kwargs):
+        pass
+
+
+def _free_port() -> int:
+    """Return a port that is free at the moment."""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@unittest.skipIf(sys.platform.startswith("win"),
+                 "Will not work on Windows")
+class TestSocketServer(TestClass):
+    """Test receiving protocol version 2 packets."""
+
+    def setUp(self):
+        self._server = _Server("Test", None, None)
+        self._encoder = codec.FrameEncoder()
+        self._sock_send, self._sock_recv = socket.socketpair()
+
+    def tearDown(self):
+        self._sock_send.close()
+        self._sock_recv.close()
+
+    def _receive(self, *packets) -> list:
+        for data in packets:
+            self._sock_send.sendall(self._encoder.encode_bytes(data))
+        return self._server._receive(self._sock_recv)
+
+    def test_receive_v1(self):
+        # Batches are plain messages until the peer sends the hello.
+        batch = codec.encode_batch(0, [b'a'])
+        self.assertEqual(self._receive(b'abc', batch), [b'abc', batch])
+
+    def test_receive_v2(self):
+        # The hello packet is echoed back and not returned as a message.
+        self.assertEqual(self._receive(codec.HELLO_V2), [])
+        self._sock_send.settimeout(1)
+        self.assertEqual(codec.FrameDecoder().feed(self._sock_send.recv(64)),
+                         [codec.HELLO_V2])
+
+        # Batches are split and invalid ones dropped.
+        self.assertEqual(self._receive(codec.encode_batch(0, [b'a', b'bc']),
+                                       b'\x01\x00',
+                                       codec.encode_batch(1, [b'def'])),
+                         [b'a', b'bc', b'def'])
+
+        # Fragmented messages are returned once complete.
+        msg = bytes(range(256)) * 20
+        frags = list(encode_fragments(7, msg))
+        self.assertEqual(self._receive(*frags[:-1]), [])
+        self.assertEqual(self._receive(frags[-1]), [msg])
+
+        # Reassembly is discarded with the connection.
+        self._receive(frags[0])
+        self._sock_send.close()
+        self.assertIsNone(self._server._receive(self._sock_recv))
+        self.assertNotIn(self._sock_recv, self._server._reassemblers)
+
+
+@unittest.skipIf(sys.platform.startswith("win"),
+                 "Will not work on Windows")
+class TestConsumerThread(TestClass):
+    """Test batching on the consumer thread."""
+
+    def setUp(self):
+        CommDelay().set_override(0)
+        self._encoder = codec.FrameEncoder()
+        self._queue = DelayQueue()
+        self._port = _free_port()
+
+    def tearDown(self):
+        CommDelay().clear_override()
+
+    def _relay(self, consumer, msgs: list) -> list:
+        """Send messages through the consumer. Returns the packets
+        received by the peer."""
+        consumer.start_thread()
+        sock = socket.create_connection(('127.0.0.1', self._port), 1)
+        sock.settimeout(2)
+        decoder = codec.FrameDecoder()
+        try:
+            if consumer._protocol >= 2:
+                # Answer the hello packet like a version 2 server.
+                self.assertEqual(decoder.feed(sock.recv(64)),
+                                 [codec.HELLO_V2])
+                sock.sendall(self._encoder.encode_bytes(codec.HELLO_V2))
+            else:
+                # Wait for the consumer to accept the connection.
+                while len(consumer._thread_param['connections']) < 2:
+                    time.sleep(0.001)
+            for msg in msgs:
+                self._queue.push(msg)
+            packets = []
+            while sum(self._count(packet, consumer._protocol)
+                      for packet in packets) < len(msgs):
+                packets.extend(decoder.feed(sock.recv(65536)))
+        finally:
+            consumer.stop_thread()
+            sock.close()
+        return packets
+
+    @staticmethod
+    def _count(packet, protocol: int) -> int:
+        """Return the number of messages in a packet."""
+        if protocol < 2:
+            return 1
+        return len(codec.decode_batch(packet)[1])
+
+    def test_batching(self):
+        consumer = ConsumerThread(self._port, self._queue, 0.05, 2)
+        packets = self._relay(consumer, [b'a', b'bc', b'def'])
+
+        # Messages popped within the window share one batch.
+        self.assertEqual(len(packets), 1)
+        _, msgs = codec.decode_batch(packets[0])
+        self.assertEqual([bytes(i) for i in msgs], [b'a', b'bc', b'def'])
+
+    def test_negotiation_non_blocking(self):
+        # A connection that does not answer the hello packet does not hold
+        # up the others.
+        consumer = ConsumerThread(self._port, self._queue, 0.01, 2)
+        consumer.start_thread()
+        silent = socket.create_connection(('127.0.0.1', self._port), 1)
+        try:
+            silent.settimeout(2)
+            decoder = codec.FrameDecoder()
+            self.assertEqual(decoder.feed(silent.recv(64)), [codec.HELLO_V2])
+            start = time.monotonic()
+            sock = socket.create_connection(('127.0.0.1', self._port), 1)
+            sock.settimeout(2)
+            self.assertEqual(codec.FrameDecoder().feed(sock.recv(64)),
+                             [codec.HELLO_V2])
+            self.assertLess(time.monotonic() - start, 0.25)
+            sock.close()
+        finally:
+            consumer.stop_thread()
+            silent.close()
+
+    def test_no_hello_v1(self):
+        # Version 2 is not offered unless enabled.
+        consumer = ConsumerThread(self._port, self._queue, 0.05)
+        self.assertEqual(self._relay(consumer, [b'a', b'bc']), [b'a', b'bc'])
@@ -0,0 +1 @@
+"""Code shared by the Delay Server and Delay Client packages."""
@@ -0,0 +1,138 @@
+"""Benchmark the packet codec.
+
+Measures encode and decode throughput for several packet sizes and the
+speed of the CRC compared to the bit-by-bit reference implementation.
+Also measures the throughput of fragmenting and reassembling large messages.
+
+Usage (from the repository root): ``python -m delay_common.bench_codec``
+"""
+import logging
+import os
+import sys
+import time
+
+from delay_common.codec import FrameEncoder, FrameDecoder, crc16, \
+    MAX_MSG_LEN, FOOTER_SIZE
+from delay_common.fragment import encode_fragments, Reassembler
+
+SIZES = (20, 256, MAX_MSG_LEN - FOOTER_SIZE)
+
+# Decoder logger for corrupted streams.
+_QUIET = logging.getLogger('bench_codec')
+_QUIET.disabled = True
+
+
+def reference_crc16(data, crc: int = 0xFFFF) -> int:
+    """Bit-by-bit CRC16 CCITT-FALSE previously used by both packages."""
+    for byte in data:
+        crc ^= (byte << 8)
+        for _ in range(0, 8):
+            if crc & 0x8000:
+                crc = (crc << 1) ^ 0x1021
+            else:
+                crc = (crc << 1)
+        crc &= 0xFFFF
+    return crc
+
+
+def _rate(func, count: int) -> float:
+    """Return calls per second of func."""
+    start = time.perf_counter()
+    for _ in range(count):
+        func()
+    return count / (time.perf_counter() - start)
+
+
+def bench_encode(size: int, count: int) -> float:
+    """Return packets per second encoded."""
+    encoder = FrameEncoder()
+    data = bytes(size)
+    return _rate(lambda: encoder.encode(data), count)
+
+
+def bench_decode(size: int, count: int) -> float:
+    """Return packets per second decoded from a stream of 64 KiB chunks."""
+    packet = FrameEncoder().encode_bytes(bytes(size))
+    stream = packet * count
+    chunk = 65536
+    decoder = FrameDecoder()
+    start = time.perf_counter()
+    num = 0
+    for pos in range(0, len(stream), chunk):
+        num += len(decoder.feed(stream[pos:pos + chunk]))
+    return num / (time.perf_counter() - start)
+
+
+def bench_resync(size: int, count: int, error_rate: float) -> tuple:
+    """Decode a stream where a fraction of the packets are corrupted.
+
+    Returns:
+        tuple: Packets per second decoded and fraction of the valid packets
+            recovered.
+    """
+    packet = FrameEncoder().encode_bytes(os.urandom(size))
+    bad = bytearray(packet)
+    bad[1] = 0xFF
+    step = max(1, int(1 / error_rate))
+    stream = b''.join(bytes(bad) if i % step == 0 else packet
+                      for i in range(count))
+    valid = count - len(range(0, count, step))
+    decoder = FrameDecoder(logger=_QUIET)
+    start = time.perf_counter()
+    num = 0
+    for pos in range(0, len(stream), 65536):
+        num += len(decoder.feed(stream[pos:pos + 65536]))
+    return num / (time.perf_counter() - start), num / valid
+
+
+def bench_fragment(size: int, spill_len: int = None) -> tuple:
+    """Return MB/s to fragment and encode a message, and to decode and
+    reassemble it."""
+    msg = os.urandom(size)
+    encoder = FrameEncoder()
+    start = time.perf_counter()
+    stream = b''.join(encoder.encode_bytes(frag)
+                      for frag in encode_fragments(1, msg))
+    enc = size / (time.perf_counter() - start) / 1e6
+
+    decoder = FrameDecoder()
+    reassembler = Reassembler(max_len=size, spill_len=spill_len)
+    start = time.perf_counter()
+    for pos in range(0, len(stream), 65536):
+        for frame in decoder.feed(stream[pos:pos + 65536]):
+            ret = reassembler.add(frame)
+    dec = size / (time.perf_counter() - start) / 1e6
+    ret.release()
+    return enc, dec
+
+
+def main(argv: list) -> None:
+    """Run all benchmarks and print the results."""
+    count = int(argv[1]) if len(argv) > 1 else 100000
+    print(f"{'size':>6} {'encode pkt/s':>14} {'decode pkt/s':>14}"
+          f" {'decode MB/s':>12}")
+    for size in SIZES:
+        enc = bench_encode(size, count)
+        dec = bench_decode(size, count)
+        print(f"{size:6d} {enc:14.0f} {dec:14.0f} {dec * size / 1e6:12.1f}")
+
+    for rate in (0.001, 0.01, 0.1):
+        pkts, recovered = bench_resync(256, count, rate)
+        print(f"resync {rate:.1%} corrupt: {pkts:.0f} pkt/s, "
+              f"{recovered:.2%} of valid packets recovered")
+
+    data = bytes(MAX_MSG_LEN)
+    fast = _rate(lambda: crc16(data), 10000) * len(data) / 1e6
+    slow = _rate(lambda: reference_crc16(data), 100) * len(data) / 1e6
+    print(f"crc16 {fast:.1f} MB/s, reference {slow:.2f} MB/s")
+
+    size = 8 << 20
+    for spill_len in (None, 0):
+        enc, dec = bench_fragment(size, spill_len)
+        where = 'memory' if spill_len is None else 'file'
+        print(f"fragment {size >> 20} MiB ({where}): encode {enc:.1f} MB/s, "
+              f"reassemble {dec:.1f} MB/s")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
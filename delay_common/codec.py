@@ -0,0 +1,460 @@
+"""Packet codec shared by the Delay Server and Delay Client.
+
+Implements the packet structure shown below:
+
++----------------+----------------------------------+-----------+
+| Primary Header | Packet Data                      | Footer    |
++----------------+----------------------------------+-----------+
+| Length         | Optional Secondary Header + Data | CRC16     |
+| (4 bytes)      | (1-1022 bytes)                   | (2 bytes) |
++----------------+----------------------------------+-----------+
+
+The length counts the data and the footer. The CRC16 (CCITT-FALSE) covers
+the header and the data.
+
+Protocol version 2 is negotiated per connection. The client sends a packet
+whose data is :data:`HELLO_V2` and switches to version 2 once the server
+echoes it back. Clients that never send it keep using version 1. Version 2
+uses the same packets, but the data starts with a secondary header:
+
++-----------+-----------+-----------+----------------------------------+
+| Type      | Sequence  | Count     | Messages                         |
+| (1 byte)  | (4 bytes) | (2 bytes) | Length (2 bytes) + data, ...     |
++-----------+-----------+-----------+----------------------------------+
+
+A :data:`TYPE_BATCH` packet carries several application messages with a
+single header, CRC and send, and is queued and released as a unit.
+
+Messages that do not fit in a packet are split into :data:`TYPE_FRAGMENT`
+packets with the secondary header below and reassembled by the receiver
+(see :mod:`delay_common.fragment`):
+
++----------+------------+--------------+------------+-------------+------+
+| Type     | Message ID | Total Length | Offset     | Message CRC | Data |
+| (1 byte) | (4 bytes)  | (4 bytes)    | (4 bytes)  | (2 bytes)   |      |
++----------+------------+--------------+------------+-------------+------+
+"""
+import binascii
+import logging
+import re
+import socket
+import struct
+
+# pylint: disable=W0611
+from delay_common.exceptions import SocketSendEmptyMessage, \
+    SocketSendPktInvalidLength
+
+# Precompiled packet header (message length) and footer (CRC16).
+HEADER = struct.Struct('! I')
+FOOTER = struct.Struct('! H')
+
+HEADER_SIZE = HEADER.size
+FOOTER_SIZE = FOOTER.size
+
+# Maximum message length (data + footer).
+MAX_MSG_LEN = 1024
+
+# Seed for the CRC16 CCITT-FALSE algorithm.
+CRC_INIT = 0xFFFF
+
+# Data of the packet used to negotiate protocol version 2.
+HELLO_V2 = b'\xffDLY\x02'
+
+# Protocol version 2 secondary header and message length prefix.
+SEC_HEADER = struct.Struct('! B I H')
+SEC_HEADER_SIZE = SEC_HEADER.size
+MSG_HEADER = struct.Struct('! H')
+MSG_HEADER_SIZE = MSG_HEADER.size
+
+# Protocol version 2 fragment secondary header.
+FRAG_HEADER = struct.Struct('! B I I I H')
+FRAG_HEADER_SIZE = FRAG_HEADER.size
+
+# Protocol version 2 packet types.
+TYPE_BATCH = 0x01
+TYPE_FRAGMENT = 0x02
+
+
+def crc16(data, crc: int = CRC_INIT) -> int:
+    """Calculate CRC-16 CCITT-FALSE on the given data.
+
+    Uses the C implementation in :py:func:`binascii.crc_hqx`, which shares
+    the polynomial (0x1021) and bit order of CCITT-FALSE.
+
+    Args:
+        data (bytes-like): Data to compute CRC on.
+        crc (int): Seed value. Defaults to 0xFFFF.
+
+    Returns:
+        int: 16-bit CRC.
+    """
+    return binascii.crc_hqx(data, crc)
+
+
+def verify(packet) -> bool:
+    """Check that a complete packet is well formed.
+
+    Args:
+        packet (bytes-like): Header, data and footer of one packet.
+
+    Returns:
+        bool: True if the length matches the header and the CRC is valid.
+    """
+    length = len(packet)
+    if length <= HEADER_SIZE + FOOTER_SIZE:
+        return False
+    if HEADER.unpack_from(packet)[0] != length - HEADER_SIZE:
+        return False
+    data_end = length - FOOTER_SIZE
+    with memoryview(packet) as view:
+        calc_crc = binascii.crc_hqx(view[:data_end], CRC_INIT)
+    return calc_crc == FOOTER.unpack_from(packet, data_end)[0]
+
+
+def encode_batch(seq: int, msgs: list) -> bytearray:
+    """Build the data of a protocol version 2 batch packet.
+
+    Args:
+        seq (int): Sequence number of the batch (32 bits).
+        msgs (list): Bytes-like messages.
+
+    Returns:
+        bytearray: Secondary header followed by the messages.
+    """
+    data = bytearray(batch_size(msgs))
+    SEC_HEADER.pack_into(data, 0, TYPE_BATCH, seq & 0xFFFFFFFF, len(msgs))
+    pos = SEC_HEADER_SIZE
+    for msg in msgs:
+        MSG_HEADER.pack_into(data, pos, len(msg))
+        pos += MSG_HEADER_SIZE
+        data[pos:pos + len(msg)] = msg
+        pos += len(msg)
+    return data
+
+
+def batch_size(msgs: list) -> int:
+    """Return the data length of a batch packet holding msgs."""
+    return SEC_HEADER_SIZE + sum(MSG_HEADER_SIZE + len(msg) for msg in msgs)
+
+
+def decode_batch(data) -> tuple:
+    """Split the data of a protocol version 2 batch packet.
+
+    Args:
+        data (bytes-like): Packet data starting with the secondary header.
+
+    Returns:
+        tuple: Sequence number and list of :class:`memoryview` messages.
+
+    Raises:
+        ValueError: Data is not a well formed batch.
+    """
+    length = len(data)
+    if length < SEC_HEADER_SIZE:
+        raise ValueError("Batch too short.")
+    pkt_type, seq, count = SEC_HEADER.unpack_from(data)
+    if pkt_type != TYPE_BATCH:
+        raise ValueError("Unknown packet type " + str(pkt_type))
+
+    view = memoryview(data)
+    msgs = []
+    pos = SEC_HEADER_SIZE
+    for _ in range(count):
+        if pos + MSG_HEADER_SIZE > length:
+            raise ValueError("Batch truncated.")
+        msg_len = MSG_HEADER.unpack_from(data, pos)[0]
+        pos += MSG_HEADER_SIZE
+        if pos + msg_len > length:
+            raise ValueError("Batch truncated.")
+        msgs.append(view[pos:pos + msg_len])
+        pos += msg_len
+    if pos != length:
+        raise ValueError("Batch has trailing data.")
+    return seq, msgs
+
+
+class FrameEncoder:
+    """Assemble and send packets.
+
+    The header and footer are packed into reusable buffers, so an encoder
+    must not be shared between threads.
+    """
+
+    def __init__(self, max_msg_len: int = MAX_MSG_LEN):
+        """Initialize.
+
+        Args:
+            max_msg_len (int): Maximum message length (data + footer).
+        """
+        self._max_msg_len = max_msg_len
+        self._hdr_buf = bytearray(HEADER_SIZE)
+        self._ftr_buf = bytearray(FOOTER_SIZE)
+
+    def encode(self, data) -> list:
+        """Build the packet for data without copying it.
+
+        Args:
+            data (bytes-like): Packet data.
+
+        Returns:
+            list: Header, data and footer buffers. The header and footer
+                are reused by the next call to :meth:`encode`.
+
+        Raises:
+            AttributeError: data is None.
+            TypeError: data is not :class:`bytes`, :class:`bytearray` or
+                :class:`memoryview`.
+            SocketSendEmptyMessage: data length cannot be zero.
+            SocketSendPktInvalidLength: data exceeds allowed pkt length.
+        """
+        if data is None:
+            raise AttributeError("Socket send data cannot be None.")
+
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise TypeError("Socket send data must be a bytes or bytearray.")
+
+        if not len(data):
+            raise SocketSendEmptyMessage()
+
+        msg_len = len(data) + FOOTER_SIZE
+        if msg_len > self._max_msg_len:
+            raise SocketSendPktInvalidLength()
+
+        HEADER.pack_into(self._hdr_buf, 0, msg_len)
+        crc = binascii.crc_hqx(data, binascii.crc_hqx(self._hdr_buf,
+                                                        CRC_INIT))
+        FOOTER.pack_into(self._ftr_buf, 0, crc)
+        return [self._hdr_buf, data, self._ftr_buf]
+
+    def encode_bytes(self, data) -> bytes:
+        """Return the packet for data as a single :class:`bytes` object.
+
+        See :meth:`encode` for exceptions.
+        """
+        return b''.join(self.encode(data))
+
+    def send(self, sock: socket.socket, data) -> int:
+        """Encode and send a packet.
+
+        See :meth:`encode` for exceptions.
+
+        Args:
+            sock (socket.socket): Connection.
+            data (bytes-like): Packet data.
+
+        Returns:
+            int: Number of bytes sent. Less than the packet length if the
+                socket timed out before the whole packet was sent.
+        """
+        return send_buffers(sock, self.encode(data))
+
+
+def send_buffers(sock: socket.socket, buffers: list) -> int:
+    """Send a list of buffers in order without concatenating them.
+
+    Uses scatter-gather :py:meth:`socket.socket.sendmsg` and resumes from
+    the first unsent byte after a partial send. Falls back to one send per
+    buffer where sendmsg is not available.
+
+    Args:
+        sock (socket.socket): Connection.
+        buffers (list): Bytes-like objects to send.
+
+    Returns:
+        int: Number of bytes sent. Stops early if the socket times out.
+    """
+    views = [memoryview(buf) for buf in buffers]
+    total = 0
+    try:
+        if not hasattr(sock, 'sendmsg'):
+            for view in views:
+                sock.sendall(view)
+                total += len(view)
+            return total
+
+        while views:
+            sent = sock.sendmsg(views)
+            total += sent
+            # Skip buffers that were sent completely.
+            while views and sent >= len(views[0]):
+                sent -= len(views[0])
+                views.pop(0)
+            # Resume in the middle of a partially sent buffer.
+            if sent:
+                views[0] = views[0][sent:]
+    except socket.timeout:
+        pass
+    return total
+
+
+class FrameDecoder:
+    """Incremental packet decoder for a byte stream.
+
+    Data read from a connection is passed to :meth:`feed` in chunks of any
+    size, which returns the packets completed by that chunk. Partial
+    packets are kept until the rest of the data arrives.
+
+    By default each packet is returned as a :class:`bytearray` holding the
+    data. Alternatively, provide an ``alloc`` callable that returns a buffer
+    object (see :class:`delay_server.util.buffer_pool.FrameBuffer`) with a
+    writable ``view`` and ``size``, ``start`` and ``end`` attributes. The
+    complete packet is copied into it and the data section is delimited by
+    ``start`` and ``end``.
+
+    If a packet has an invalid length or CRC, the decoder discards bytes
+    until the next offset where a packet with a valid length and CRC starts.
+    Candidate offsets are found with a regular expression matching the
+    leading bytes of every valid length, so the scan runs in C rather than
+    one byte at a time.
+    """
+
+    def __init__(self, max_msg_len: int = MAX_MSG_LEN, alloc=None,
+                 logger: logging.Logger = None):
+        """Initialize.
+
+        Args:
+            max_msg_len (int): Maximum message length (data + footer).
+            alloc (callable): Optional; Returns a buffer for each packet.
+            logger (logging.Logger): Logger associated with parent class.
+        """
+        self._max_msg_len = max_msg_len
+        self._alloc = alloc
+        self._logger = logger
+        if self._logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+
+        # Bytes received that do not form a complete packet yet.
+        self._buf = bytearray()
+
+        # Matches the start of any header with a length <= max_msg_len.
+        self._candidate = _header_pattern(max_msg_len)
+
+        # False while discarding data to find the next valid packet.
+        self._in_sync = True
+
+        # Error counters.
+        self.crc_errors = 0
+        self.length_errors = 0
+        self.discarded = 0
+
+    def __len__(self) -> int:
+        """Return number of buffered bytes."""
+        return len(self._buf)
+
+    def feed(self, data) -> list:
+        """Add data received from the stream and extract complete packets.
+
+        Args:
+            data (bytes-like): Next chunk of the stream.
+
+        Returns:
+            list: Packets completed by this chunk. Invalid packets are
+                discarded and the stream is resynchronized on the next
+                valid packet.
+        """
+        # Parse directly from the new chunk unless a partial packet is
+        # pending, which avoids copying data into the internal buffer.
+        if self._buf:
+            self._buf += data
+            src = self._buf
+        else:
+            src = data
+
+        frames = []
+        pos = 0
+        length = len(src)
+        with memoryview(src) as view:
+            while length - pos >= HEADER_SIZE:
+                msg_size = HEADER.unpack_from(view, pos)[0]
+                if msg_size > self._max_msg_len or msg_size <= FOOTER_SIZE:
+                    if self._in_sync:
+                        self.length_errors += 1
+                        self._logger.warning('MsgData invalid len=%d',
+                                             msg_size)
+                    pos = self._resync(view, pos, length)
+                    continue
+
+                end = pos + HEADER_SIZE + msg_size
+                if end > length:
+                    break
+
+                data_end = end - FOOTER_SIZE
+                calc_crc = binascii.crc_hqx(view[pos:data_end], CRC_INIT)
+                msg_crc = FOOTER.unpack_from(view, data_end)[0]
+                if calc_crc != msg_crc:
+                    if self._in_sync:
+                        self.crc_errors += 1
+                        self._logger.warning("Msg CRC recv=%04x != exp=%04x",
+                                             msg_crc, calc_crc)
+                    pos = self._resync(view, pos, length)
+                    continue
+
+                if not self._in_sync:
+                    self._in_sync = True
+                    self._logger.info('Resynchronized stream. '
+                                      'Discarded %d bytes total.',
+                                      self.discarded)
+                frames.append(self._make_frame(view, pos, end))
+                pos = end
+
+            # Keep the partial packet, if any.
+            if src is not self._buf and pos < length:
+                self._buf = bytearray(view[pos:])
+        if src is self._buf:
+            del self._buf[:pos]
+        return frames
+
+    def _resync(self, view: memoryview, pos: int, length: int) -> int:
+        """Find the next offset after pos that may start a valid packet.
+
+        Args:
+            view (memoryview): Stream being parsed.
+            pos (int): Offset of the invalid packet.
+            length (int): Number of bytes in the stream.
+
+        Returns:
+            int: Offset of the next candidate header. If none is found, keep
+                the last bytes since they may be the start of a header.
+        """
+        self._in_sync = False
+        match = self._candidate.search(view, pos + 1, length)
+        while match is not None:
+            candidate = match.start()
+            if length - candidate < HEADER_SIZE:
+                break
+            msg_size = HEADER.unpack_from(view, candidate)[0]
+            if FOOTER_SIZE < msg_size <= self._max_msg_len:
+                break
+            match = self._candidate.search(view, candidate + 1, length)
+
+        if match is not None:
+            new_pos = match.start()
+        else:
+            new_pos = max(pos + 1, length - HEADER_SIZE + 1)
+        self.discarded += new_pos - pos
+        return new_pos
+
+    def _make_frame(self, view: memoryview, start: int, end: int):
+        """Copy a verified packet out of the stream."""
+        if self._alloc is None:
+            return bytearray(view[start + HEADER_SIZE:end - FOOTER_SIZE])
+        frame = self._alloc()
+        size = end - start
+        frame.view[:size] = view[start:end]
+        frame.size = size
+        frame.start = HEADER_SIZE
+        frame.end = size - FOOTER_SIZE
+        return frame
+
+
+def _header_pattern(max_msg_len: int):
+    """Return regex matching the leading bytes of headers up to max_msg_len.
+
+    The most significant bytes of a valid length are zero and the first
+    non-zero byte is bounded by max_msg_len.
+    """
+    num_bytes = max(1, (max_msg_len.bit_length() + 7) // 8)
+    zeros = HEADER_SIZE - num_bytes
+    top = max_msg_len >> (8 * (num_bytes - 1))
+    return re.compile(re.escape(b'\x00' * zeros) +
+                      b'[\x00-' + re.escape(bytes([top])) + b']')
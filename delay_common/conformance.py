@@ -0,0 +1,210 @@
+"""Conformance suite for the packet protocol.
+
+The Delay Server and the Delay Client both run this suite against their own
+send and receive paths so that they cannot drift apart. To use it, derive a
+test class from :class:`CodecConformance` and :class:`unittest.TestCase` and
+implement :meth:`CodecConformance.encode` and
+:meth:`CodecConformance.decode`.
+"""
+import os
+import tracemalloc
+
+from delay_common.codec import HEADER, FOOTER, MAX_MSG_LEN, FOOTER_SIZE, \
+    FRAG_HEADER, TYPE_FRAGMENT, encode_batch, decode_batch, batch_size
+from delay_common.fragment import encode_fragments, Reassembler, \
+    FRAG_PAYLOAD
+
+# Reference packets as (data, crc). The wire format is
+# length (data + footer) + data + crc.
+VECTORS = [
+    (b'\x01', 0x547E),
+    (b'\x01\x02', 0xC1A3),
+    (b'abc', 0xD05D),
+    (bytes(range(256)), 0xBE81),
+    (b'\xff' * (MAX_MSG_LEN - FOOTER_SIZE), 0x5F38),
+]
+
+# Reference protocol version 2 batches as (seq, msgs, data).
+BATCH_VECTORS = [
+    (7, [b'ab', b'', b'xyz'],
+     b'\x01\x00\x00\x00\x07\x00\x03\x00\x02ab\x00\x00\x00\x03xyz'),
+    (0xFFFFFFFF, [], b'\x01\xff\xff\xff\xff\x00\x00'),
+]
+
+
+def wire(data: bytes, crc: int) -> bytes:
+    """Return the reference packet for data."""
+    return HEADER.pack(len(data) + FOOTER_SIZE) + data + FOOTER.pack(crc)
+
+
+class CodecConformance:
+    """Tests every implementation of the packet protocol must pass."""
+
+    def encode(self, data: bytes) -> bytes:
+        """Encode data with the implementation under test.
+
+        Returns:
+            bytes: Packet sent on the wire or :class:`None` if the
+                implementation rejected the data.
+        """
+        raise NotImplementedError
+
+    def decode(self, chunks: list) -> list:
+        """Receive a stream with the implementation under test.
+
+        Args:
+            chunks (list): Stream split into chunks, received in order.
+
+        Returns:
+            list: Data of each packet received, as :class:`bytes`.
+        """
+        raise NotImplementedError
+
+    def test_encode_vectors(self):
+        for data, crc in VECTORS:
+            self.assertEqual(self.encode(data), wire(data, crc))
+
+    def test_encode_invalid(self):
+        self.assertIsNone(self.encode(b''))
+        self.assertIsNone(self.encode(b'\x00' * (MAX_MSG_LEN -
+                                                  FOOTER_SIZE + 1)))
+
+    def test_decode_vectors(self):
+        for data, crc in VECTORS:
+            self.assertEqual(self.decode([wire(data, crc)]), [data])
+
+    def test_decode_stream(self):
+        stream = b''.join(wire(data, crc) for data, crc in VECTORS)
+        expected = [data for data, _ in VECTORS]
+
+        # All packets in a single chunk.
+        self.assertEqual(self.decode([stream]), expected)
+
+        # Packets split at arbitrary boundaries.
+        chunks = [stream[i:i + 7] for i in range(0, len(stream), 7)]
+        self.assertEqual(self.decode(chunks), expected)
+
+    def test_decode_crc_error(self):
+        bad = bytearray(wire(*VECTORS[2]))
+        bad[-1] ^= 0x01
+        good = wire(*VECTORS[1])
+        self.assertEqual(self.decode([bytes(bad) + good]), [VECTORS[1][0]])
+
+    def test_decode_resync(self):
+        first, second, third = (wire(*VECTORS[i]) for i in (0, 3, 2))
+
+        # Corrupt length followed by garbage that contains false headers.
+        bad_len = bytearray(second)
+        bad_len[2] ^= 0x40
+        garbage = (b'\x00\x00\x01\x00' + bytes(range(256))) * 4
+        stream = first + bytes(bad_len) + garbage + third
+        self.assertEqual(self.decode([stream]),
+                         [VECTORS[0][0], VECTORS[2][0]])
+
+        # Same stream split into small chunks.
+        chunks = [stream[i:i + 100] for i in range(0, len(stream), 100)]
+        self.assertEqual(self.decode(chunks), [VECTORS[0][0], VECTORS[2][0]])
+
+        # Bit flip in the data of a packet.
+        bad_crc = bytearray(second)
+        bad_crc[10] ^= 0x01
+        self.assertEqual(self.decode([first + bytes(bad_crc) + third]),
+                         [VECTORS[0][0], VECTORS[2][0]])
+
+    def test_roundtrip(self):
+        for size in range(1, MAX_MSG_LEN - FOOTER_SIZE + 1, 37):
+            data = bytes((i * 7) & 0xFF for i in range(size))
+            self.assertEqual(self.decode([self.encode(data)]), [data])
+
+    def test_batch_vectors(self):
+        for seq, msgs, data in BATCH_VECTORS:
+            self.assertEqual(encode_batch(seq, msgs), data)
+            self.assertEqual(batch_size(msgs), len(data))
+            ret_seq, ret_msgs = decode_batch(data)
+            self.assertEqual(ret_seq, seq)
+            self.assertEqual([bytes(i) for i in ret_msgs], msgs)
+
+    def test_batch_invalid(self):
+        data = BATCH_VECTORS[0][2]
+        for invalid in (data[:6], data[:-1], data + b'\x00',
+                        b'\x02' + data[1:]):
+            with self.assertRaises(ValueError):
+                decode_batch(invalid)
+
+    def test_fragment_roundtrip(self):
+        msg = bytes(range(256)) * 40
+        for spill_len in (None, 1024):
+            reassembler = Reassembler(spill_len=spill_len)
+            frags = list(encode_fragments(3, msg))
+            self.assertEqual(len(frags), -(-len(msg) // FRAG_PAYLOAD))
+            for frag in frags[:-1]:
+                self.assertIsNone(reassembler.add(frag))
+            ret = reassembler.add(frags[-1])
+            self.assertEqual(ret.spilled, spill_len is not None)
+            self.assertEqual(len(ret), len(msg))
+            self.assertEqual(ret.read(), msg)
+            self.assertEqual(b''.join(bytes(i) for i in ret.fragments(3)),
+                             b''.join(frags))
+            ret.release()
+            self.assertEqual(len(reassembler), 0)
+            self.assertEqual(reassembler.completed, 1)
+
+    def test_fragment_invalid(self):
+        msg = bytes(range(256)) * 10
+        frags = list(encode_fragments(1, msg))
+        reassembler = Reassembler(max_len=len(msg), max_pending=1)
+
+        # Missing first fragment.
+        with self.assertRaises(ValueError):
+            reassembler.add(frags[1])
+
+        # Out of order.
+        reassembler.add(frags[0])
+        with self.assertRaises(ValueError):
+            reassembler.add(frags[2])
+        self.assertEqual(reassembler.aborted, 1)
+        self.assertEqual(len(reassembler), 0)
+
+        # Too many messages in flight and message too long.
+        reassembler.add(frags[0])
+        with self.assertRaises(ValueError):
+            reassembler.add(list(encode_fragments(2, msg))[0])
+        with self.assertRaises(ValueError):
+            reassembler.add(list(encode_fragments(2, msg + b'x'))[0])
+        reassembler.clear()
+
+        # Corrupted message CRC.
+        frags = list(encode_fragments(1, msg, 0))
+        for frag in frags[:-1]:
+            reassembler.add(frag)
+        with self.assertRaises(ValueError):
+            reassembler.add(frags[-1])
+        self.assertEqual(reassembler.completed, 0)
+
+    def test_fragment_storage(self):
+        # Storage only grows with the fragments received, whatever length
+        # the first one declares.
+        frag = next(encode_fragments(5, bytes(FRAG_PAYLOAD)))
+        FRAG_HEADER.pack_into(frag, 0, TYPE_FRAGMENT, 5, 1 << 30, 0, 0)
+        for spill_len in (None, 1024):
+            reassembler = Reassembler(max_len=1 << 30, spill_len=spill_len)
+            tracemalloc.start()
+            try:
+                self.assertIsNone(reassembler.add(frag))
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+            self.assertLess(peak, 1 << 20)
+            msg = reassembler._pending[5]
+            self.assertEqual(msg.spilled, spill_len is not None)
+            if msg.spilled:
+                self.assertEqual(msg._file.seek(0, os.SEEK_END),
+                                 FRAG_PAYLOAD)
+            reassembler.clear()
+
+            # Declared length above the limit.
+            reassembler = Reassembler(max_len=(1 << 30) - 1,
+                                      spill_len=spill_len)
+            with self.assertRaises(ValueError):
+                reassembler.add(frag)
+            self.assertEqual(len(reassembler), 0)
@@ -0,0 +1,15 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Exceptions raised by the packet codec.
+"""
+
+
+class SocketSendEmptyMessage(Exception):
+    """Raised when trying to send an empty packet."""
+    pass
+
+
+class SocketSendPktInvalidLength(Exception):
+    """Raised when trying to send a packet with an invalid length."""
+    pass
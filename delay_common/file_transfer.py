@@ -0,0 +1,146 @@
+"""Bulk file transfer protocol.
+
+Files are sent over their own connection instead of the packet protocol in
+:mod:`delay_common.codec`. Each file starts with the header below followed
+by the UTF-8 file name:
+
++-----------+-------------+-----------+-----------+-----------+
+| Magic     | Name Length | File Size | Checksum  | File Name |
+| (4 bytes) | (2 bytes)   | (8 bytes) | (4 bytes) |           |
++-----------+-------------+-----------+-----------+-----------+
+
+The checksum is the CRC-32 (:py:func:`zlib.crc32`) of the file contents.
+
+When uploading, the server answers the header with the number of bytes it
+already holds from an interrupted transfer of the same file (same name,
+size and checksum) and the sender continues from that offset. When
+downloading, the file contents follow the header directly.
+"""
+import os
+import socket
+import struct
+import zlib
+
+# File header and resume offset.
+MAGIC = b'DLYF'
+HEADER = struct.Struct('! 4s H Q I')
+HEADER_SIZE = HEADER.size
+OFFSET = struct.Struct('! Q')
+
+# Size of the chunks read to compute checksums.
+_CHUNK = 1 << 20
+
+# Longest file name in bytes.
+MAX_NAME_LEN = 255
+
+
+def check_name(name: str) -> bool:
+    """Return True if name is a plain file name (no directories)."""
+    return 0 < len(name.encode('utf-8')) <= MAX_NAME_LEN and \
+        name not in ('.', '..') and os.path.basename(name) == name and \
+        '\\' not in name and '\x00' not in name
+
+
+def checksum(path: str) -> int:
+    """Return the CRC-32 of the contents of a file."""
+    crc = 0
+    buf = bytearray(_CHUNK)
+    with open(path, 'rb') as file, memoryview(buf) as view:
+        while True:
+            num_bytes = file.readinto(buf)
+            if not num_bytes:
+                return crc
+            crc = zlib.crc32(view[:num_bytes], crc)
+
+
+def encode_header(name: str, size: int, crc: int) -> bytes:
+    """Return the header and name announcing a file.
+
+    Args:
+        name (str): File name.
+        size (int): File size in bytes.
+        crc (int): CRC-32 of the file contents. See :func:`checksum`.
+
+    Raises:
+        ValueError: Invalid file name.
+    """
+    if not check_name(name):
+        raise ValueError("Invalid file name " + repr(name))
+    raw_name = name.encode('utf-8')
+    return HEADER.pack(MAGIC, len(raw_name), size, crc) + raw_name
+
+
+def _recv_exact(sock: socket.socket, num_bytes: int) -> bytes:
+    """Receive exactly num_bytes. Raises ConnectionError if closed."""
+    data = sock.recv(num_bytes, socket.MSG_WAITALL)
+    if len(data) != num_bytes:
+        raise ConnectionError("Connection closed.")
+    return data
+
+
+def send_file(sock: socket.socket, path: str, name: str = None) -> int:
+    """Upload a file, resuming an interrupted transfer if possible.
+
+    The contents are sent with :py:meth:`socket.socket.sendfile`, which
+    uses :py:func:`os.sendfile` where available.
+
+    Args:
+        sock (socket.socket): Blocking socket connected to the file channel.
+        path (str): File to send.
+        name (str): Optional; Name announced to the server. Defaults to the
+            base name of path.
+
+    Returns:
+        int: Number of bytes sent (excluding what the server already had).
+
+    Raises:
+        ValueError: Invalid file name.
+        ConnectionError: Server closed the connection.
+    """
+    if name is None:
+        name = os.path.basename(path)
+    size = os.path.getsize(path)
+    sock.sendall(encode_header(name, size, checksum(path)))
+    offset = OFFSET.unpack(_recv_exact(sock, OFFSET.size))[0]
+    if offset >= size:
+        return 0
+    with open(path, 'rb') as file:
+        return sock.sendfile(file, offset, size - offset)
+
+
+def recv_file(sock: socket.socket, directory: str) -> str:
+    """Download the next file released by the file channel.
+
+    Args:
+        sock (socket.socket): Blocking socket connected to the file channel.
+        directory (str): Directory where the file is written.
+
+    Returns:
+        str: Path of the file received.
+
+    Raises:
+        ValueError: Invalid header, or the file does not match its
+            checksum.
+        ConnectionError: Server closed the connection before the end of
+            the file.
+    """
+    magic, name_len, size, crc = \
+        HEADER.unpack(_recv_exact(sock, HEADER_SIZE))
+    name = _recv_exact(sock, name_len).decode('utf-8')
+    if magic != MAGIC or not check_name(name):
+        raise ValueError("Invalid file header.")
+    path = os.path.join(directory, name)
+    buf = bytearray(_CHUNK)
+    received = 0
+    with open(path, 'wb') as file, memoryview(buf) as view:
+        remaining = size
+        while remaining > 0:
+            num_bytes = sock.recv_into(view[:min(remaining, len(buf))])
+            if not num_bytes:
+                raise ConnectionError("Connection closed.")
+            file.write(view[:num_bytes])
+            received = zlib.crc32(view[:num_bytes], received)
+            remaining -= num_bytes
+    if received != crc:
+        raise ValueError("Checksum mismatch in " + name)
+    return path
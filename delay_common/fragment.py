@@ -0,0 +1,296 @@
+"""Fragmentation and reassembly of messages larger than a packet.
+
+Protocol version 2 splits large messages into :data:`TYPE_FRAGMENT`
+packets (see :mod:`delay_common.codec`). Fragments of a message are sent in
+order over the same connection, so the receiver appends each one to a
+buffer that grows as fragments arrive and updates the message CRC as it
+goes. The declared length is checked against a limit before anything is
+stored. Messages above a threshold are written to a temporary file instead
+of memory. A message is only handed over once every fragment arrived and the
+message CRC matched.
+"""
+import logging
+
+from delay_common.codec import crc16, CRC_INIT, FRAG_HEADER, \
+    FRAG_HEADER_SIZE, TYPE_FRAGMENT, MAX_MSG_LEN, FOOTER_SIZE
+
+# Message bytes carried by each fragment.
+FRAG_PAYLOAD = MAX_MSG_LEN - FOOTER_SIZE - FRAG_HEADER_SIZE
+
+
+def encode_fragments(msg_id: int, data, crc: int = None):
+    """Split a message into fragments.
+
+    Args:
+        msg_id (int): Message ID (32 bits). Must be unique among the
+            messages in flight on the connection.
+        data (bytes-like): Message.
+        crc (int): Optional; CRC16 of the message if already known.
+
+    Yields:
+        bytearray: Packet data of each fragment.
+
+    Raises:
+        ValueError: Message is empty or longer than 4 GiB.
+    """
+    view = memoryview(data)
+    total_len = len(view)
+    if not 0 < total_len <= 0xFFFFFFFF:
+        raise ValueError("Invalid message length " + str(total_len))
+    if crc is None:
+        crc = crc16(view)
+    msg_id &= 0xFFFFFFFF
+    for offset in range(0, total_len, FRAG_PAYLOAD):
+        part = view[offset:offset + FRAG_PAYLOAD]
+        frag = bytearray(FRAG_HEADER_SIZE + len(part))
+        FRAG_HEADER.pack_into(frag, 0, TYPE_FRAGMENT, msg_id, total_len,
+                              offset, crc)
+        frag[FRAG_HEADER_SIZE:] = part
+        yield frag
+
+
+def decode_fragment(data) -> tuple:
+    """Split the data of a fragment packet.
+
+    Args:
+        data (bytes-like): Packet data starting with the secondary header.
+
+    Returns:
+        tuple: Message ID, total length, offset, message CRC and a
+            :class:`memoryview` of the fragment data.
+
+    Raises:
+        ValueError: Data is not a well formed fragment.
+    """
+    if len(data) <= FRAG_HEADER_SIZE:
+        raise ValueError("Fragment too short.")
+    pkt_type, msg_id, total_len, offset, crc = FRAG_HEADER.unpack_from(data)
+    if pkt_type != TYPE_FRAGMENT:
+        raise ValueError("Unknown packet type " + str(pkt_type))
+    part = memoryview(data)[FRAG_HEADER_SIZE:]
+    if offset + len(part) > total_len:
+        raise ValueError("Fragment exceeds message length.")
+    return msg_id, total_len, offset, crc, part
+
+
+class LargeMessage:
+    """Message reassembled from fragments.
+
+    The message is held in a buffer that grows with each fragment, or in a
+    temporary file if it is larger than the spill threshold. Call :meth:`release` once the
+    message is no longer needed to free the buffer or delete the file.
+    """
+
+    # Protocol version needed to send the message.
+    version = 2
+
+    # Arrival time of the last fragment, if known by the receiver.
+    timestamp = None
+
+    def __init__(self, total_len: int, crc: int, spill: bool = False):
+        """Initialize an empty message.
+
+        Storage is only used as fragments are appended, so a sender cannot
+        reserve memory by declaring a large length.
+
+        Args:
+            total_len (int): Message length.
+            crc (int): Expected CRC16 of the message.
+            spill (bool): Store the message in a temporary file.
+        """
+        self._len = total_len
+        self.crc = crc
+
+        # Bytes received so far and CRC16 over them.
+        self.received = 0
+        self._crc = CRC_INIT
+
+        self._buf = None
+        self._file = None
+        if spill:
+            import tempfile  # pylint: disable=C0415
+            self._file = tempfile.TemporaryFile()
+        else:
+            self._buf = bytearray()
+
+    @property
+    def spilled(self) -> bool:
+        """True if the message is stored in a temporary file."""
+        return self._file is not None
+
+    @property
+    def complete(self) -> bool:
+        """True once every byte was received and the CRC matched."""
+        return self.received == self._len and self._crc == self.crc
+
+    def append(self, part) -> None:
+        """Append the next fragment to the message.
+
+        Args:
+            part (bytes-like): Fragment data.
+        """
+        if self._file is not None:
+            self._file.write(part)
+        else:
+            self._buf += part
+        self.received += len(part)
+        self._crc = crc16(part, self._crc)
+
+    def chunks(self, size: int = FRAG_PAYLOAD):
+        """Iterate over the message in chunks.
+
+        Args:
+            size (int): Chunk size.
+
+        Yields:
+            memoryview: Next chunk. Only valid until the next iteration.
+        """
+        if self._file is None:
+            with memoryview(self._buf) as view:
+                for offset in range(0, self._len, size):
+                    yield view[offset:offset + size]
+            return
+
+        buf = bytearray(size)
+        self._file.seek(0)
+        with memoryview(buf) as view:
+            while True:
+                num_bytes = self._file.readinto(buf)
+                if not num_bytes:
+                    break
+                yield view[:num_bytes]
+
+    def fragments(self, msg_id: int):
+        """Split the message into fragments to send it.
+
+        Args:
+            msg_id (int): Message ID. See :func:`encode_fragments`.
+
+        Yields:
+            bytearray: Packet data of each fragment.
+        """
+        if self._file is None:
+            yield from encode_fragments(msg_id, self._buf, self.crc)
+            return
+
+        msg_id &= 0xFFFFFFFF
+        offset = 0
+        for part in self.chunks():
+            frag = bytearray(FRAG_HEADER_SIZE + len(part))
+            FRAG_HEADER.pack_into(frag, 0, TYPE_FRAGMENT, msg_id, self._len,
+                                  offset, self.crc)
+            frag[FRAG_HEADER_SIZE:] = part
+            offset += len(part)
+            yield frag
+
+    def read(self) -> bytes:
+        """Return a copy of the whole message."""
+        return b''.join(bytes(part) for part in self.chunks(1 << 20))
+
+    def release(self) -> None:
+        """Free the message storage."""
+        self._buf = bytearray()
+        self._len = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __len__(self) -> int:
+        """Return message length."""
+        return self._len
+
+
+class Reassembler:
+    """Reassemble large messages received over one connection.
+
+    Fragments of a message must arrive in order. Several messages may be in
+    flight at the same time, up to a limit.
+    """
+
+    def __init__(self, max_len: int = 64 << 20, spill_len: int = 4 << 20,
+                 max_pending: int = 4, logger: logging.Logger = None):
+        """Initialize.
+
+        Args:
+            max_len (int): Largest message accepted. Checked against the
+                length declared by the first fragment.
+            spill_len (int): Messages longer than this are stored in a
+                temporary file. Use :class:`None` to keep all in memory.
+            max_pending (int): Number of incomplete messages allowed.
+            logger (logging.Logger): Logger associated with parent class.
+        """
+        self._max_len = max_len
+        self._spill_len = spill_len
+        self._max_pending = max_pending
+        self._logger = logger
+        if self._logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+
+        # Incomplete messages indexed by message ID.
+        self._pending = {}
+
+        # Counters.
+        self.completed = 0
+        self.aborted = 0
+
+    def __len__(self) -> int:
+        """Return number of incomplete messages."""
+        return len(self._pending)
+
+    def add(self, data) -> LargeMessage:
+        """Add a fragment.
+
+        Args:
+            data (bytes-like): Packet data of the fragment.
+
+        Returns:
+            LargeMessage: The message if this was its last fragment,
+                otherwise :class:`None`. The caller owns the message and
+                must release it when done.
+
+        Raises:
+            ValueError: Invalid fragment. The message it belongs to is
+                discarded.
+        """
+        msg_id, total_len, offset, crc, part = decode_fragment(data)
+
+        msg = self._pending.get(msg_id)
+        if msg is None:
+            if offset != 0:
+                raise ValueError("Missing start of message " + str(msg_id))
+            if total_len > self._max_len:
+                raise ValueError("Message too long " + str(total_len))
+            if len(self._pending) >= self._max_pending:
+                raise ValueError("Too many incomplete messages.")
+            spill = self._spill_len is not None and \
+                total_len > self._spill_len
+            msg = LargeMessage(total_len, crc, spill)
+            self._pending[msg_id] = msg
+        elif offset != msg.received or total_len != len(msg) or \
+                crc != msg.crc:
+            self._abort(msg_id)
+            raise ValueError("Fragment out of order for message " +
+                             str(msg_id))
+
+        msg.append(part)
+        if msg.received < total_len:
+            return None
+
+        del self._pending[msg_id]
+        if not msg.complete:
+            msg.release()
+            self.aborted += 1
+            raise ValueError("CRC error in message " + str(msg_id))
+        self.completed += 1
+        return msg
+
+    def clear(self) -> None:
+        """Discard all incomplete messages."""
+        for msg_id in list(self._pending):
+            self._abort(msg_id)
+
+    def _abort(self, msg_id: int) -> None:
+        """Discard an incomplete message."""
+        self._pending.pop(msg_id).release()
+        self.aborted += 1
+        self._logger.debug('Discarded incomplete message %d.', msg_id)
@@ -1,50 +1,166 @@
-""" Main application """
+""" Main application
 
-import struct
-import time
-import random
-import socket
-import os
+Usage: ``python delay_server [--headless | --gui] [--demo]``
+
+Starts a proxy for every link in ``config.ini`` and runs until interrupted
+(SIGINT or SIGTERM).
+
+- ``--headless``: Do not start the GUI, even if enabled in the config.
+- ``--gui``: Start the GUI, even if disabled in the config.
+- ``--demo``: Send test traffic through the MCC link, then exit.
+
+Only the modules needed by the chosen mode are imported: the GUI, shared
+memory statistics, file channel, capture, config reload and allocation
+profiler are imported when they are enabled, so that a headless server
+listens on its ports as soon as possible after a restart.
+"""
+
+import contextlib
 import logging
+import signal
+import sys
+import threading
+import time
 
 # pylint: disable=E0401
-from delay_server.delay.delay import CommDelay
+from delay_server.delay.delay import CommDelay, DelaySchedule
 from delay_server.util.queue import DelayQueue
 from delay_server.delay.config import DelayConfig
-from delay_server.util.crc16 import CRC16
 from delay_server.delay.proxy import DelayProxy
+from delay_server.util.conn_filter import ConnectionFilter
+from delay_server.util.gc_monitor import GcMonitor, enable_hot_path
 
+# pylint: disable=C0415
 
-def test_client():
-    """Test client."""
-    client_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    client_sock.connect(('', 1001))
 
+def start_gui(stack: contextlib.ExitStack, config, proxies: dict) -> None:
+    """Publish the statistics and logs to shared memory and start the GUI
+    process."""
+    from delay_server.gui.server_app import start_gui as start_gui_process
+    from delay_server.util.shared_stats import SharedStats, StatsPublisher
+    from delay_server.util.log_ring import LogRing
+    from delay_server.util.log_handler import LogRingHandler
 
-if __name__ == "__main__":
+    stats = SharedStats(links=tuple(proxies), create=True)
+    stack.callback(stats.close)
+    log_ring = LogRing(slots=config.gui.log_slots, create=True)
+    stack.callback(log_ring.close)
+    log_handler = LogRingHandler(log_ring)
+    log_handler.setFormatter(logging.Formatter('%(asctime)s: %(message)s'))
+    logging.getLogger().addHandler(log_handler)
+    stack.callback(logging.getLogger().removeHandler, log_handler)
+    publisher = StatsPublisher(stats, proxies, config.gui.stats_interval)
+    publisher.start()
+    stack.callback(publisher.stop)
+    gui = start_gui_process(stats.name, log_ring.name,
+                            1 / config.gui.refresh_rate)
+    stack.callback(gui.join)
+    stack.callback(gui.terminate)
 
-    logging.basicConfig(format='%(asctime)s:%(name)s:%(levelname)s:%(message)s', \
-        filemode='w', level=logging.DEBUG, filename='DelayServer2.log')
-    logging.info('Created logger')
-    delay = CommDelay().set_override(1)
-    config = DelayConfig()
-
-    # queue = DelayQueue()
-    # consumer = ConsumerThread(1000, queue)
-    # consumer.start_thread()
-    # producer = ProducerThread(1001, queue)
-    # producer.start_thread()
-    
-    p_port = config.getint('mcc', 'port_recv')
-    c_port = config.getint('mcc', 'port_send')
-    
-    proxy = DelayProxy('mcc')
-    proxy.start_proxy(p_port, c_port)
-    time.sleep(1)
 
+def start_server(stack: contextlib.ExitStack, config,
+                 gui: bool) -> dict:
+    """Start the proxies and the optional services.
+
+    Each service registers its shutdown on the stack.
+
+    Returns:
+        dict: Proxy of each link.
+    """
+    delay = CommDelay()
+    delay.set_schedule(DelaySchedule(config.delay_schedule))
+    delay.set_start_time(config.mission.start_time)
+
+    conn_filter = ConnectionFilter(config.allow, config.reject)
+    stack.callback(lambda: logging.info('Connection filter stats %s',
+                                        conn_filter.stats()))
+
+    capture = None
+    if config.capture.enabled:
+        from delay_server.util.capture import CaptureWriter
+        capture = CaptureWriter(config.capture.path)
+        stack.callback(capture.close)
+
+    proxies = {}
+    for link in config.links:
+        queue = DelayQueue(logging.getLogger(link.name),
+                           max_bytes=config.queue.max_bytes,
+                           max_msgs=config.queue.max_msgs,
+                           high_water=config.queue.high_water,
+                           low_water=config.queue.low_water,
+                           policy=config.queue.policy)
+        proxy = DelayProxy(link.name, queue,
+                           config.proxy.passthrough,
+                           config.proxy.reverify_egress,
+                           capture,
+                           config.proxy.kernel_timestamps,
+                           config.proxy.release_precision,
+                           config.proxy.producer_cpus,
+                           config.proxy.consumer_cpus,
+                           config.proxy.sched_policy,
+                           config.proxy.sched_priority,
+                           conn_filter,
+                           config.proxy.max_message_len)
+        proxy.start_proxy(link.port_recv, link.port_send)
+        stack.callback(proxy.stop_proxy)
+        stack.callback(lambda name=link.name, proxy=proxy: logging.info(
+            '%s queue stats %s', name, proxy.get_queue_stats()))
+        proxies[link.name] = proxy
+
+    if config.files.enabled:
+        from delay_server.delay.file_channel import FileChannel
+        files = FileChannel('files', config.files.spool_dir,
+                            conn_filter=conn_filter)
+        files.start_channel(config.files.port_recv, config.files.port_send)
+        stack.callback(files.stop_channel)
+        stack.callback(lambda: logging.info('File channel stats %s',
+                                            files.stats()))
+
+    if config.reload.enabled:
+        from delay_server.delay.config_watcher import ConfigWatcher
+        watcher = ConfigWatcher(interval=config.reload.interval)
+        watcher.add_listener(lambda new: conn_filter.update(new.allow,
+                                                            new.reject))
+        watcher.start()
+        stack.callback(watcher.stop)
+
+    if gui:
+        start_gui(stack, config, proxies)
+
+    gc_monitor = GcMonitor(config.gc.warn_pause)
+    gc_monitor.start()
+    stack.callback(gc_monitor.stop)
+    stack.callback(lambda: logging.info('GC stats %s', gc_monitor.stats()))
+    if config.gc.hot_path:
+        enable_hot_path(config.gc.thresholds)
+    if config.gc.profile_allocations:
+        from delay_server.util.gc_monitor import AllocationProfiler
+
+        def received():
+            return sum(proxy.get_received_count()
+                       for proxy in proxies.values())
+        profiler = AllocationProfiler()
+        profiler.start(received())
+        stack.callback(profiler.stop)
+        stack.callback(lambda: profiler.report(received()))
+        if hasattr(signal, 'SIGUSR1'):
+            signal.signal(signal.SIGUSR1,
+                          lambda signum, frame: profiler.report(received()))
+    return proxies
+
+
+def send_demo_traffic(port: int) -> None:
+    """Send random packets to a port."""
+    import os
+    import random
+    import socket
+    import struct
+    from delay_server.util.crc16 import CRC16
+
+    clock = CommDelay().clock
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect(('127.0.0.1', p_port))
-    time.sleep(0.1)
+    sock.connect(('127.0.0.1', port))
+    clock.sleep(0.1)
     print("Send packet_data")
     i = 0
     while i < 10000:
@@ -53,20 +169,58 @@ if __name__ == "__main__":
         crc = CRC16.calc_crc(packed_data)
         data = os.urandom(num_bytes - 2)
         crc = CRC16.calc_crc(data, crc)
-#        if random.randint(1, 100) < 1:
-#            crc += 1
         values = (num_bytes, data, crc)
         packer = struct.Struct('! I ' + str(num_bytes-2) + 's H')
-
-        #print("Send " + str(values))
         packed_data = packer.pack(*values)
         sock.sendall(packed_data)
         if random.randint(1, 10000) < 2:
-            time.sleep(0.00001)
+            clock.sleep(0.00001)
         i += 1
     print("End of packet_data")
     sock.close()
 
-    time.sleep(10)
-    proxy.stop_proxy()
-    time.sleep(2)
+
+def main(argv: list) -> int:
+    """Run the server. Returns the exit status."""
+    start = time.perf_counter()
+    options = set(argv[1:])
+    unknown = options - {'--headless', '--gui', '--demo'}
+    if unknown or {'--headless', '--gui'} <= options:
+        print(__doc__.strip().splitlines()[2], file=sys.stderr)
+        return 2
+
+    logging.basicConfig(format='%(asctime)s:%(name)s:%(levelname)s:%(message)s', \
+        filemode='w', level=logging.DEBUG, filename='DelayServer2.log')
+    logging.info('Created logger')
+    config = DelayConfig().snapshot
+    gui = config.gui.enabled
+    if '--headless' in options:
+        gui = False
+    elif '--gui' in options:
+        gui = True
+
+    # Stop cleanly on SIGTERM as well as on Ctrl+C.
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+
+    with contextlib.ExitStack() as stack:
+        start_server(stack, config, gui)
+        logging.info('Started %d links in %.1f ms.', len(config.links),
+                     (time.perf_counter() - start) * 1e3)
+        if '--demo' in options:
+            CommDelay().set_override(1)
+            CommDelay().clock.sleep(1)
+            send_demo_traffic(config.link('mcc').port_recv)
+            CommDelay().clock.sleep(10)
+            return 0
+        try:
+            while not stop.wait(1):
+                pass
+        except KeyboardInterrupt:
+            pass
+        logging.info('Stopping.')
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,4 @@
+"""Benchmarks for the Delay Server.
+
+Run from the ``delay_server`` folder, e.g. ``python -m benchmark.bench_recv``.
+"""
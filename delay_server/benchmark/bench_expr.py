@@ -0,0 +1,66 @@
+"""Benchmark compiling dynamic delays with the ast compiler and with sympy.
+
+Each method runs in a fresh interpreter, so the time includes importing
+everything it needs. Reports the time to compile the sample schedule, the
+growth of the peak resident set size and the cost of evaluating a delay.
+
+Usage: ``python -m benchmark.bench_expr [evaluations]``
+
+Sympy must be importable for its row, for example by adding it to
+``PYTHONPATH``.
+"""
+import resource
+import subprocess
+import sys
+import time
+
+# Sample [dynamic_delay] expressions.
+EXPRESSIONS = ('0', '(t - 100) + 0.1', '300 + 60 * sin(2 * pi * t / 86400)',
+               'min(1200, 0.01 * t^2)', 'exp(t / 3600) - 1')
+
+
+def child(method: str, evaluations: int) -> None:
+    """Compile and evaluate the expressions, then print the results."""
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    # pylint: disable=C0415,E0401
+    if method == 'ast':
+        from delay_server.util.expression import compile_expression
+        funcs = [compile_expression(text) for text in EXPRESSIONS]
+    else:
+        from delay_server.util.expression import compile_sympy
+        funcs = [compile_sympy(text) for text in EXPRESSIONS]
+    compile_time = time.perf_counter() - start
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+
+    start = time.perf_counter()
+    for i in range(evaluations):
+        for func in funcs:
+            func(float(i))
+    eval_time = time.perf_counter() - start
+    print(compile_time, rss, eval_time / (evaluations * len(funcs)))
+
+
+def main(argv: list) -> None:
+    """Run the benchmark and print the results."""
+    evaluations = int(argv[1]) if len(argv) > 1 else 100000
+    print(f"{len(EXPRESSIONS)} expressions, {evaluations} evaluations each.")
+    print(f"{'method':>8} {'compile ms':>11} {'RSS MB':>8} {'ns/eval':>9}")
+    for method in ('ast', 'sympy'):
+        result = subprocess.run(
+            [sys.executable, '-m', 'benchmark.bench_expr', '--child', method,
+             str(evaluations)], capture_output=True, text=True, check=False)
+        if result.returncode:
+            print(f"{method:>8} failed: "
+                  f"{result.stderr.strip().splitlines()[-1]}")
+            continue
+        compile_time, rss, eval_time = result.stdout.split()
+        print(f"{method:>8} {float(compile_time) * 1e3:11.1f} "
+              f"{int(rss) / 1024:8.1f} {float(eval_time) * 1e9:9.0f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main(sys.argv)
@@ -0,0 +1,68 @@
+"""Benchmark the connection filter against a linear scan of the rules.
+
+Builds deny rules for random /24 and /16 networks plus a few allow rules,
+then checks random client addresses with
+:class:`delay_server.util.conn_filter.ConnectionFilter` and with a loop
+over :py:mod:`ipaddress` networks, as a naive filter would.
+
+Usage: ``python -m benchmark.bench_filter [num_rules] [num_checks]``
+"""
+import ipaddress
+import random
+import sys
+import time
+
+# pylint: disable=E0401
+from delay_server.util.conn_filter import ConnectionFilter, parse_pattern
+
+
+def _random_ip() -> str:
+    """Return a random IPv4 address."""
+    return str(ipaddress.IPv4Address(random.getrandbits(32)))
+
+
+def linear(rules: list, host: str) -> bool:
+    """Return True if no deny rule, or a more specific allow rule, matches."""
+    address = ipaddress.ip_address(host)
+    best = None
+    for action, network in rules:
+        if address in network and \
+                (best is None or network.prefixlen >= best[1].prefixlen):
+            best = (action, network)
+    return best is None or best[0] == 'allow'
+
+
+def main(argv: list) -> None:
+    """Run the benchmark and print the results."""
+    num_rules = int(argv[1]) if len(argv) > 1 else 1000
+    num_checks = int(argv[2]) if len(argv) > 2 else 20000
+    random.seed(1)
+
+    deny = []
+    for i in range(num_rules):
+        octets = _random_ip().split('.')
+        deny.append('.'.join(octets[:3]) + '.*' if i % 2
+                    else '.'.join(octets[:2]) + '.*.*')
+    allow = [pattern.replace('*', '1') for pattern in deny[:10]]
+    hosts = [_random_ip() for _ in range(num_checks)]
+
+    start = time.perf_counter()
+    conn_filter = ConnectionFilter(allow, deny)
+    compile_time = time.perf_counter() - start
+
+    rules = [('allow', parse_pattern(p)) for p in allow] + \
+            [('deny', parse_pattern(p)) for p in deny]
+
+    print(f"{len(allow)} allow, {len(deny)} deny rules, compiled in "
+          f"{compile_time * 1e3:.1f} ms. {num_checks} checks.")
+    print(f"{'method':>8} {'us/check':>9} {'rejected':>9}")
+    for name, check in (('trie', conn_filter.allowed),
+                        ('linear', lambda host: linear(rules, host))):
+        start = time.perf_counter()
+        rejected = sum(1 for host in hosts if not check(host))
+        elapsed = time.perf_counter() - start
+        print(f"{name:>8} {elapsed / num_checks * 1e6:9.2f} {rejected:9d}")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
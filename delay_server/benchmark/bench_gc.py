@@ -0,0 +1,62 @@
+"""Benchmark garbage collection pauses with and without hot path mode.
+
+Fills a :class:`DelayQueue` with pooled frames, as during a long delay,
+while :class:`delay_server.util.gc_monitor.GcMonitor` records every
+collection. The collector only runs while the number of live objects grows,
+so a queue that holds a steady number of frames does not trigger it.
+
+Usage: ``python -m benchmark.bench_gc [frames]``
+"""
+import gc
+import sys
+import time
+
+# pylint: disable=E0401
+from delay_server.util.buffer_pool import BufferPool
+from delay_server.util.gc_monitor import GcMonitor, enable_hot_path, \
+    disable_hot_path
+from delay_server.util.queue import DelayQueue
+
+
+def run(hot_path: bool, frames: int) -> tuple:
+    """Push frames into a queue.
+
+    Returns:
+        tuple: GC statistics and frames per second.
+    """
+    pool = BufferPool(64, frames)
+    queue = DelayQueue()
+
+    previous = None
+    if hot_path:
+        previous = enable_hot_path()
+    monitor = GcMonitor(warn_pause=None)
+    monitor.start()
+    start = time.perf_counter()
+    for _ in range(frames):
+        queue.push(pool.acquire())
+    elapsed = time.perf_counter() - start
+    monitor.stop()
+    if previous is not None:
+        disable_hot_path(previous)
+    queue.clear()
+    return monitor.stats(), frames / elapsed
+
+
+def main(argv: list) -> None:
+    """Run the benchmark and print the results."""
+    frames = int(argv[1]) if len(argv) > 1 else 1000000
+    print(f"{frames} frames queued.")
+    print(f"{'hot path':>8} {'gen0':>6} {'gen1':>6} {'gen2':>6}"
+          f" {'total ms':>9} {'max ms':>8} {'frames/s':>10}")
+    for hot_path in (False, True):
+        gc.collect()
+        stats, rate = run(hot_path, frames)
+        print(f"{str(hot_path):>8} "
+              f"{' '.join(f'{n:6d}' for n in stats['collections'])} "
+              f"{sum(stats['pause_total']) * 1e3:9.1f} "
+              f"{max(stats['pause_max']) * 1e3:8.2f} {rate:10.0f}")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
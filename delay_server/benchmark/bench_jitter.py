@@ -0,0 +1,75 @@
+"""Benchmark release jitter for each precision level.
+
+Waits for a series of deadlines with
+:class:`delay_server.util.deadline.DeadlineWaiter` and reports how late
+each wait returned, along with the CPU time the waiting thread used.
+Background threads compete for the interpreter to emulate a loaded server.
+
+Usage: ``python -m benchmark.bench_jitter [num_waits] [load_threads]``
+"""
+import random
+import statistics
+import sys
+import threading
+import time
+
+# pylint: disable=E0401
+from delay_server.util.deadline import DeadlineWaiter
+
+
+def _busy(stop: threading.Event) -> None:
+    """Keep the interpreter busy."""
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def run(precision: str, num_waits: int) -> tuple:
+    """Wait for num_waits deadlines between 1 and 20 ms away.
+
+    Returns:
+        tuple: Lateness (in sec) of each wait, CPU time (in sec) used by the
+            waiting thread and the waiter.
+    """
+    waiter = DeadlineWaiter(precision=precision)
+    rand = random.Random(1)
+    late = []
+    cpu_start = time.thread_time()
+    for _ in range(num_waits):
+        deadline = time.monotonic() + rand.uniform(0.001, 0.02)
+        while not waiter.wait(deadline):
+            pass
+        late.append(time.monotonic() - deadline)
+    return late, time.thread_time() - cpu_start, waiter
+
+
+def main(argv: list) -> None:
+    """Run the benchmark and print the results."""
+    num_waits = int(argv[1]) if len(argv) > 1 else 500
+    load = int(argv[2]) if len(argv) > 2 else 0
+
+    stop = threading.Event()
+    threads = [threading.Thread(target=_busy, args=(stop,))
+               for _ in range(load)]
+    for thread in threads:
+        thread.start()
+
+    print(f"{num_waits} waits, {load} load threads. Lateness in us:")
+    print(f"{'precision':>9} {'mean':>8} {'p50':>8} {'p99':>8} {'max':>8}"
+          f" {'cpu ms':>8} {'spin ms':>8} {'budget':>8}")
+    for precision in DeadlineWaiter.PRECISIONS:
+        late, cpu, waiter = run(precision, num_waits)
+        late.sort()
+        p99 = late[min(len(late) - 1, int(len(late) * 0.99))]
+        print(f"{precision:>9} {statistics.mean(late) * 1e6:8.1f} "
+              f"{statistics.median(late) * 1e6:8.1f} {p99 * 1e6:8.1f} "
+              f"{late[-1] * 1e6:8.1f} {cpu * 1e3:8.1f} "
+              f"{waiter.spin_time * 1e3:8.1f} "
+              f"{waiter.spin_budget * 1e6:8.1f}")
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
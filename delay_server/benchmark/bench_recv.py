@@ -0,0 +1,122 @@
+"""Benchmark memory allocated per received frame.
+
+Compares the legacy receive path, which copies the frame into several
+intermediate :class:`bytes` objects, against
+:meth:`DelayServerSocket._recv_packets` which decodes the stream into
+pooled buffers.
+
+Usage: ``python -m benchmark.bench_recv [num_frames] [frame_size]``
+"""
+import os
+import socket
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+
+# pylint: disable=E0401
+from delay_server.delay.socket import DelayServerSocket
+from delay_server.util.crc16 import CRC16
+
+
+def legacy_recv_packet(sock: socket.socket) -> list:
+    """Receive path prior to pooled buffers. Kept as a reference."""
+    raw_hdr = sock.recv(DelayServerSocket.HEADER_SIZE)
+    msg_size = int(struct.unpack('! I', raw_hdr)[0])
+    raw_data = sock.recv(msg_size)
+    struct_def = '! ' + str(msg_size - DelayServerSocket.FOOTER_SIZE) + 's H'
+    msg_data = struct.unpack(struct_def, raw_data)
+    calc_crc = CRC16.calc_crc(raw_hdr)
+    calc_crc = CRC16.calc_crc(msg_data[0], calc_crc)
+    if calc_crc != msg_data[1]:
+        return []
+    return [bytearray(raw_data[:-2])]
+
+
+def pooled_recv_packet(server: DelayServerSocket, sock: socket.socket):
+    """Receive into pooled buffers and release them immediately."""
+    bufs = server._recv_packets(sock)
+    for buf in bufs:
+        buf.release()
+    return bufs
+
+
+def _writer(sock: socket.socket, frame: bytes, num_frames: int) -> None:
+    """Send the same frame repeatedly."""
+    for _ in range(num_frames):
+        sock.sendall(frame)
+
+
+def run(recv, num_frames: int, frame_size: int) -> dict:
+    """Receive num_frames and measure the memory allocated per frame.
+
+    Args:
+        recv (callable): Function that receives a list of frames from a
+            socket.
+        num_frames (int): Number of frames to receive.
+        frame_size (int): Data bytes per frame.
+
+    Returns:
+        dict: Peak bytes allocated per frame, bytes retained per frame and
+            frames received per second.
+    """
+    server = DelayServerSocket()
+    sock_send, sock_recv = socket.socketpair()
+    data = os.urandom(frame_size)
+    frame = server._encoder.encode_bytes(data)
+
+    writer = threading.Thread(target=_writer,
+                              args=(sock_send, bytes(frame), num_frames),
+                              daemon=True)
+    writer.start()
+
+    # Warm up pools and caches before measuring.
+    received = len(recv(sock_recv))
+    measured = num_frames - received
+
+    tracemalloc.start()
+    peak = 0
+    start_mem, _ = tracemalloc.get_traced_memory()
+    start_time = time.perf_counter()
+    while received < num_frames:
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        received += len(recv(sock_recv))
+        _, frame_peak = tracemalloc.get_traced_memory()
+        peak += frame_peak - base
+    elapsed = time.perf_counter() - start_time
+    end_mem, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    writer.join()
+    sock_send.close()
+    sock_recv.close()
+    server._sock.close()
+    return dict(peak_per_frame=peak / measured,
+                retained_per_frame=(end_mem - start_mem) / measured,
+                frames_per_sec=measured / elapsed)
+
+
+def main(argv: list) -> None:
+    """Run the benchmark for both receive paths and print the results."""
+    num_frames = int(argv[1]) if len(argv) > 1 else 10000
+    frame_size = int(argv[2]) if len(argv) > 2 else 512
+    server = DelayServerSocket()
+    results = {
+        'legacy': run(legacy_recv_packet, num_frames, frame_size),
+        'pooled': run(lambda sock: pooled_recv_packet(server, sock),
+                      num_frames, frame_size),
+    }
+    server._sock.close()
+    print(f"{num_frames} frames x {frame_size} bytes")
+    print(f"{'path':8} {'peak B/frame':>14} {'retained B/frame':>18}"
+          f" {'frames/s':>10}")
+    for name, res in results.items():
+        print(f"{name:8} {res['peak_per_frame']:14.1f}"
+              f" {res['retained_per_frame']:18.2f}"
+              f" {res['frames_per_sec']:10.0f}")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,123 @@
+"""Benchmark the release error of each release precision, with and without
+kernel timestamps.
+
+Frames carrying their send time go through a :class:`DelayProxy`, which
+releases them with its own consumer thread. The release error is the time a
+frame reaches the receiver minus its send time and the configured delay.
+Background threads compete for the interpreter to emulate a loaded server.
+
+Usage: ``python -m benchmark.bench_release [num_frames] [load_threads]``
+"""
+import socket
+import statistics
+import struct
+import sys
+import threading
+import time
+
+# pylint: disable=E0401
+from delay_server.delay.delay import CommDelay
+from delay_server.delay.proxy import DelayProxy
+from delay_server.delay.socket import DelayServerSocket
+from delay_server.util.deadline import DeadlineWaiter
+from delay_common.codec import FrameDecoder, FrameEncoder
+
+DELAY = 0.05
+INTERVAL = 0.002
+STAMP = struct.Struct('! q')
+
+
+def _busy(stop: threading.Event) -> None:
+    """Keep the interpreter busy."""
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def run(precision: str, kernel_timestamps: bool, num_frames: int,
+        load: int) -> dict:
+    """Send num_frames through a delayed link and measure release errors.
+
+    Returns:
+        dict: Release errors (sec) seen by the receiver and queue stats.
+    """
+    CommDelay().set_override(DELAY)
+    proxy = DelayProxy('bench', kernel_timestamps=kernel_timestamps,
+                       release_precision=precision)
+    proxy.start_proxy(0, 0)
+    stop = threading.Event()
+    threads = [threading.Thread(target=_busy, args=(stop,))
+               for _ in range(load)]
+    for thread in threads:
+        thread.start()
+
+    port = proxy._consumer_sock._sock.getsockname()[1]
+    receiver = socket.create_connection(('127.0.0.1', port))
+    port = proxy._producer_sock._sock.getsockname()[1]
+    sender = socket.create_connection(('127.0.0.1', port))
+    time.sleep(0.1)
+
+    errors = []
+
+    def receive():
+        decoder = FrameDecoder()
+        while len(errors) < num_frames:
+            data = receiver.recv(65536)
+            now = time.monotonic_ns()
+            if not data:
+                break
+            for frame in decoder.feed(data):
+                sent = STAMP.unpack(frame)[0]
+                errors.append((now - sent) / 1e9 - DELAY)
+
+    recv_thread = threading.Thread(target=receive)
+    recv_thread.start()
+    encoder = FrameEncoder()
+    for _ in range(num_frames):
+        sender.sendall(encoder.encode_bytes(STAMP.pack(time.monotonic_ns())))
+        time.sleep(INTERVAL)
+    recv_thread.join(DELAY + 5)
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    stats = proxy.get_queue_stats()
+    sender.close()
+    receiver.close()
+    proxy.stop_proxy()
+    CommDelay().set_override(None)
+    return dict(errors=errors, stats=stats)
+
+
+def _ms(value: float) -> str:
+    """Format seconds as milliseconds."""
+    return f"{value * 1e3:8.3f}"
+
+
+def main(argv: list) -> None:
+    """Run the benchmark and print the results."""
+    num_frames = int(argv[1]) if len(argv) > 1 else 2000
+    load = int(argv[2]) if len(argv) > 2 else 2
+    modes = [False]
+    if DelayServerSocket.KERNEL_TIMESTAMPS:
+        modes.append(True)
+    print(f"{num_frames} frames, delay {DELAY * 1e3:.0f} ms, "
+          f"{load} load threads. Release error in ms:")
+    print(f"{'precision':>9} {'kernel':>7} {'mean':>8} {'p50':>8} {'p99':>8}"
+          f" {'max':>8} {'queue lag':>10}")
+    for precision in DeadlineWaiter.PRECISIONS:
+        for mode in modes:
+            ret = run(precision, mode, num_frames, load)
+            errors = sorted(ret['errors'])
+            if not errors:
+                print(f"{precision:>9} {str(mode):>7} no frames received")
+                continue
+            p99 = errors[min(len(errors) - 1, int(len(errors) * 0.99))]
+            print(f"{precision:>9} {str(mode):>7} "
+                  f"{_ms(statistics.mean(errors))} "
+                  f"{_ms(statistics.median(errors))} {_ms(p99)} "
+                  f"{_ms(errors[-1])} "
+                  f"{_ms(ret['stats']['ingress_lag_mean'])}")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
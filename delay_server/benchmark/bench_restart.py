@@ -0,0 +1,101 @@
+"""Benchmark stopping and restarting a proxy.
+
+Starts a :class:`delay_server.delay.proxy.DelayProxy` on free ports,
+connects clients to both ports and then times :meth:`stop_proxy` and
+:meth:`start_proxy` on the same ports. Also checks that every client sees
+its connection closed and counts the open file descriptors, so that leaks
+across restarts show up.
+
+Usage: ``python -m benchmark.bench_restart [cycles] [clients]``
+"""
+import os
+import socket
+import statistics
+import sys
+import time
+
+# pylint: disable=E0401
+from delay_server.delay.delay import CommDelay
+from delay_server.delay.proxy import DelayProxy
+
+
+def _free_ports(count: int) -> list:
+    """Return ports that are free at the moment."""
+    socks = [socket.socket() for _ in range(count)]
+    for sock in socks:
+        sock.bind(('127.0.0.1', 0))
+    ports = [sock.getsockname()[1] for sock in socks]
+    for sock in socks:
+        sock.close()
+    return ports
+
+
+def _open_fds() -> int:
+    """Return the number of open file descriptors (Linux only)."""
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return -1
+
+
+def _connect(ports: list, clients: int) -> list:
+    """Connect clients, alternating between the ports."""
+    return [socket.create_connection(('127.0.0.1', ports[i % len(ports)]),
+                                     1)
+            for i in range(clients)]
+
+
+def _closed(sock: socket.socket) -> bool:
+    """Return True if the server closed the connection."""
+    try:
+        while True:
+            if not sock.recv(65536):
+                return True
+    except socket.timeout:
+        return False
+    except OSError:
+        return True
+
+
+def main(argv: list) -> None:
+    """Run the benchmark and print the results."""
+    cycles = int(argv[1]) if len(argv) > 1 else 20
+    clients = int(argv[2]) if len(argv) > 2 else 4
+    CommDelay().set_override(0)
+    ports = _free_ports(2)
+    proxy = DelayProxy('bench')
+
+    stop_times = []
+    start_times = []
+    not_closed = 0
+    fds = []
+    proxy.start_proxy(*ports)
+    for _ in range(cycles):
+        socks = _connect(ports, clients)
+        # Let both threads accept the connections.
+        time.sleep(0.05)
+
+        start = time.perf_counter()
+        proxy.stop_proxy()
+        stop_times.append(time.perf_counter() - start)
+        not_closed += sum(1 for sock in socks if not _closed(sock))
+        for sock in socks:
+            sock.close()
+
+        start = time.perf_counter()
+        proxy.start_proxy(*ports)
+        start_times.append(time.perf_counter() - start)
+        fds.append(_open_fds())
+    proxy.stop_proxy()
+
+    print(f"{cycles} cycles, {clients} clients connected at each stop.")
+    for name, times in (('stop', stop_times), ('start', start_times)):
+        print(f"{name:>6}: median {statistics.median(times) * 1e3:.2f} ms, "
+              f"max {max(times) * 1e3:.2f} ms")
+    print(f"Connections left open after stop: {not_closed}")
+    print(f"Open file descriptors after each start: {min(fds)} to "
+          f"{max(fds)}")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,153 @@
+"""Benchmark server startup: time until every port accepts connections.
+
+Starts ``python delay_server --headless`` in a temporary directory with a
+copy of ``config.ini`` that uses free ports, and connects to each port
+until all of them accept. The server is then stopped with SIGTERM. A final
+run with ``-X importtime`` lists the modules that take longest to import.
+
+Bytecode is cached in a temporary directory (``PYTHONPYCACHEPREFIX``) and
+a first, untimed run fills it, as the ``__pycache__`` directories would on
+a deployed server. Pass ``--no-cache`` to compile every module on every
+run instead.
+
+Usage: ``python -m benchmark.bench_startup [runs] [--gui] [--no-cache]``
+"""
+import os
+import re
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Directory holding __main__.py and config.ini.
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Options holding ports in config.ini.
+PORT_OPTIONS = ('mcc_port_recv', 'mcc_port_send', 'hab_port_recv',
+                'hab_port_send')
+
+
+def _free_ports(count: int) -> list:
+    """Return ports that are free at the moment."""
+    socks = [socket.socket() for _ in range(count)]
+    for sock in socks:
+        sock.bind(('127.0.0.1', 0))
+    ports = [sock.getsockname()[1] for sock in socks]
+    for sock in socks:
+        sock.close()
+    return ports
+
+
+def _write_config(directory: str) -> list:
+    """Copy config.ini with free ports. Returns the ports."""
+    ports = _free_ports(len(PORT_OPTIONS))
+    with open(os.path.join(SERVER_DIR, 'config.ini')) as file:
+        text = file.read()
+    for option, port in zip(PORT_OPTIONS, ports):
+        text = re.sub(r'^' + option + r'\s*=.*$', f'{option} = {port}',
+                      text, flags=re.M)
+    with open(os.path.join(directory, 'config.ini'), 'w') as file:
+        file.write(text)
+    return ports
+
+
+def _listening(port: int) -> bool:
+    """Return True if the port accepts connections."""
+    try:
+        socket.create_connection(('127.0.0.1', port), 0.1).close()
+    except OSError:
+        return False
+    return True
+
+
+def run(mode: str, env: dict, importtime: bool = False) -> tuple:
+    """Start the server and wait until it listens on every port.
+
+    Args:
+        mode (str): ``--headless`` or ``--gui``.
+        env (dict): Environment of the server.
+        importtime (bool): Run with ``-X importtime``.
+
+    Returns:
+        tuple: Time (in sec) until every port accepts connections and the
+            stderr output of the server.
+    """
+    directory = tempfile.mkdtemp()
+    try:
+        ports = _write_config(directory)
+        args = [sys.executable]
+        if importtime:
+            args += ['-X', 'importtime']
+        args += [SERVER_DIR, mode]
+
+        start = time.perf_counter()
+        proc = subprocess.Popen(args, cwd=directory, env=env,
+                                stderr=subprocess.PIPE, text=True)
+        pending = list(ports)
+        while pending and proc.poll() is None:
+            pending = [port for port in pending if not _listening(port)]
+            if pending:
+                time.sleep(0.001)
+        elapsed = time.perf_counter() - start
+
+        proc.send_signal(signal.SIGTERM)
+        _, stderr = proc.communicate(timeout=30)
+        if pending:
+            raise RuntimeError("Server exited before listening:\n" + stderr)
+        return elapsed, stderr
+    finally:
+        shutil.rmtree(directory)
+
+
+def top_imports(stderr: str, limit: int = 15) -> list:
+    """Return the slowest top-level imports from -X importtime output.
+
+    Returns:
+        list: Tuples with the cumulative time (in sec) and module name.
+    """
+    ret = []
+    for line in stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \|( *)(\S+)', line)
+        if match and len(match.group(2)) == 1:
+            ret.append((int(match.group(1)) / 1e6, match.group(3)))
+    return sorted(ret, reverse=True)[:limit]
+
+
+def main(argv: list) -> None:
+    """Run the benchmark and print the results."""
+    mode = '--gui' if '--gui' in argv else '--headless'
+    cache = '--no-cache' not in argv
+    argv = [arg for arg in argv if arg not in ('--gui', '--no-cache')]
+    runs = int(argv[1]) if len(argv) > 1 else 10
+
+    env = dict(os.environ)
+    cache_dir = tempfile.mkdtemp()
+    if cache:
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        env['PYTHONPYCACHEPREFIX'] = cache_dir
+        run(mode, env)
+    else:
+        env['PYTHONDONTWRITEBYTECODE'] = '1'
+        env['PYTHONPYCACHEPREFIX'] = cache_dir
+    try:
+        times = [run(mode, env)[0] for _ in range(runs)]
+        _, stderr = run(mode, env, importtime=True)
+    finally:
+        shutil.rmtree(cache_dir)
+
+    print(f"Time to listening ({mode[2:]}, {runs} runs, "
+          f"{'cached' if cache else 'no'} bytecode): "
+          f"median {statistics.median(times) * 1e3:.1f} ms, "
+          f"min {min(times) * 1e3:.1f} ms, max {max(times) * 1e3:.1f} ms")
+    imports = top_imports(stderr, 1000)
+    print(f"Imports: {sum(t for t, _ in imports) * 1e3:.1f} ms. Slowest:")
+    for seconds, name in imports[:15]:
+        print(f"{seconds * 1e3:8.1f} ms  {name}")
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,99 @@
+"""Replay a traffic capture against a running Delay Server.
+
+Frames recorded by :class:`delay_server.util.capture.CaptureWriter` are
+sent to the server with their original spacing, divided by the speed
+factor. Use a speed of 0 to send as fast as possible.
+
+Usage: ``python -m benchmark.replay capture.dcap mcc=127.0.0.1:1000
+[--speed 10] [--start 60] [--count 1000]``
+"""
+import argparse
+import socket
+import sys
+import time
+
+# pylint: disable=E0401
+from delay_server.util.capture import CaptureReader
+
+
+def replay(reader: CaptureReader, links: dict, speed: float = 1.0,
+           start: int = 0, count: int = None) -> int:
+    """Send frames from a capture.
+
+    Args:
+        reader (CaptureReader): Capture to replay.
+        links (dict): Connected socket for each link name. Frames of other
+            links are skipped.
+        speed (float): Replay speed factor. Use 0 for no pacing.
+        start (int): Position of the first frame.
+        count (int): Optional; Maximum number of frames.
+
+    Returns:
+        int: Number of frames sent.
+    """
+    end = len(reader) if count is None else min(len(reader), start + count)
+    if start >= end:
+        return 0
+
+    first = reader.timestamps[start]
+    t_start = time.monotonic()
+    num_sent = 0
+    for i in range(start, end):
+        timestamp, link, data = reader[i]
+        sock = links.get(link)
+        if sock is None:
+            continue
+        if speed > 0:
+            wait = t_start + (timestamp - first) / 1e9 / speed - \
+                time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        sock.sendall(data)
+        data.release()
+        num_sent += 1
+    return num_sent
+
+
+def main(argv: list) -> None:
+    """Parse arguments and replay the capture."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('capture', help='Capture file.')
+    parser.add_argument('links', nargs='+',
+                        help='Destination of each link as name=host:port.')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='Speed factor. 0 sends as fast as possible.')
+    parser.add_argument('--start', type=float, default=0.0,
+                        help='Seconds into the capture to start from.')
+    parser.add_argument('--count', type=int, default=None,
+                        help='Maximum number of frames to send.')
+    args = parser.parse_args(argv[1:])
+
+    open_start = time.perf_counter()
+    reader = CaptureReader(args.capture)
+    open_time = time.perf_counter() - open_start
+    print(f"Opened {len(reader)} frames ({reader.duration:.1f} sec, "
+          f"{'indexed' if reader.indexed else 'scanned'}) "
+          f"in {open_time * 1e3:.1f} ms")
+
+    links = {}
+    for link in args.links:
+        name, address = link.split('=', 1)
+        host, port = address.rsplit(':', 1)
+        links[name] = socket.create_connection((host, int(port)))
+
+    start = 0
+    if len(reader) > 0:
+        start = reader.find(reader.timestamps[0] + int(args.start * 1e9))
+    t_start = time.perf_counter()
+    num_sent = replay(reader, links, args.speed, start, args.count)
+    elapsed = time.perf_counter() - t_start
+    print(f"Sent {num_sent} frames in {elapsed:.2f} sec "
+          f"({num_sent / max(elapsed, 1e-9):.0f} frames/s)")
+
+    for sock in links.values():
+        sock.close()
+    reader.close()
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1 @@
+"""Delay Server package."""
@@ -1,13 +1,478 @@
-"""Load Delay Server configuration."""
+"""Load Delay Server configuration.
+
+The config file is parsed and validated once, when it is loaded, into a
+frozen :class:`ServerConfig`. The rest of the server reads plain attributes
+of that snapshot instead of parsing strings on every access.
+"""
 import configparser
+import dataclasses
+import datetime
 import os
 import logging
 
+from delay_server.delay.delay import compile_delay
+from delay_server.util.conn_filter import parse_pattern
+from delay_server.util.deadline import DeadlineWaiter
+from delay_server.util.exceptions import ConfigError
+from delay_server.util.queue import DelayQueue
+from delay_server.util.sched import POLICIES, parse_cpus
+
+# Format of the mission start time.
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Links. The display name of each is read from [mission] <link>_name.
+LINKS = ('mcc', 'hab')
+
+
+@dataclasses.dataclass(frozen=True)
+class MissionConfig:
+    """Mission settings."""
+    name: str
+    hab_name: str
+    mcc_name: str
+    # Epoch of the dynamic delays. None to use the start of the application.
+    start_time: datetime.datetime
+
+
+@dataclasses.dataclass(frozen=True)
+class LinkConfig:
+    """Ports of a link."""
+    name: str
+    display_name: str
+    port_recv: int
+    port_send: int
+
+
+@dataclasses.dataclass(frozen=True)
+class ProxyConfig:
+    """Proxy settings."""
+    passthrough: bool
+    reverify_egress: bool
+    kernel_timestamps: bool
+    release_precision: str
+    # CPUs the threads run on. None to run on any CPU.
+    producer_cpus: frozenset
+    consumer_cpus: frozenset
+    # Scheduling policy. None to keep the default policy.
+    sched_policy: str
+    sched_priority: int
+    # Largest message reassembled from fragments, in bytes.
+    max_message_len: int
+
+
+@dataclasses.dataclass(frozen=True)
+class QueueConfig:
+    """Budget of the queue of each link. Zero means no limit."""
+    max_bytes: int
+    max_msgs: int
+    high_water: float
+    low_water: float
+    policy: str
+
+
+@dataclasses.dataclass(frozen=True)
+class GuiConfig:
+    """Graphical user interface settings."""
+    enabled: bool
+    refresh_rate: float
+    stats_interval: float
+    log_slots: int
+
+
+@dataclasses.dataclass(frozen=True)
+class GcConfig:
+    """Garbage collection settings."""
+    hot_path: bool
+    thresholds: tuple
+    # Pause (in sec) above which collections are logged.
+    warn_pause: float
+    profile_allocations: bool
+
+
+@dataclasses.dataclass(frozen=True)
+class FilesConfig:
+    """File channel settings."""
+    enabled: bool
+    spool_dir: str
+    port_recv: int
+    port_send: int
+
+
+@dataclasses.dataclass(frozen=True)
+class CaptureConfig:
+    """Traffic capture settings."""
+    enabled: bool
+    path: str
+
+
+@dataclasses.dataclass(frozen=True)
+class ReloadConfig:
+    """Config reload settings."""
+    enabled: bool
+    interval: float
+
+
+@dataclasses.dataclass(frozen=True)
+class ServerConfig:
+    """Validated snapshot of the config file."""
+    mission: MissionConfig
+    links: tuple
+    # Address patterns to accept and reject, such as 192.168.1.* or
+    # 10.0.0.0/8. The most specific pattern matching a client applies.
+    allow: tuple
+    reject: tuple
+    proxy: ProxyConfig
+    queue: QueueConfig
+    gui: GuiConfig
+    gc: GcConfig
+    files: FilesConfig
+    capture: CaptureConfig
+    reload: ReloadConfig
+    # Dynamic delays as (epoch in sec, expression in t), sorted by epoch.
+    delay_schedule: tuple
+    # Override delays as (name, delay in sec), in file order.
+    overrides: tuple
+
+    def link(self, name: str) -> LinkConfig:
+        """Return the settings of a link.
+
+        Args:
+            name (str): Link name, such as ``mcc``.
+
+        Returns:
+            LinkConfig: Link settings.
+
+        Raises:
+            KeyError: No link with this name.
+        """
+        for link in self.links:
+            if link.name == name:
+                return link
+        raise KeyError(name)
+
+
+class _Reader:
+    """Read typed values from a parser and collect every error found."""
+
+    _BOOLEANS = configparser.ConfigParser.BOOLEAN_STATES
+
+    def __init__(self, parser: configparser.ConfigParser):
+        self._parser = parser
+        self.errors = []
+
+    def error(self, section: str, option: str, value, expected: str) -> None:
+        """Record an invalid value."""
+        self.errors.append(f'config[{section}][{option}] = "{value}" - '
+                           f'Expected {expected}.')
+
+    def raw(self, section: str, option: str) -> str:
+        """Return a value as a string, or None if it is missing."""
+        if not self._parser.has_option(section, option):
+            self.errors.append(f'Did not find config[{section}][{option}]')
+            return None
+        return self._parser.get(section, option).strip()
+
+    def get(self, section: str, option: str, convert, expected: str,
+            check=None, empty=None):
+        """Read and convert a value.
+
+        Args:
+            section (str): Config file section name.
+            option (str): Config file option name.
+            convert (callable): Converts the string. Raises ValueError if
+                it is invalid.
+            expected (str): Description of a valid value for the error.
+            check (callable): Optional; Returns True if the converted value
+                is valid.
+            empty: Optional; Value returned if the option is empty. If
+                :class:`None`, the option is required.
+
+        Returns:
+            Converted value, or :class:`None` if invalid.
+        """
+        text = self.raw(section, option)
+        if text is None:
+            return None
+        if not text and empty is not None:
+            return empty
+        try:
+            value = convert(text)
+        except ValueError:
+            value = None
+        if value is None or (check is not None and not check(value)):
+            self.error(section, option, text, expected)
+            return None
+        return value
+
+    def boolean(self, section: str, option: str) -> bool:
+        """Read a boolean."""
+        return self.get(section, option,
+                        lambda text: self._BOOLEANS[text.lower()]
+                        if text.lower() in self._BOOLEANS else None,
+                        'boolean')
+
+    def port(self, section: str, option: str) -> int:
+        """Read a TCP port number."""
+        return self.get(section, option, int, 'port (1-65535)',
+                        lambda value: 0 < value < 65536)
+
+    def choice(self, section: str, option: str, choices,
+               empty=None) -> str:
+        """Read one of several strings."""
+        return self.get(section, option, str,
+                        'one of ' + ', '.join(choices),
+                        lambda value: value in choices, empty)
+
+
+def _cpus(text: str) -> frozenset:
+    """Parse a CPU list into a frozen set."""
+    return frozenset(parse_cpus(text) or ())
+
+
+def _thresholds(text: str) -> tuple:
+    """Parse the three collection thresholds."""
+    thresholds = tuple(int(i) for i in text.split(','))
+    return thresholds if len(thresholds) == 3 else None
+
+
+def _start_time(text: str) -> datetime.datetime:
+    """Parse the mission start time."""
+    return datetime.datetime.strptime(text, TIME_FORMAT)
+
+
+def check_reject(pattern: str) -> bool:
+    """Check an address pattern of the allow or reject list.
+
+    Patterns are addresses, networks such as ``10.0.0.0/8`` or IPv4
+    addresses with trailing wildcards such as ``192.168.1.*``.
+
+    Args:
+        pattern (str): Address pattern.
+
+    Returns:
+        bool: True if the pattern is valid.
+    """
+    try:
+        parse_pattern(pattern)
+    except ValueError:
+        return False
+    return True
+
+
+def parse_config(parser: configparser.ConfigParser) -> ServerConfig:
+    """Validate a parsed config file and return its snapshot.
+
+    Sections and options that are not part of the schema are ignored.
+
+    Args:
+        parser (configparser.ConfigParser): Parsed config file.
+
+    Returns:
+        ServerConfig: Snapshot of the config file.
+
+    Raises:
+        ConfigError: Missing or invalid values. The message lists all of
+            them.
+    """
+    # pylint: disable=R0914
+    reader = _Reader(parser)
+
+    mission = MissionConfig(
+        name=reader.raw('mission', 'name'),
+        hab_name=reader.raw('mission', 'hab_name'),
+        mcc_name=reader.raw('mission', 'mcc_name'),
+        start_time=reader.get('mission', 'start_time', _start_time,
+                              'date (' + TIME_FORMAT + ')', empty=False)
+        or None)
+
+    links = tuple(LinkConfig(name=name,
+                             display_name=getattr(mission, name + '_name'),
+                             port_recv=reader.port('network',
+                                                   name + '_port_recv'),
+                             port_send=reader.port('network',
+                                                   name + '_port_send'))
+                  for name in LINKS)
+
+    patterns = {}
+    for option in ('allow', 'reject'):
+        text = reader.raw('network', option) or ''
+        patterns[option] = tuple(item.strip() for item in text.split(',')
+                                 if item.strip())
+        for pattern in patterns[option]:
+            if not check_reject(pattern):
+                reader.error('network', option, pattern,
+                             'address, network or pattern such as '
+                             '192.168.1.*')
+
+    proxy = ProxyConfig(
+        passthrough=reader.boolean('proxy', 'passthrough'),
+        reverify_egress=reader.boolean('proxy', 'reverify_egress'),
+        kernel_timestamps=reader.boolean('proxy', 'kernel_timestamps'),
+        release_precision=reader.choice('proxy', 'release_precision',
+                                        DeadlineWaiter.PRECISIONS),
+        producer_cpus=reader.get('proxy', 'producer_cpus', _cpus,
+                                 'CPU list such as 2,3 or 2-3',
+                                 empty=False) or None,
+        consumer_cpus=reader.get('proxy', 'consumer_cpus', _cpus,
+                                 'CPU list such as 2,3 or 2-3',
+                                 empty=False) or None,
+        sched_policy=reader.choice('proxy', 'sched_policy', POLICIES,
+                                   empty=False) or None,
+        sched_priority=reader.get('proxy', 'sched_priority', int,
+                                  'int (0-99)',
+                                  lambda value: 0 <= value < 100),
+        max_message_len=reader.get('proxy', 'max_message_len', int,
+                                   'int > 0', lambda value: value > 0))
+
+    queue = QueueConfig(
+        max_bytes=reader.get('queue', 'max_bytes', int, 'int >= 0',
+                             lambda value: value >= 0),
+        max_msgs=reader.get('queue', 'max_msgs', int, 'int >= 0',
+                            lambda value: value >= 0),
+        high_water=reader.get('queue', 'high_water', float, 'float (0-1]',
+                              lambda value: 0 < value <= 1),
+        low_water=reader.get('queue', 'low_water', float, 'float [0-1)',
+                             lambda value: 0 <= value < 1),
+        policy=reader.choice('queue', 'policy', DelayQueue.POLICIES))
+    if queue.high_water is not None and queue.low_water is not None and \
+            queue.low_water > queue.high_water:
+        reader.error('queue', 'low_water', queue.low_water,
+                     'float <= high_water')
+
+    gui = GuiConfig(
+        enabled=reader.boolean('gui', 'enabled'),
+        refresh_rate=reader.get('gui', 'refresh_rate', float, 'float > 0',
+                                lambda value: value > 0),
+        stats_interval=reader.get('gui', 'stats_interval', float,
+                                  'float > 0', lambda value: value > 0),
+        log_slots=reader.get('gui', 'log_slots', int, 'int > 0',
+                             lambda value: value > 0))
+
+    warn_pause = reader.get('gc', 'warn_pause', float, 'float >= 0',
+                            lambda value: value >= 0)
+    gc = GcConfig(
+        hot_path=reader.boolean('gc', 'hot_path'),
+        thresholds=reader.get('gc', 'thresholds', _thresholds,
+                              'three ints such as 50000, 20, 100'),
+        warn_pause=None if warn_pause is None else warn_pause / 1e3,
+        profile_allocations=reader.boolean('gc', 'profile_allocations'))
+
+    files = FilesConfig(
+        enabled=reader.boolean('files', 'enabled'),
+        spool_dir=reader.raw('files', 'spool_dir'),
+        port_recv=reader.port('files', 'port_recv'),
+        port_send=reader.port('files', 'port_send'))
+
+    capture = CaptureConfig(enabled=reader.boolean('capture', 'enabled'),
+                            path=reader.raw('capture', 'path'))
+
+    reload = ReloadConfig(
+        enabled=reader.boolean('reload', 'enabled'),
+        interval=reader.get('reload', 'interval', float, 'float > 0',
+                            lambda value: value > 0))
+
+    ports = {}
+    for section, option, port in \
+            [('network', link.name + '_port_recv', link.port_recv)
+             for link in links] + \
+            [('network', link.name + '_port_send', link.port_send)
+             for link in links] + \
+            [('files', 'port_recv', files.port_recv),
+             ('files', 'port_send', files.port_send)]:
+        if files.enabled is False and section == 'files':
+            continue
+        if port is not None and port in ports:
+            reader.error(section, option, port,
+                         'port not used by ' + ports[port])
+        ports.setdefault(port, f'config[{section}][{option}]')
+
+    schedule = []
+    if parser.has_section('dynamic_delay'):
+        for epoch, expression in parser.items('dynamic_delay', raw=True):
+            if epoch in parser.defaults():
+                continue
+            try:
+                value = int(epoch)
+            except ValueError:
+                value = -1
+            if value < 0:
+                reader.error('dynamic_delay', epoch, expression,
+                             'epoch (in sec) >= 0 on the left-hand side')
+            elif not expression.strip():
+                reader.error('dynamic_delay', epoch, expression,
+                             'delay expression')
+            else:
+                # Compile here so that typos are reported with the other
+                # errors instead of failing when the schedule is built.
+                try:
+                    compile_delay(expression)
+                except ValueError as e:
+                    reader.error('dynamic_delay', epoch, expression,
+                                 f'delay expression in terms of t ({e})')
+                else:
+                    schedule.append((value, expression.strip()))
+
+    overrides = []
+    if parser.has_section('override_delay'):
+        for name, value in parser.items('override_delay', raw=True):
+            if name in parser.defaults():
+                continue
+            try:
+                delay = float(value)
+            except ValueError:
+                delay = -1
+            if delay < 0:
+                reader.error('override_delay', name, value,
+                             'delay (in sec) >= 0')
+            else:
+                overrides.append((name, delay))
+
+    if reader.errors:
+        raise ConfigError('\n'.join(reader.errors))
+
+    return ServerConfig(mission=mission, links=links,
+                        allow=patterns['allow'], reject=patterns['reject'],
+                        proxy=proxy, queue=queue, gui=gui, gc=gc,
+                        files=files, capture=capture, reload=reload,
+                        delay_schedule=tuple(sorted(schedule)),
+                        overrides=tuple(overrides))
+
+
+def diff_config(old: ServerConfig, new: ServerConfig) -> list:
+    """List the settings that differ between two snapshots.
+
+    Args:
+        old (ServerConfig): Previous snapshot.
+        new (ServerConfig): New snapshot.
+
+    Returns:
+        list: Strings such as ``queue.max_msgs: 1000 -> 2000``.
+    """
+    changes = []
+    for field in dataclasses.fields(old):
+        before = getattr(old, field.name)
+        after = getattr(new, field.name)
+        if before == after:
+            continue
+        if dataclasses.is_dataclass(before):
+            for sub in dataclasses.fields(before):
+                if getattr(before, sub.name) != getattr(after, sub.name):
+                    changes.append(f'{field.name}.{sub.name}: '
+                                   f'{getattr(before, sub.name)!r} -> '
+                                   f'{getattr(after, sub.name)!r}')
+        else:
+            changes.append(f'{field.name}: {before!r} -> {after!r}')
+    return changes
+
 
 # Disable pylint error for too many ancestors
 # pylint: disable=R0901
 class DelayConfig(configparser.ConfigParser):
-    """DelayConfig class. Extends ConfigParser."""
+    """DelayConfig class. Extends ConfigParser.
+
+    Use :attr:`snapshot` to read the validated config. The string getters
+    remain for options outside the schema.
+    """
 
     # Singleton instance
     _instance = None
@@ -27,12 +492,71 @@ class DelayConfig(configparser.ConfigParser):
     def __init__(self, logger: logging.Logger = None):
         """Initialize by reading default config file."""
         if not DelayConfig._initialized:
-            super().__init__(self)
+            super().__init__()
             DelayConfig._initialized = True
-            self._read_config()
             self._logger = logger
             if self._logger is None:
                 self._logger = logging.getLogger(self.__class__.__name__)
+            # Snapshot of the last file loaded and why it failed, if it did.
+            self._snapshot = None
+            self._error = None
+            self._path = None
+            self._read_config()
+
+    def optionxform(self, optionstr: str) -> str:
+        """Keep the case of option names, since the names of the override
+        delays are shown on the GUI."""
+        return optionstr
+
+    @property
+    def snapshot(self) -> ServerConfig:
+        """Validated snapshot of the config file.
+
+        Raises:
+            ConfigError: The config file could not be loaded or is invalid.
+        """
+        if self._snapshot is None:
+            raise ConfigError(str(self._error or 'No config file loaded.'))
+        return self._snapshot
+
+    @property
+    def path(self) -> str:
+        """Path of the config file last read."""
+        return self._path
+
+    def reload(self, check=None) -> ServerConfig:
+        """Read the config file again and swap in its snapshot.
+
+        The file is parsed into a separate parser first, so the current
+        settings are kept unless the new file is valid.
+
+        Args:
+            check (callable): Optional; Called with the new snapshot before
+                it is swapped in. Raises ValueError to reject it.
+
+        Returns:
+            ServerConfig: New snapshot.
+
+        Raises:
+            ConfigError: The file could not be read or is invalid.
+        """
+        parser = configparser.ConfigParser()
+        parser.optionxform = self.optionxform
+        try:
+            if not parser.read(self._path):
+                raise ConfigError('Failed to load ' + str(self._path))
+            snapshot = parse_config(parser)
+            if check is not None:
+                check(snapshot)
+        except (configparser.Error, ValueError) as e:
+            raise ConfigError(str(e)) from e
+
+        for section in self.sections():
+            self.remove_section(section)
+        self.read_dict(parser)
+        self._snapshot = snapshot
+        self._error = None
+        return snapshot
 
     def _read_config(self, filename: str = None) -> bool:
         """Read config file. Returns true on success.
@@ -47,17 +571,23 @@ class DelayConfig(configparser.ConfigParser):
         if filename is None:
             filename = os.path.abspath('.') + "/" + DelayConfig._filename
 
+        self._snapshot = None
+        self._error = None
+        self._path = filename
+
         # Validate path and ensure it is able to read the file.
         if os.path.exists(filename):
             try:
                 self.read(filename)
-            except configparser.Error:
+            except configparser.Error as e:
+                self._error = e
                 self._logger.critical('Failed to parse log file %s', filename)
                 return False
             if not self._validate():
                 self._logger.critical('Failed to validate %s', filename)
                 return False
         else:
+            self._error = 'Failed to load ' + filename
             self._logger.critical('Failed to load %s', filename)
             return False
         return True
@@ -139,13 +669,19 @@ class DelayConfig(configparser.ConfigParser):
         return ret
 
     def _validate(self) -> bool:
-        """Validate config file. Check for required params.
+        """Validate config file and take its snapshot.
 
         Returns:
             bool: True if config file is valid.
         """
-        # TODO: Validate config file?
-        return self._initialized is not None
+        try:
+            self._snapshot = parse_config(self)
+        except ConfigError as e:
+            self._error = e
+            for error in str(e).splitlines():
+                self._logger.error(error)
+            return False
+        return True
 
     def __repr__(self) -> str:
         """Return list of all config fields."""
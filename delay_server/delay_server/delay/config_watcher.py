@@ -0,0 +1,154 @@
+"""Reload the config file while the server runs.
+
+:class:`ConfigWatcher` polls the modification time of the config file. When
+it changes, the file is parsed and validated in the background and the new
+delay schedule is compiled. Only once all of that succeeded are the config
+snapshot and the schedule swapped in and the listeners, such as the
+connection filters, notified. Sockets and queues are left untouched, so
+messages in flight and client connections survive a reload.
+"""
+import logging
+import os
+import threading
+import time
+
+from delay_server.delay.config import DelayConfig, ServerConfig, diff_config
+from delay_server.delay.delay import CommDelay, DelaySchedule
+from delay_server.util.exceptions import ConfigError
+
+
+class ConfigWatcher:
+    """Thread that reloads the config file when it changes."""
+
+    # Settings applied without a restart. Changes to the others are
+    # reported and take effect on the next start.
+    LIVE = ('mission.start_time', 'allow', 'reject', 'delay_schedule')
+
+    def __init__(self, config: DelayConfig = None, interval: float = 1.0,
+                 logger: logging.Logger = None):
+        """Initialize.
+
+        Args:
+            config (DelayConfig): Optional; Config to reload. Defaults to
+                the :class:`DelayConfig` singleton.
+            interval (float): Time between checks of the file (in sec).
+            logger (logging.Logger): Logger associated with parent class.
+        """
+        self._config = config
+        if self._config is None:
+            self._config = DelayConfig()
+        self._interval = interval
+        self._logger = logger
+        if self._logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+        self._delay = CommDelay()
+        self._listeners = []
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Signature of the file last loaded and schedule compiled for the
+        # snapshot being loaded.
+        self._signature = self._stat()
+        self._schedule = None
+
+        # Number of reloads applied and rejected.
+        self.reloads = 0
+        self.failures = 0
+
+    def add_listener(self, listener) -> None:
+        """Call a function with the new snapshot after each reload.
+
+        Args:
+            listener (callable): Takes a :class:`ServerConfig`.
+        """
+        self._listeners.append(listener)
+
+    def start(self) -> None:
+        """Start watching the file."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='config_watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop watching the file."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def check(self) -> bool:
+        """Reload the file if it changed since the last check.
+
+        Returns:
+            bool: True if a new config was applied.
+        """
+        signature = self._stat()
+        if signature is None or signature == self._signature:
+            return False
+        self._signature = signature
+        return self.reload()
+
+    def reload(self) -> bool:
+        """Reload the file and apply it if it is valid.
+
+        Returns:
+            bool: True if the new config was applied. On failure the
+                previous config stays in effect.
+        """
+        start = time.perf_counter()
+        try:
+            old = self._config.snapshot
+        except ConfigError:
+            old = None
+        try:
+            new = self._config.reload(self._compile)
+        except ConfigError as e:
+            self.failures += 1
+            self._logger.error('Kept previous config. Failed to reload %s:',
+                               self._config.path)
+            for error in str(e).splitlines():
+                self._logger.error(error)
+            return False
+
+        self._delay.set_schedule(self._schedule)
+        self._schedule = None
+        if old is None or old.mission.start_time != new.mission.start_time:
+            self._delay.set_start_time(new.mission.start_time)
+        for listener in self._listeners:
+            listener(new)
+        self.reloads += 1
+
+        changes = [] if old is None else diff_config(old, new)
+        self._logger.info('Reloaded %s in %.1f ms with %d changes.',
+                          self._config.path,
+                          (time.perf_counter() - start) * 1e3, len(changes))
+        for change in changes:
+            key = change.split(':', 1)[0]
+            if key in self.LIVE or key.split('.', 1)[0] in self.LIVE:
+                self._logger.info('  %s', change)
+            else:
+                self._logger.warning('  %s (applies after restart)', change)
+        return True
+
+    def _compile(self, snapshot: ServerConfig) -> None:
+        """Compile the delay schedule of a new snapshot.
+
+        Raises:
+            ValueError: Invalid delay expression.
+        """
+        self._schedule = DelaySchedule(snapshot.delay_schedule)
+
+    def _stat(self) -> tuple:
+        """Return the modification time, size and inode of the file, or
+        :class:`None` if it cannot be read."""
+        try:
+            stat = os.stat(self._config.path)
+        except (OSError, TypeError):
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _run(self) -> None:
+        """Watcher thread."""
+        while not self._stop.wait(self._interval):
+            self.check()
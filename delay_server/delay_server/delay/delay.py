@@ -1,6 +1,77 @@
+import bisect
+import datetime
 import logging
 
 from delay_server.util.lock import LockTimeout
+from delay_server.util.clock import Clock, REAL_CLOCK
+
+
+def compile_delay(expression: str):
+    """Compile a delay expression in terms of the mission time ``t``.
+
+    Constants are converted directly. Other expressions are compiled by
+    :mod:`delay_server.util.expression`, which is only imported when
+    needed. Sympy is only imported for expressions that use functions
+    outside :py:mod:`math`.
+
+    Args:
+        expression (str): Delay expression, such as ``300`` or
+            ``(t - 100) + 0.1``.
+
+    Returns:
+        callable: Function of the mission time (in sec) returning the delay.
+
+    Raises:
+        ValueError: Invalid expression.
+    """
+    try:
+        value = float(expression)
+    except ValueError:
+        pass
+    else:
+        return lambda t: value
+
+    # Imported here so that constant delays do not load the compiler.
+    # pylint: disable=C0415
+    from delay_server.util.expression import compile_any
+    return compile_any(expression, ('t',))
+
+
+class DelaySchedule:
+    """Dynamic delays applied from given mission times.
+
+    The expressions are compiled when the schedule is created, so a
+    schedule that was created successfully can be swapped in as a whole.
+    """
+
+    def __init__(self, schedule: tuple = ()):
+        """Compile a schedule.
+
+        Args:
+            schedule (tuple): Pairs of mission time (in sec) from which the
+                delay applies and delay expression in terms of ``t``.
+
+        Raises:
+            ValueError: Invalid expression.
+        """
+        schedule = sorted(schedule)
+        self._epochs = [epoch for epoch, _ in schedule]
+        self._funcs = [compile_delay(expression) for _, expression in schedule]
+
+    def delay(self, mission_time: float) -> float:
+        """Return the delay (in sec) at a mission time.
+
+        Before the first entry, and for an empty schedule, the delay is 0.
+        Negative results are clamped to 0.
+        """
+        i = bisect.bisect_right(self._epochs, mission_time) - 1
+        if i < 0:
+            return 0
+        return max(0, self._funcs[i](mission_time))
+
+    def __len__(self) -> int:
+        """Return number of entries."""
+        return len(self._epochs)
 
 
 class CommDelay:
@@ -8,6 +79,10 @@ class CommDelay:
 
     The class allows the user to configure the desired delay via a config
     file or override options.
+
+    The delay owns the clock shared by the rest of the server. Replace it
+    with a :class:`delay_server.util.clock.SimulatedClock` to run mission
+    timelines without waiting in real time.
     """
 
     # Singleton instance
@@ -33,10 +108,17 @@ class CommDelay:
             self._lock = LockTimeout()
             # Override delay. If None, then no override.
             self._override = None
+            # Dynamic delays used when there is no override.
+            self._schedule = DelaySchedule()
             # File containing delay configuration
             self._filename = None
             # Cache curr delay
             self._time_cache = 0
+            # Clock, configured mission start time (None for the start of
+            # the application) and its monotonic equivalent.
+            self._clock = REAL_CLOCK
+            self._start_time = None
+            self._start = self._clock.monotonic()
             # Create logger for this module
             self._logger = logger
             if self._logger is None:
@@ -76,6 +158,64 @@ class CommDelay:
                 self._logger.info('Failed to override.')
         return ret
 
+    def set_schedule(self, schedule: DelaySchedule = None) -> bool:
+        """Replace the dynamic delays. Returns true on success.
+
+        Args:
+            schedule (DelaySchedule): Optional; New schedule. Defaults to
+                no dynamic delay.
+        """
+        if schedule is None:
+            schedule = DelaySchedule()
+
+        ret = False
+        with self._lock.acquire_timeout(self._TIMEOUT) as lock:
+            if lock:
+                self._schedule = schedule
+                self._logger.info('Schedule with %d entries', len(schedule))
+                ret = True
+            else:
+                self._logger.info('Failed to set schedule.')
+        return ret
+
+    def set_clock(self, clock: Clock = None) -> None:
+        """Replace the clock. The mission time restarts unless a start time
+        was set. Queues, deadline waiters and sockets created without a clock
+        follow the new one.
+
+        Args:
+            clock (Clock): Optional; New clock. Defaults to real time.
+        """
+        if clock is None:
+            clock = REAL_CLOCK
+        self._clock = clock
+        self.set_start_time(self._start_time)
+
+    def set_start_time(self, start_time: datetime.datetime = None) -> None:
+        """Set the epoch of the dynamic delays.
+
+        Args:
+            start_time (datetime.datetime): Optional; Mission start time
+                (``[mission] start_time``). Defaults to now.
+        """
+        if start_time is None:
+            self._start = self._clock.monotonic()
+        else:
+            self._start = self._clock.from_realtime_ns(
+                int(start_time.timestamp() * 1e9))
+        self._start_time = start_time
+        self._logger.info('Mission start time %s', start_time)
+
+    @property
+    def clock(self) -> Clock:
+        """Clock shared by the server."""
+        return self._clock
+
+    @property
+    def mission_time(self) -> float:
+        """Time (in sec) since the mission started."""
+        return self._clock.monotonic() - self._start
+
     @property
     def filename(self) -> str:
         """Filename accessor."""
@@ -91,8 +231,13 @@ class CommDelay:
                 if self._override is not None:
                     curr_delay = self._override
                 else:
-                    curr_delay = 0
-                # TODO read from file
+                    try:
+                        curr_delay = self._schedule.delay(self.mission_time)
+                    except (ArithmeticError, ValueError) as e:
+                        self._logger.warning(
+                            'Failed to evaluate delay: %s. Using cached '
+                            'delay.', e)
+                        curr_delay = self._time_cache
                 self._time_cache = curr_delay
             else:
                 curr_delay = self._time_cache
@@ -0,0 +1,451 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import logging
+import os
+import re
+import select
+import socket
+import threading
+import time
+
+from delay_common import file_transfer
+from delay_server.util.conn_filter import ConnectionFilter
+from delay_server.util.queue import DelayQueue
+
+
+class SpoolEntry:
+    """Index entry for a file held in the spool directory.
+
+    Only this entry goes through the delay queue. The file itself stays on
+    disk until it is released.
+    """
+
+    __slots__ = ('name', 'path', 'size', 'crc', 'ingress')
+
+    def __init__(self, name: str, path: str, size: int, crc: int,
+                 ingress: float):
+        """Initialize.
+
+        Args:
+            name (str): File name announced by the sender.
+            path (str): Location of the file in the spool directory.
+            size (int): File size in bytes.
+            crc (int): CRC-32 of the file contents.
+            ingress (float): Time in the queue clock when the transfer
+                started. The delay counts from then.
+        """
+        self.name = name
+        self.path = path
+        self.size = size
+        self.crc = crc
+        self.ingress = ingress
+
+    def release(self) -> None:
+        """Delete the file from the spool directory."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+    def __str__(self) -> str:
+        """Return file name and size."""
+        return self.name + " (" + str(self.size) + " bytes)"
+
+
+class _Upload:
+    """State of a file being received on one connection."""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.header = bytearray()
+        self.name = None
+        self.size = 0
+        self.crc = 0
+        self.part_path = None
+        self.offset = 0
+        self.file = None
+        self.start = 0.0
+
+    def close(self) -> None:
+        """Close the partial file. It is kept to resume the transfer."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class FileChannel:
+    """Delayed bulk file transfer.
+
+    Files uploaded to the receive port (see :mod:`delay_common.file_transfer`)
+    are streamed to the spool directory as ``<name>.part``. Once complete,
+    the file is renamed and a :class:`SpoolEntry` is pushed into the delay
+    queue. When the entry is released, the file is sent to every client
+    connected to the send port with :py:meth:`socket.socket.sendfile`
+    (zero-copy :py:func:`os.sendfile` where available) and deleted.
+
+    A sender that reconnects after an interrupted upload resumes from the
+    bytes already in the spool directory. Partial files are kept per name,
+    size and checksum, so a different file with the same name starts over.
+    Times are read from the queue clock.
+    """
+
+    _TIMEOUT = 0.5
+
+    # Poll timeout (in sec) of the sockets.
+    _POLL = 0.01
+
+    # Timeout (in sec) to send a file to a client.
+    _SEND_TIMEOUT = 5.0
+
+    # Size of the buffer used to receive files.
+    _CHUNK = 1 << 20
+
+    # Suffix of incomplete files in the spool directory.
+    PART_SUFFIX = '.part'
+
+    def __init__(self, channel_name: str, spool_dir: str,
+                 queue: DelayQueue = None,
+                 conn_filter: ConnectionFilter = None):
+        """Initialize file channel.
+
+        Args:
+            channel_name (str): Name of the link. Used for threads and logs.
+            spool_dir (str): Directory where files are held while delayed.
+                Created if it does not exist.
+            queue (DelayQueue): Optional; Queue holding the spool entries.
+                If not provided, then create an unbounded queue.
+            conn_filter (ConnectionFilter): Optional; Rules deciding which
+                client addresses are accepted on both ports.
+        """
+        self._channel_name = channel_name
+        self._logger = logging.getLogger(channel_name)
+        self._spool_dir = spool_dir
+        os.makedirs(spool_dir, exist_ok=True)
+        self._queue = queue
+        if self._queue is None:
+            self._queue = DelayQueue(self._logger)
+        self._receiver = None
+        self._sender = None
+        self._stop = threading.Event()
+        self._filter = conn_filter
+
+        self._recv_buf = bytearray(self._CHUNK)
+        self._recv_view = memoryview(self._recv_buf)
+
+        # Throughput counters. Each is only updated by one thread.
+        self._files_in = 0
+        self._bytes_in = 0
+        self._time_in = 0.0
+        self._files_out = 0
+        self._bytes_out = 0
+        self._time_out = 0.0
+
+    def start_channel(self, recv_port: int, send_port: int) -> None:
+        """Start the file channel by running the receiver and sender threads.
+
+        Args:
+            recv_port (int): Port to receive files.
+            send_port (int): Port to send files.
+        """
+        self._stop.clear()
+
+        self._sender = threading.Thread(
+            target=self._run_sender,
+            args=(send_port,),
+            name=self._channel_name + "_file_sender",
+            daemon=True)
+        self._sender.start()
+
+        self._receiver = threading.Thread(
+            target=self._run_receiver,
+            args=(recv_port,),
+            name=self._channel_name + "_file_receiver",
+            daemon=True)
+        self._receiver.start()
+
+    def stop_channel(self) -> None:
+        """Stop file channel and terminate receiver and sender threads."""
+        self._stop.set()
+
+        if self._receiver is not None and self._sender is not None:
+            self._receiver.join(self._TIMEOUT)
+            self._receiver = None
+            self._sender.join(self._TIMEOUT)
+            self._sender = None
+
+    def stats(self) -> dict:
+        """Return transfer statistics.
+
+        Returns:
+            dict: Keys ``files_in``, ``bytes_in`` and ``rate_in`` (MB/s
+                while receiving), ``files_out``, ``bytes_out`` and
+                ``rate_out`` (MB/s while sending), counted for each client
+                a file was delivered to, and ``spooled`` (files waiting for
+                release).
+        """
+        return dict(files_in=self._files_in,
+                    bytes_in=self._bytes_in,
+                    rate_in=self._rate(self._bytes_in, self._time_in),
+                    files_out=self._files_out,
+                    bytes_out=self._bytes_out,
+                    rate_out=self._rate(self._bytes_out, self._time_out),
+                    spooled=len(self._queue))
+
+    @staticmethod
+    def _rate(num_bytes: int, duration: float) -> float:
+        """Return throughput in MB/s."""
+        if duration <= 0:
+            return 0.0
+        return num_bytes / duration / 1e6
+
+    @staticmethod
+    def _listen(port: int) -> socket.socket:
+        """Create a socket listening on port."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(('', port))
+        sock.listen()
+        return sock
+
+    def _run_receiver(self, port: int) -> None:
+        """Receiver Thread. Spool uploaded files and queue their entries.
+
+        Args:
+            port (int): Port used to receive files.
+        """
+        sock = self._listen(port)
+        uploads = {}
+        while not self._stop.is_set():
+            self._accept_and_recv(sock, uploads)
+        for upload in uploads.values():
+            upload.close()
+            upload.sock.close()
+        sock.close()
+
+    def _run_sender(self, port: int) -> None:
+        """Sender Thread. Send released files to clients.
+
+        Args:
+            port (int): Port used to send files.
+        """
+        sock = self._listen(port)
+        clients = []
+        while not self._stop.is_set():
+            entry = self._queue.pop()
+            self._accept_and_send(sock, clients, entry)
+            if entry is not None:
+                entry.release()
+        for i_sock in clients:
+            i_sock.close()
+        sock.close()
+
+    def _accept(self, sock: socket.socket) -> socket.socket:
+        """Accept a connection if the address filter allows it.
+
+        Returns:
+            socket.socket: Client connection, or :class:`None` if rejected.
+        """
+        i_client_socket, i_client_address = sock.accept()
+        if self._filter is not None and \
+                not self._filter.allowed(i_client_address[0]):
+            i_client_socket.close()
+            self._logger.debug('Rejected file connection from %s',
+                               i_client_address)
+            return None
+        self._logger.info('New file connection from %s', i_client_address)
+        return i_client_socket
+
+    def _accept_and_recv(self, sock: socket.socket, uploads: dict) -> None:
+        """Accept new senders and receive available file data.
+
+        Args:
+            sock (socket.socket): Listening socket.
+            uploads (dict): :class:`_Upload` for each connection.
+        """
+        poll_list = [sock] + list(uploads)
+        sock_read, _, _ = select.select(poll_list, [], [], self._POLL)
+        for i_sock in sock_read:
+            if i_sock is sock:
+                i_client_socket = self._accept(sock)
+                if i_client_socket is not None:
+                    uploads[i_client_socket] = _Upload(i_client_socket)
+                continue
+            upload = uploads[i_sock]
+            try:
+                if upload.file is None:
+                    done = self._recv_header(upload)
+                else:
+                    done = self._recv_data(upload)
+            except (OSError, ValueError) as e:
+                self._logger.warning('File transfer error %s', e)
+                done = True
+            if done:
+                upload.close()
+                del uploads[i_sock]
+                i_sock.close()
+
+    def _recv_header(self, upload: _Upload) -> bool:
+        """Receive the file header and reply with the resume offset.
+
+        Returns:
+            bool: True if the connection was closed.
+
+        Raises:
+            ValueError: Invalid header.
+        """
+        needed = file_transfer.HEADER_SIZE
+        if len(upload.header) >= needed:
+            needed += file_transfer.HEADER.unpack_from(upload.header)[1]
+        data = upload.sock.recv(needed - len(upload.header))
+        if not data:
+            return True
+        upload.header += data
+        if len(upload.header) == file_transfer.HEADER_SIZE:
+            # Name length is now known.
+            magic, name_len, _, _ = \
+                file_transfer.HEADER.unpack_from(upload.header)
+            if magic != file_transfer.MAGIC or name_len == 0:
+                raise ValueError("Invalid file header.")
+            return False
+        if len(upload.header) < needed:
+            return False
+
+        _, _, size, crc = file_transfer.HEADER.unpack_from(upload.header)
+        name = upload.header[file_transfer.HEADER_SIZE:].decode('utf-8')
+        if not file_transfer.check_name(name):
+            raise ValueError("Invalid file name.")
+        upload.header = bytearray()
+        upload.name = name
+        upload.size = size
+        upload.crc = crc
+        upload.start = self._queue.clock.monotonic()
+
+        # Resume from the partial file left by an interrupted transfer of
+        # the same file. Those of other files with this name are stale.
+        part_path = self._part_path(name, size, crc)
+        upload.part_path = part_path
+        self._discard_parts(name, part_path)
+        upload.offset = 0
+        if os.path.exists(part_path) and os.path.getsize(part_path) <= size:
+            upload.offset = os.path.getsize(part_path)
+            self._logger.info('Resume %s at %d/%d bytes.', name,
+                              upload.offset, size)
+        upload.file = open(part_path, 'r+b' if upload.offset else 'wb')
+        upload.file.seek(upload.offset)
+        upload.file.truncate()
+        upload.sock.sendall(file_transfer.OFFSET.pack(upload.offset))
+
+        if upload.offset == size:
+            self._spool(upload)
+        return False
+
+    def _recv_data(self, upload: _Upload) -> bool:
+        """Receive file data and spool the file once complete.
+
+        Returns:
+            bool: True if the connection was closed.
+        """
+        remaining = upload.size - upload.offset
+        num_bytes = upload.sock.recv_into(
+            self._recv_view[:min(remaining, self._CHUNK)])
+        if not num_bytes:
+            self._logger.warning('Transfer of %s interrupted at %d/%d bytes.',
+                                 upload.name, upload.offset, upload.size)
+            return True
+        upload.file.write(self._recv_view[:num_bytes])
+        upload.offset += num_bytes
+        self._bytes_in += num_bytes
+        if upload.offset == upload.size:
+            self._spool(upload)
+        return False
+
+    def _spool(self, upload: _Upload) -> None:
+        """Move a complete file out of the partial state and queue it.
+        Files that do not match their checksum are discarded."""
+        upload.close()
+        if file_transfer.checksum(upload.part_path) != upload.crc:
+            os.remove(upload.part_path)
+            self._logger.warning('Discarded %s. Checksum mismatch.',
+                                 upload.name)
+            return
+        path = os.path.join(self._spool_dir,
+                            upload.name + '.' + str(time.time_ns()))
+        os.replace(upload.part_path, path)
+        duration = self._queue.clock.monotonic() - upload.start
+        self._time_in += duration
+        self._files_in += 1
+        self._logger.info('Received %s (%d bytes) in %.3f sec, %.1f MB/s.',
+                          upload.name, upload.size, duration,
+                          self._rate(upload.size, duration))
+        entry = SpoolEntry(upload.name, path, upload.size, upload.crc,
+                           upload.start)
+        self._queue.push(entry, entry.ingress)
+
+    def _part_path(self, name: str, size: int, crc: int) -> str:
+        """Return path of the partial file for name, size and checksum."""
+        return os.path.join(self._spool_dir,
+                            f'{name}.{size}-{crc:08x}{self.PART_SUFFIX}')
+
+    def _discard_parts(self, name: str, keep: str) -> None:
+        """Delete the partial files for name except keep."""
+        pattern = re.compile(re.escape(name) + r'\.\d+-[0-9a-f]{8}' +
+                             re.escape(self.PART_SUFFIX))
+        for entry in os.scandir(self._spool_dir):
+            if entry.path != keep and pattern.fullmatch(entry.name):
+                os.remove(entry.path)
+                self._logger.info('Discarded stale partial file %s.',
+                                  entry.name)
+
+    def _accept_and_send(self, sock: socket.socket, clients: list,
+                         entry: SpoolEntry = None) -> int:
+        """Accept new clients and send a released file to all of them.
+
+        Args:
+            sock (socket.socket): Listening socket.
+            clients (list): Connected clients.
+            entry (SpoolEntry): Optional; File to send.
+
+        Returns:
+            int: Number of clients the file was sent to.
+        """
+        timeout = self._POLL if entry is None else 0
+        poll_list = [sock] + clients
+        sock_read, _, _ = select.select(poll_list, [], [], timeout)
+        for i_sock in sock_read:
+            if i_sock is sock:
+                i_client_socket = self._accept(sock)
+                if i_client_socket is not None:
+                    i_client_socket.settimeout(self._SEND_TIMEOUT)
+                    clients.append(i_client_socket)
+            elif not i_sock.recv(self._CHUNK):
+                clients.remove(i_sock)
+                i_sock.close()
+
+        if entry is None:
+            return 0
+
+        num_sent = 0
+        header = file_transfer.encode_header(entry.name, entry.size,
+                                             entry.crc)
+        clock = self._queue.clock
+        with open(entry.path, 'rb') as file:
+            for i_sock in list(clients):
+                start = clock.monotonic()
+                try:
+                    i_sock.sendall(header)
+                    i_sock.sendfile(file, 0, entry.size)
+                except OSError as e:
+                    self._logger.warning('File send error %s', e)
+                    clients.remove(i_sock)
+                    i_sock.close()
+                    continue
+                duration = clock.monotonic() - start
+                self._time_out += duration
+                self._files_out += 1
+                self._bytes_out += entry.size
+                num_sent += 1
+                self._logger.info('Sent %s in %.3f sec, %.1f MB/s.',
+                                  entry, duration,
+                                  self._rate(entry.size, duration))
+        return num_sent
@@ -2,9 +2,12 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import time
 import threading
 
+from delay_server.util.capture import CaptureWriter
+from delay_server.util.conn_filter import ConnectionFilter
+from delay_server.util.deadline import DeadlineWaiter
+from delay_server.util.sched import set_thread_sched
 from delay_server.util.queue import DelayQueue
 from delay_server.delay.socket import DelayServerSocket
 
@@ -13,21 +16,109 @@ class DelayProxy:
 
     _TIMEOUT = 0.5
 
-    def __init__(self, proxy_name: str):
+    def __init__(self, proxy_name: str, queue: DelayQueue = None,
+                 passthrough: bool = True, reverify_egress: bool = False,
+                 capture: CaptureWriter = None,
+                 kernel_timestamps: bool = False,
+                 release_precision: str = DeadlineWaiter.PRECISION_MEDIUM,
+                 producer_cpus: set = None, consumer_cpus: set = None,
+                 sched_policy: str = None, sched_priority: int = 0,
+                 conn_filter: ConnectionFilter = None,
+                 max_message_len: int = None):
+        """Initialize proxy.
+
+        Args:
+            proxy_name (str): Name of the link. Used for threads and logs.
+            queue (DelayQueue): Optional; Queue holding in-flight messages.
+                Use to configure the queue budget. If not provided, then
+                create an unbounded queue.
+            passthrough (bool): Forward frames exactly as they were received
+                instead of encoding them again.
+            reverify_egress (bool): Check the CRC of each frame again before
+                forwarding it in pass-through mode.
+            capture (CaptureWriter): Optional; Record every frame received.
+            kernel_timestamps (bool): Start the delay of each frame when the
+                kernel received it (Linux only).
+            release_precision (str): Trade CPU for release timing precision.
+                See :class:`delay_server.util.deadline.DeadlineWaiter`.
+            producer_cpus (set): Optional; CPUs the producer thread runs on.
+            consumer_cpus (set): Optional; CPUs the consumer thread runs on.
+            sched_policy (str): Optional; Scheduling policy of both threads.
+                See :data:`delay_server.util.sched.POLICIES`.
+            sched_priority (int): Priority for real-time policies.
+            conn_filter (ConnectionFilter): Optional; Rules deciding which
+                client addresses are accepted on both ports.
+            max_message_len (int): Optional; Largest message reassembled
+                from fragments. See :class:`DelayServerSocket`.
+
+        Raises:
+            ValueError: Invalid release precision.
+        """
         self._proxy_name = proxy_name
         self._logger = logging.getLogger(proxy_name)
-        self._queue = DelayQueue(self._logger)
+        self._queue = queue
+        if self._queue is None:
+            self._queue = DelayQueue(self._logger)
         self._producer = None
         self._consumer = None
+        self._producer_sock = None
+        self._consumer_sock = None
         self._stop = threading.Event()
+        self._passthrough = passthrough
+        self._reverify_egress = reverify_egress
+        self._capture = capture
+        self._kernel_timestamps = kernel_timestamps
+        # Follow the shared clock unless the queue has its own.
+        self._clock = None if self._queue.shared_clock else self._queue.clock
+        self._waiter = DeadlineWaiter(self._clock, release_precision)
+        self._producer_cpus = producer_cpus
+        self._consumer_cpus = consumer_cpus
+        self._sched_policy = sched_policy
+        self._sched_priority = sched_priority
+        self._filter = conn_filter
+        self._max_message_len = max_message_len
+
+        # Number of frames received.
+        self._received = 0
 
     def start_proxy(self, producer_port: int, consumer_port: int) -> None:
-        """Start proxy by running the producer and consumer threads.
+        """Start proxy by opening both ports and running the producer and
+        consumer threads.
+
+        The ports are opened before the threads start, so that errors such
+        as a port already in use are raised to the caller.
 
         Args:
             producer_port (int): Port to receive messages.
             consumer_port (int): Port to send messages.
+
+        Raises:
+            OSError: Error opening a port. No thread is started.
+            RuntimeError: A thread did not stop since the last start.
         """
+        if self._producer is not None or self._consumer is not None:
+            raise RuntimeError("Proxy threads are still running.")
+
+        # Create and open sockets.
+        consumer_sock = DelayServerSocket(self._logger,
+                                          passthrough=self._passthrough,
+                                          reverify=self._reverify_egress,
+                                          conn_filter=self._filter)
+        producer_sock = DelayServerSocket(
+            self._logger, kernel_timestamps=self._kernel_timestamps,
+            clock=self._clock, conn_filter=self._filter,
+            on_packet=None if self._capture is None else self._capture_packet,
+            max_large_msg_len=self._max_message_len)
+        try:
+            consumer_sock.open(('', consumer_port))
+            producer_sock.open(('', producer_port))
+        except OSError:
+            consumer_sock.close()
+            producer_sock.close()
+            raise
+        self._consumer_sock = consumer_sock
+        self._producer_sock = producer_sock
+
         # Enable loop in the threads.
         self._stop.clear()
 
@@ -37,7 +128,7 @@ class DelayProxy:
         # Start consumer thread.
         self._consumer = threading.Thread(
             target=self._run_consumer,
-            args=(consumer_port,),
+            args=(consumer_sock,),
             name=self._proxy_name + "_consumer",
             daemon=True)
         self._consumer.start()
@@ -45,7 +136,7 @@ class DelayProxy:
         # Start producer thread.
         self._producer = threading.Thread(
             target=self._run_producer,
-            args=(producer_port,),
+            args=(producer_sock,),
             name=self._proxy_name + "_producer",
             daemon=True)
         self._producer.start()
@@ -54,57 +145,122 @@ class DelayProxy:
         """Returns the length of the queue."""
         return len(self._queue)
 
-    def stop_proxy(self) -> None:
-        """Stop proxy and terminate producer and consumer therads."""
+    def get_queue_snapshot(self, start: int = 0, count: int = 10) -> dict:
+        """Returns a page of the messages in flight.
+
+        See :meth:`delay_server.util.queue.DelayQueue.snapshot`.
+        """
+        return self._queue.snapshot(start, count)
+
+    def get_received_count(self) -> int:
+        """Returns the number of frames received."""
+        return self._received
+
+    def get_queue_stats(self) -> dict:
+        """Returns the queue depth against its budget.
+
+        See :meth:`delay_server.util.queue.DelayQueue.stats`.
+        """
+        return self._queue.stats()
+
+    def stop_proxy(self) -> bool:
+        """Stop proxy and terminate producer and consumer therads.
+
+        Both threads are woken up so that they return as soon as they see
+        the flag. The ports and every client connection of each thread are
+        closed once it returned. A thread still running after
+        :attr:`_TIMEOUT` keeps its port open, since it may still use it.
+        Call again to wait for it once more.
+
+        Returns:
+            bool: True if both threads stopped.
+        """
         # Set flag to stop threads.
         self._stop.set()
 
         # Only applies to active threads.
-        if self._producer is not None and self._consumer is not None:
-            # Wait to allow threads to complete gracefully.
-            time.sleep(self._TIMEOUT)
+        for sock in (self._producer_sock, self._consumer_sock):
+            if sock is not None:
+                sock.wakeup()
 
-            # Join threads and destroy objects.
-            self._producer.join(self._TIMEOUT)
+        # Join threads and destroy objects.
+        if self._join(self._producer, self._producer_sock):
             self._producer = None
-            self._consumer.join(self._TIMEOUT)
+            self._producer_sock = None
+        if self._join(self._consumer, self._consumer_sock):
             self._consumer = None
+            self._consumer_sock = None
+        return self._producer is None and self._consumer is None
+
+    def _join(self, thread: threading.Thread,
+              sock: DelayServerSocket) -> bool:
+        """Wait for a thread and close its socket once it returned.
 
-    # TODO: Create sockets. If successful, then start the threads.
+        Returns:
+            bool: False if the thread is still running.
+        """
+        if thread is not None:
+            thread.join(self._TIMEOUT)
+            if thread.is_alive():
+                self._logger.warning('%s did not stop within %.1f sec.',
+                                     thread.name, self._TIMEOUT)
+                return False
+        if sock is not None:
+            sock.close()
+        return True
 
-    def _run_producer(self, port: int) -> None:
+    def _run_producer(self, sock: DelayServerSocket) -> None:
         """Procuer Thread. Receive messages and add them to the queue.
 
         Args:
-            port (int): Port used to receive messages.
+            sock (DelayServerSocket): Open socket used to receive messages.
         """
-        # Create and open socket.
-        sock = DelayServerSocket(self._logger)
-        sock.open(('', port))
+        set_thread_sched(self._producer_cpus, self._sched_policy,
+                         self._sched_priority, self._logger)
 
         i = 0
-        while not self._stop.isSet():
-            msg = sock.accept_and_recv()
-            if msg is not None:
-                self._queue.push(msg)
+        while not self._stop.is_set():
+            # Stop reading while the queue drains to push back on senders.
+            if self._queue.backpressure:
+                sock.pause_recv()
+            else:
+                sock.resume_recv()
+            for msg in sock.accept_and_recv():
+                self._queue.push(msg, msg.timestamp)
                 i += 1
+                self._received += 1
 
         self._logger.debug('Produced %d msgs', i)
 
-    def _run_consumer(self, port: int) -> None:
+    def _capture_packet(self, packet, timestamp: float) -> None:
+        """Record a received packet, including each fragment of large
+        messages, with its kernel receive time if known."""
+        if timestamp is not None:
+            timestamp = int(timestamp * 1e9)
+        self._capture.record(self._proxy_name, packet, timestamp)
+
+    def _run_consumer(self, sock: DelayServerSocket) -> None:
         """Consumer Thread. Take messages from queue and send them to client.
 
         Args:
-            port (int): Port used to send messages.
+            sock (DelayServerSocket): Open socket used to send messages.
         """
-        sock = DelayServerSocket(self._logger)
-        sock.open(('', port))
+        set_thread_sched(self._consumer_cpus, self._sched_policy,
+                         self._sched_priority, self._logger)
+
+        # Serve connections while waiting for the next message to be due.
+        def poll(secs):
+            sock.accept_and_send(None, secs)
 
         i = 0
-        while not self._stop.isSet():
+        while not self._stop.is_set():
             data = self._queue.pop()
-            if data is not None:
-                #print("Received: " + str(data))
-                i += 1
+            if data is None:
+                self._waiter.wait(self._queue.next_deadline(), poll)
+                continue
+            sock.accept_and_send(data)
+            i += 1
+            # Return the frame buffer to the pool.
+            data.release()
 
         self._logger.debug('Consumed %d msgs', i)
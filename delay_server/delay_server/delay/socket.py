@@ -1,48 +1,94 @@
 """Abstract socket server."""
 import abc
 import threading
-import struct
 import logging
 import socket
 import select
+import struct
+import sys
 import traceback
 
-# TODO: Convert code for bytearray (mutable) instead of bytes (immutable)
-
-from delay_server.util.crc16 import CRC16
+from delay_common import codec
+from delay_common.fragment import LargeMessage, Reassembler
+from delay_server.delay.delay import CommDelay
+from delay_server.util.buffer_pool import BufferPool, FrameBuffer
+from delay_server.util.clock import Clock
+from delay_server.util.conn_filter import ConnectionFilter
 from delay_server.util.exceptions import *
 
 
 class DelayServerSocket:
     """Extends socket class and implements packet communication protocol.
 
-    This class enforces the packet structure shown below:
-        
-    +----------------+----------------------------------+-----------+
-    | Primary Header | Packet Data                      | Footer    |
-    +----------------+----------------------------------+-----------+
-    | Length         | Optional Secondary Header + Data | CRC16     |
-    | (2 bytes)      | (1-1020 bytes)                   | (2 bytes) |
-    +----------------+----------------------------------+-----------+
+    The packet structure is implemented by :mod:`delay_common.codec`,
+    which is shared with the Delay Client.
+
+    Each connection starts in protocol version 1 and switches to version 2
+    once the client sends a hello packet, which is echoed back. Version 2
+    batches are queued and released as a single frame. On egress, frames
+    are converted for clients that negotiated a different version: batches
+    are split into version 1 packets and version 1 frames are wrapped in a
+    batch of one.
+
+    Version 2 clients can send messages larger than a packet as fragments.
+    They are reassembled per connection and queued as a single
+    :class:`delay_common.fragment.LargeMessage` once complete.
     """
 
     # https://steelkiwi.com/blog/working-tcp-sockets/
 
-    _HEADER_DEF = '! I'
-    HEADER_SIZE = struct.calcsize(_HEADER_DEF)
+    HEADER_SIZE = codec.HEADER_SIZE
+
+    FOOTER_SIZE = codec.FOOTER_SIZE
+
+    MAX_MSG_LEN = codec.MAX_MSG_LEN
 
-    _FOOTER_DEF = '! H'
-    FOOTER_SIZE = struct.calcsize(_FOOTER_DEF)
+    # Largest fragmented message accepted and size above which it is
+    # reassembled into a temporary file instead of memory.
+    MAX_LARGE_MSG_LEN = 64 << 20
+    SPILL_LEN = 4 << 20
 
-    MAX_MSG_LEN = 1024
+    # Size of the buffer used to read from client connections.
+    _RECV_SIZE = 65536
 
     _TIMEOUT = 0.01
 
-    def __init__(self, logger: logging.Logger = None):
+    # Kernel receive timestamps (Linux only). The option is not exported by
+    # the socket module. The control message carries a struct timespec.
+    KERNEL_TIMESTAMPS = sys.platform.startswith('linux') and \
+        hasattr(socket.socket, 'recvmsg_into')
+    _SO_TIMESTAMPNS = getattr(socket, 'SO_TIMESTAMPNS', 35)
+    _TIMESPEC = struct.Struct('@ll')
+
+    def __init__(self, logger: logging.Logger = None,
+                 pool: BufferPool = None, passthrough: bool = True,
+                 reverify: bool = False, kernel_timestamps: bool = False,
+                 clock: Clock = None, conn_filter: ConnectionFilter = None,
+                 on_packet=None, max_large_msg_len: int = None):
         """Initialize.
         
         Args:
             logger (logging.Logger): Logger associated with parent class.
+            pool (BufferPool): Optional; Pool of buffers for received frames.
+                If not provided, create one sized for :attr:`MAX_MSG_LEN`.
+            passthrough (bool): Send frames exactly as they were received
+                instead of encoding a new packet.
+            reverify (bool): Check the CRC again before sending a frame in
+                pass-through mode.
+            kernel_timestamps (bool): Timestamp received frames with the
+                time the kernel received them instead of when they are
+                read. Ignored if :attr:`KERNEL_TIMESTAMPS` is False.
+            clock (Clock): Optional; Clock that kernel timestamps are
+                converted to. Defaults to the clock of
+                :class:`delay_server.delay.delay.CommDelay` at the time.
+            conn_filter (ConnectionFilter): Optional; Rules deciding which
+                client addresses are accepted. Accept all if not provided.
+            on_packet (callable): Optional; Called with every packet read
+                from a client, as received and in order, and its kernel
+                receive time (or :class:`None`). For example, to capture
+                traffic. The packet is only valid during the call.
+            max_large_msg_len (int): Optional; Largest fragmented message
+                accepted. Defaults to :attr:`MAX_LARGE_MSG_LEN`.
         """
         # Socket object embedded within this class. 
         self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -55,6 +101,66 @@ class DelayServerSocket:
         # List of connections associated with this socket.
         self._connections = [self._sock]
 
+        # Packet encoder. Each socket is only used by one thread so it does
+        # not need a lock.
+        self._encoder = codec.FrameEncoder(self.MAX_MSG_LEN)
+
+        # Packet decoder for each client connection.
+        self._decoders = {}
+
+        # Protocol version negotiated by each client connection and the
+        # sequence number of the next batch or fragmented message sent to
+        # version 2 clients.
+        self._versions = {}
+        self._egress_seq = {}
+
+        # Large message reassembly for each version 2 client connection.
+        self._reassemblers = {}
+        self._max_large_msg_len = max_large_msg_len or self.MAX_LARGE_MSG_LEN
+
+        # Buffer used to read from client connections.
+        self._recv_buf = bytearray(self._RECV_SIZE)
+        self._recv_view = memoryview(self._recv_buf)
+
+        # Buffers for received frames. Sized for header + largest message.
+        self._pool = pool
+        if self._pool is None:
+            self._pool = BufferPool(self.HEADER_SIZE + self.MAX_MSG_LEN,
+                                    logger=self._logger)
+
+        # Egress options. See accept_and_send().
+        self._passthrough = passthrough
+        self._reverify = reverify
+
+        # When set, client connections are not polled for data so that TCP
+        # flow control pushes back on the sender.
+        self._recv_paused = False
+
+        # Kernel receive timestamps. If no clock, use the shared clock.
+        self._clock = clock
+        self._kernel_timestamps = kernel_timestamps and self.KERNEL_TIMESTAMPS
+        if kernel_timestamps and not self._kernel_timestamps:
+            self._logger.warning('Kernel timestamps not supported.')
+        self._anc_size = 0
+        if self._kernel_timestamps:
+            self._anc_size = socket.CMSG_SPACE(self._TIMESPEC.size)
+        # Number of reads that carried no kernel timestamp. Their frames are
+        # timestamped when queued instead.
+        self._untimed = 0
+
+        # Client address filter and number of connections it rejected.
+        self._filter = conn_filter
+        self._rejected = 0
+
+        # Observer of the packets received.
+        self._on_packet = on_packet
+
+        # Socket pair polled with the connections so that another thread
+        # can interrupt a wait. Created when the socket is opened.
+        self._wakeup_recv = None
+        self._wakeup_send = None
+        self._wakeup_list = []
+
     def open(self, address: tuple, timeout: int = None):
         """Start listening for connections on the server socket.
 
@@ -85,170 +191,397 @@ class DelayServerSocket:
         self._sock.settimeout(timeout)
         self._sock.bind(address)
         self._sock.listen()
+        if self._wakeup_recv is None:
+            self._wakeup_recv, self._wakeup_send = socket.socketpair()
+            self._wakeup_recv.setblocking(False)
+            self._wakeup_send.setblocking(False)
+            self._wakeup_list = [self._wakeup_recv]
         self._logger.info("Listening on port %s", address)
         
     def close(self):
-        """Shutdown and close the socket. 
+        """Close every client connection and the server socket.
         
         Catches socket errors and reports them in the log. 
         """
+        for i_sock in self._connections[1:]:
+            self._remove_connection(i_sock)
         try:
-            if len(self._connections) > 1:
-                self._sock.shutdown(socket.SHUT_RDWR)
             self._sock.close()
         except OSError as e:
             self._logger.error(e)
             traceback.print_exc()
+        if self._wakeup_recv is not None:
+            self._wakeup_recv.close()
+            self._wakeup_send.close()
+            self._wakeup_list = []
         self._logger.info("Closed port.")
 
+    def wakeup(self) -> None:
+        """Interrupt :meth:`accept_and_recv` or :meth:`accept_and_send`
+        waiting in another thread.
+
+        The wait returns early without data. Does nothing if the socket is
+        not open.
+        """
+        try:
+            self._wakeup_send.send(b'\x00')
+        except (AttributeError, OSError):
+            # Not open, closed, or a wake-up is already pending.
+            pass
+
+    def _clear_wakeup(self) -> None:
+        """Discard pending wake-ups."""
+        try:
+            while self._wakeup_recv.recv(64):
+                pass
+        except OSError:
+            pass
+
     def _send_packet(self, sock: socket.socket, raw_data: bytearray) -> int:
         """Assemble a packet and send it.
 
+        The header, data and footer are sent with a single scatter-gather
+        call, so the data is never copied into a new packet. See
+        :class:`delay_common.codec.FrameEncoder`.
+
         Args:
             raw_data (bytearray): Data.
 
         Returns:
-            int: Number of bytes sent.
+            int: Number of bytes sent. Less than the packet length if the
+                socket timed out before the whole packet was sent.
 
         Raises:
             AttributeError: raw_data is None.
-            TypeError: raw_data is not :class:`bytearray` or :class:`bytes`.
+            TypeError: raw_data is not :class:`bytearray`, :class:`bytes`
+                or :class:`memoryview`.
             SocketSendEmptyPkt: raw_data length cannot be zero.
             SocketSendPktInvalidLength: raw_data exceeds allowed pkt length.
-            struct.error: Cannot create struct to build bytearray packet.
         """
-        if raw_data is None:
-            raise AttributeError("Socket send data cannot be None.")
-
-        if not isinstance(raw_data, (bytes, bytearray)):
-            raise TypeError("Socket send data must be a bytes or bytearray.")
-
-        if not len(raw_data):
-            raise SocketSendEmptyMessage()
-
-        # Calculate message length including packet footer.
-        msg_len = len(raw_data) + self.FOOTER_SIZE
-        if msg_len > self.MAX_MSG_LEN:
-            raise SocketSendPktInvalidLength()
+        bytes_sent = self._encoder.send(sock, raw_data)
+        if bytes_sent < self.HEADER_SIZE + len(raw_data) + self.FOOTER_SIZE:
+            self._logger.warning('Partial message sent')
+        return bytes_sent
 
-        # Throws struct.error if it cannot assemble the message.
-        raw_hdr = bytearray(struct.pack(self._HEADER_DEF, msg_len))
+    def accept_and_send(self, frame: FrameBuffer = None,
+                        timeout: float = None) -> int:
+        """Accept new connections and send a frame to every client.
 
-        # Calc CRC on packet header + body
-        calc_crc = CRC16.calc_crc(raw_hdr)
-        calc_crc = CRC16.calc_crc(raw_data, calc_crc)
+        Waits up to the timeout for new connections if there is no frame to
+        send. Data received from clients is discarded.
 
-        # Throws struct.error if it cannot assemble the message.
-        raw_ftr = bytearray(struct.pack(self._FOOTER_DEF, calc_crc))
+        In pass-through mode the frame is written out exactly as it was
+        received, without rebuilding the header and footer. Otherwise the
+        data is encoded into a new packet.
 
-        # Concatenate message header, body, and data
-        raw_pkt = raw_hdr + raw_data + raw_ftr
-        bytes_sent = sock.send(raw_pkt)
-        if bytes_sent < msg_len:
-            self._logger.warning('Partial message sent')
+        Args:
+            frame (FrameBuffer): Optional; Frame to send.
+            timeout (float): Optional; Time (in sec) to wait for connections
+                when there is no frame. Defaults to the socket timeout.
 
-        return bytes_sent
-    
-    def accept_and_send(self):
-        msg = None
+        Returns:
+            int: Number of clients the frame was sent to.
+        """
+        if frame is not None:
+            timeout = 0
+        elif timeout is None:
+            timeout = self._TIMEOUT
         sock_read, _, sock_exception = \
-            select.select(self._connections, [],
+            select.select(self._connections + self._wakeup_list, [],
                           self._connections,
-                          self._TIMEOUT)
+                          timeout)
         for i_sock in sock_read:
-            # Accept new connections to receive messages
+            # Accept new connections to send messages
             if i_sock is self._sock:
-                i_client_socket, i_client_address = self._sock.accept()
-                self._connections.append(i_client_socket)
-                self._logger.info('New connection from %s', i_client_address)
+                i_client_socket = self._accept()
+                if i_client_socket is not None:
+                    self._connections.append(i_client_socket)
+            elif i_sock is self._wakeup_recv:
+                self._clear_wakeup()
             else:
-                msg = self._recv_packet(i_sock)
+                # Clients only send hello packets. Anything else is dropped.
+                for i_frame in self._recv_packets(i_sock):
+                    i_frame.release()
         for i_sock in sock_exception:
-            print(f"Removing {i_sock}")
-            self._connections.remove(i_sock)
-        return msg    
+            self._remove_connection(i_sock)
+
+        if frame is None:
+            return 0
+
+        if self._passthrough and self._reverify and \
+                isinstance(frame, FrameBuffer) and \
+                not codec.verify(frame.packet):
+            self._logger.warning('Egress CRC check failed. Dropped frame.')
+            return 0
+
+        num_sent = 0
+        for i_sock in self._connections[1:]:
+            try:
+                if self._send_frame(i_sock, frame):
+                    num_sent += 1
+            except OSError as e:
+                self._logger.warning('Send error %s', e)
+                self._remove_connection(i_sock)
+        return num_sent
+
+    @property
+    def untimed(self) -> int:
+        """Number of reads without a kernel timestamp."""
+        return self._untimed
+
+    @property
+    def rejected(self) -> int:
+        """Number of connections rejected by the address filter."""
+        return self._rejected
+
+    def _accept(self) -> socket.socket:
+        """Accept a connection if the address filter allows it.
+
+        Rejected connections are closed before any data is read from them.
 
-    def _recv_packet(self, sock: socket.socket):
-        """Receive a message."""
-
-        raw_hdr = sock.recv(self.HEADER_SIZE)
-
-        # Check for empty message header
-        if not raw_hdr:
+        Returns:
+            socket.socket: Client connection, or :class:`None` if rejected.
+        """
+        i_client_socket, i_client_address = self._sock.accept()
+        if self._filter is not None and \
+                not self._filter.allowed(i_client_address[0]):
+            i_client_socket.close()
+            self._rejected += 1
+            self._logger.debug('Rejected connection from %s',
+                               i_client_address)
             return None
+        self._logger.info('New connection from %s', i_client_address)
+        return i_client_socket
 
-        # Check for incomplete message header
-        if len(raw_hdr) < self.HEADER_SIZE:
-            self._logger.warning('MsgHdr len=%d < exp=%d',
-                           len(raw_hdr), self.HEADER_SIZE)
-            return None
+    def _send_frame(self, sock: socket.socket, frame: FrameBuffer) -> bool:
+        """Send a frame to a client in its negotiated protocol version.
 
-        # Parse message header
-        try:
-            # Unpack the header.
-            msg_hdr = struct.unpack(self._HEADER_DEF, raw_hdr)
-            # Extract message length
-            msg_size = int(msg_hdr[0])
-        except struct.error:
-            self._logger.warning('MsgHdr parse error')
-            return None
+        Args:
+            sock (socket.socket): Client connection.
+            frame (FrameBuffer): Frame or
+                :class:`delay_common.fragment.LargeMessage` to send.
 
-        # Validate message length
-        if msg_size > self.MAX_MSG_LEN:
-            self._logger.warning('MsgData invalid len=%d', msg_size)
-            return None
+        Returns:
+            bool: False if the frame cannot be represented in the client's
+                protocol version.
+        """
+        version = self._versions.get(sock, 1)
+        if isinstance(frame, LargeMessage):
+            if version == 1:
+                self._logger.warning('Message too long for version 1.')
+                return False
+            for frag in frame.fragments(self._next_seq(sock)):
+                self._send_packet(sock, frag)
+        elif version == frame.version:
+            if self._passthrough:
+                sock.sendall(frame.packet)
+            else:
+                self._send_packet(sock, frame.data)
+        elif version == 1:
+            # Split the batch into individual packets.
+            _, msgs = codec.decode_batch(frame.data)
+            for msg in msgs:
+                if len(msg) > 0:
+                    self._send_packet(sock, msg)
+        else:
+            msgs = [frame.data]
+            if codec.batch_size(msgs) > self.MAX_MSG_LEN - self.FOOTER_SIZE:
+                self._logger.warning('Frame too long for version 2 batch.')
+                return False
+            self._send_packet(sock, codec.encode_batch(self._next_seq(sock),
+                                                       msgs))
+        return True
+
+    def _next_seq(self, sock: socket.socket) -> int:
+        """Return the next batch sequence number or message ID for a
+        version 2 client."""
+        seq = self._egress_seq.get(sock, 0)
+        self._egress_seq[sock] = (seq + 1) & 0xFFFFFFFF
+        return seq
+
+    def _recv_packets(self, sock: socket.socket) -> list:
+        """Receive available data from a client and extract its packets.
+
+        Verified packets are copied once from the receive buffer into
+        buffers from the pool. Closes the connection if the client
+        disconnected.
 
-        # Get message data
-        raw_data = sock.recv(msg_size)
+        Args:
+            sock (socket.socket): Client connection.
 
-        # Check for empty message data
-        if not raw_data:
-            self._logger.warning('MsgData is empty')
-            return None
+        Returns:
+            list: :class:`delay_server.util.buffer_pool.FrameBuffer` for
+                each packet received and
+                :class:`delay_common.fragment.LargeMessage` for each
+                fragmented message completed. The caller owns them and must
+                release them when done. With kernel timestamps enabled,
+                their timestamp is the arrival time of the data that
+                completed them.
+        """
+        timestamp = None
+        try:
+            if self._kernel_timestamps:
+                num_bytes, ancdata, _, _ = sock.recvmsg_into(
+                    [self._recv_view], self._anc_size)
+                timestamp = self._kernel_time(ancdata)
+                if timestamp is None and num_bytes:
+                    if not self._untimed:
+                        self._logger.warning(
+                            'Received data without kernel timestamp.')
+                    self._untimed += 1
+            else:
+                num_bytes = sock.recv_into(self._recv_view)
+        except OSError as e:
+            self._logger.warning('Recv error %s', e)
+            num_bytes = 0
+
+        if not num_bytes:
+            self._remove_connection(sock)
+            return []
+
+        decoder = self._decoders.get(sock)
+        if decoder is None:
+            decoder = self._add_decoder(sock)
+        frames = decoder.feed(self._recv_view[:num_bytes])
+
+        version = self._versions.get(sock, 1)
+        ret = []
+        for frame in frames:
+            frame.timestamp = timestamp
+            if self._on_packet is not None:
+                self._on_packet(frame.packet, timestamp)
+            if frame.data == codec.HELLO_V2:
+                self._negotiate(sock)
+                version = 2
+                frame.release()
+            elif version == 2 and frame.data[0] == codec.TYPE_FRAGMENT:
+                try:
+                    msg = self._reassemblers[sock].add(frame.data)
+                except ValueError as e:
+                    self._logger.warning('Dropped fragment. %s', e)
+                    msg = None
+                frame.release()
+                if msg is not None:
+                    msg.timestamp = timestamp
+                    ret.append(msg)
+            elif version == 2:
+                try:
+                    codec.decode_batch(frame.data)
+                except ValueError as e:
+                    self._logger.warning('Dropped invalid batch. %s', e)
+                    frame.release()
+                    continue
+                frame.version = 2
+                ret.append(frame)
+            else:
+                ret.append(frame)
+        return ret
 
-        # Check for incomplete message data
-        if len(raw_data) < msg_size:
-            self._logger.warning('MsgData len=%d < exp=%d',
-                                 len(raw_data), msg_size)
-            return None
+    def _negotiate(self, sock: socket.socket) -> None:
+        """Switch a client connection to protocol version 2.
 
-        # Parse message data/footer
+        Echoes the hello packet to confirm the client can start sending
+        batches.
+        """
+        self._versions[sock] = 2
+        self._egress_seq[sock] = 0
+        self._reassemblers[sock] = Reassembler(self._max_large_msg_len,
+                                               self.SPILL_LEN,
+                                               logger=self._logger)
         try:
-            struct_def = '! ' + str(msg_size-self.FOOTER_SIZE) + 's H'
-            msg_data = struct.unpack(struct_def, raw_data)
-            msg_crc = msg_data[1]
-        except struct.error:
-            self._logger.warning('MsgData parse error')
-            return None
-
-        calc_crc = CRC16.calc_crc(raw_hdr)
-        calc_crc = CRC16.calc_crc(msg_data[0], calc_crc)
+            self._send_packet(sock, codec.HELLO_V2)
+        except OSError as e:
+            self._logger.warning('Send error %s', e)
+        self._logger.info('Connection %s negotiated protocol version 2.',
+                          sock.fileno())
+
+    def _kernel_time(self, ancdata: list) -> float:
+        """Return the kernel receive time from the control messages, or
+        :class:`None` if there is none."""
+        for level, msg_type, data in ancdata:
+            if level == socket.SOL_SOCKET and \
+                    msg_type == self._SO_TIMESTAMPNS and \
+                    len(data) >= self._TIMESPEC.size:
+                sec, nsec = self._TIMESPEC.unpack_from(data)
+                clock = self._clock
+                if clock is None:
+                    clock = CommDelay().clock
+                return clock.from_realtime_ns(sec * 1000000000 + nsec)
+        return None
+
+    def _add_decoder(self, sock: socket.socket) -> codec.FrameDecoder:
+        """Create the packet decoder for a client connection."""
+        decoder = codec.FrameDecoder(self.MAX_MSG_LEN, self._pool.acquire,
+                                     self._logger)
+        self._decoders[sock] = decoder
+        return decoder
+
+    def _remove_connection(self, sock: socket.socket) -> None:
+        """Close a client connection and discard its partial packets."""
+        if sock in self._connections:
+            self._connections.remove(sock)
+            self._logger.info('Closed connection %s', sock.fileno())
+        self._decoders.pop(sock, None)
+        self._versions.pop(sock, None)
+        self._egress_seq.pop(sock, None)
+        reassembler = self._reassemblers.pop(sock, None)
+        if reassembler is not None:
+            reassembler.clear()
+        sock.close()
+
+    @property
+    def recv_paused(self) -> bool:
+        """True while client connections are not being read."""
+        return self._recv_paused
+
+    def pause_recv(self) -> None:
+        """Stop reading from client connections.
+
+        The client sockets are removed from the poller. Unread data
+        accumulates in the kernel buffers until TCP flow control stops the
+        sender. New connections are still accepted.
+        """
+        if not self._recv_paused:
+            self._recv_paused = True
+            self._logger.warning('Paused receiving from %d connections.',
+                                 len(self._connections) - 1)
 
-        if calc_crc != msg_crc:
-            self._logger.warning("Msg CRC recv=%04x != exp=%04x",
-                                 msg_crc, calc_crc)
-            return None
+    def resume_recv(self) -> None:
+        """Resume reading from client connections."""
+        if self._recv_paused:
+            self._recv_paused = False
+            self._logger.info('Resumed receiving from %d connections.',
+                              len(self._connections) - 1)
 
-        # Returns mutable bytearray
-        return bytearray(raw_data[:-2])
+    def accept_and_recv(self) -> list:
+        """Accept new connections and receive packets.
 
-    def accept_and_recv(self):
-        """Accept new connections and receive packets."""
-        msg = None
+        Returns:
+            list: Packets received. See :meth:`_recv_packets`.
+        """
+        msgs = []
+        poll_list = self._connections
+        if self._recv_paused:
+            poll_list = [self._sock]
         sock_read, _, sock_exception = \
-            select.select(self._connections,
+            select.select(poll_list + self._wakeup_list,
                           [],
-                          self._connections,
+                          poll_list,
                           self._TIMEOUT)
         for i_sock in sock_read:
             # Accept new connections to receive messages
             if i_sock is self._sock:
-                i_client_socket, i_client_address = self._sock.accept()
+                i_client_socket = self._accept()
+                if i_client_socket is None:
+                    continue
+                if self._kernel_timestamps:
+                    i_client_socket.setsockopt(socket.SOL_SOCKET,
+                                               self._SO_TIMESTAMPNS, 1)
                 self._connections.append(i_client_socket)
-                self._logger.info('New connection from %s', i_client_address)
+            elif i_sock is self._wakeup_recv:
+                self._clear_wakeup()
             else:
-                msg = self._recv_packet(i_sock)
+                msgs.extend(self._recv_packets(i_sock))
         for i_sock in sock_exception:
-            print(f"Removing {i_sock}")
-            self._connections.remove(i_sock)
-        return msg
+            self._remove_connection(i_sock)
+        return msgs
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+
+import tkinter as tk
+
+
+class Chart:
+    """Line chart drawn on a Tk canvas.
+
+    The canvas items (one line per series, the frame and the labels) are
+    created once. Each update only moves the existing lines with
+    :meth:`tk.Canvas.coords` and changes the labels whose text changed.
+    """
+
+    # Margin in pixels around the plot area.
+    _MARGIN = 4
+
+    # Colors assigned to the series in order.
+    COLORS = ('yellow', 'cyan', 'magenta', 'white', 'orange', 'lime')
+
+    def __init__(self, parent, title: str, series: list,
+                 width: int = 300, height: int = 100):
+        """Create the canvas and its items.
+
+        Args:
+            parent (tk.Widget): Parent widget.
+            title (str): Chart title.
+            series (list): Names of the series, one line each.
+            width (int): Width in pixels.
+            height (int): Height in pixels.
+        """
+        self._title = title
+        self._width = width
+        self._height = height
+        self._canvas = tk.Canvas(parent, width=width, height=height,
+                                 bg='black', highlightthickness=0)
+        self._canvas.pack(fill=tk.X, expand=False)
+
+        self._lines = {}
+        for i, name in enumerate(series):
+            self._lines[name] = self._canvas.create_line(
+                0, 0, 0, 0, fill=self.COLORS[i % len(self.COLORS)])
+        self._label = self._canvas.create_text(
+            self._MARGIN, self._MARGIN, anchor='nw', fill='white',
+            font='TkSmallCaptionFont', text=title)
+        self._label_text = title
+
+    def update(self, series: dict, start: float, end: float) -> None:
+        """Redraw the lines.
+
+        Args:
+            series (dict): Times and values of each series.
+            start (float): Time at the left edge.
+            end (float): Time at the right edge.
+        """
+        v_max = 0.0
+        for _, values in series.values():
+            if values:
+                v_max = max(v_max, max(values))
+
+        for name, (times, values) in series.items():
+            item = self._lines.get(name)
+            if item is None:
+                continue
+            coords = self.scale(times, values, start, end, v_max,
+                                self._width, self._height, self._MARGIN)
+            # A line needs at least two points.
+            if len(coords) < 4:
+                coords = [0, 0, 0, 0]
+            self._canvas.coords(item, coords)
+
+        text = f"{self._title} (max {v_max:,.0f})"
+        if text != self._label_text:
+            self._label_text = text
+            self._canvas.itemconfigure(self._label, text=text)
+
+    @staticmethod
+    def scale(times: list, values: list, start: float, end: float,
+              v_max: float, width: int, height: int,
+              margin: int = 0) -> list:
+        """Convert points to canvas coordinates.
+
+        Args:
+            times (list): Time of each point.
+            values (list): Value of each point.
+            start (float): Time at the left edge.
+            end (float): Time at the right edge.
+            v_max (float): Value at the top edge. Zero is at the bottom.
+            width (int): Canvas width in pixels.
+            height (int): Canvas height in pixels.
+            margin (int): Margin in pixels on each side.
+
+        Returns:
+            list: Flat list of x and y coordinates.
+        """
+        x_scale = (width - 2 * margin) / max(end - start, 1e-9)
+        y_scale = (height - 2 * margin) / v_max if v_max > 0 else 0
+        bottom = height - margin
+        coords = []
+        for time, value in zip(times, values):
+            coords.append(margin + (time - start) * x_scale)
+            coords.append(bottom - value * y_scale)
+        return coords
@@ -2,19 +2,20 @@
 # -*- coding: utf-8 -*-
 
 import logging
-import queue
 import tkinter as tk
 from tkinter.scrolledtext import ScrolledText
 
-from delay_server.util.log_handler import QueueLogHandler
+from delay_server.util.log_ring import LogRing
 
 
 class LoggingFrame:
-    """Class sends logging records to a queue that can be retrieved from a GUI.
+    """Class displays the log messages the server writes to a shared memory
+    ring. See :class:`delay_server.util.log_ring.LogRing`.
     """
 
-    def __init__(self, frame):
+    def __init__(self, frame, ring: LogRing):
         self._frame = frame
+        self._ring = ring
 
         self._scrolled_text = ScrolledText(frame,
                                            state='disabled', padx=5, pady=5,
@@ -28,28 +29,15 @@ class LoggingFrame:
         self._scrolled_text.tag_config('ERROR', foreground='orange')
         self._scrolled_text.tag_config('CRITICAL', foreground='red')
 
-        # Create a logging handler using a queue
-        self._log_queue = queue.Queue()
-        self._queue_handler = QueueLogHandler(self._log_queue)
-        formatter = logging.Formatter('%(asctime)s: %(message)s')
-        self._queue_handler.setFormatter(formatter)
-        logger = logging.getLogger()
-        logger.setLevel(logging.DEBUG)
-        logger.addHandler(self._queue_handler)
-
     def update(self):
-        while True:
-            try:
-                record = self._log_queue.get(block=False)
-            except queue.Empty:
-                break
-            else:
-                self._display(record)
-
-    def _display(self, record: logging.LogRecord) -> None:
-        msg = self._queue_handler.format(record)
+        """Display new log messages, if any."""
+        records = self._ring.read()
+        if not records:
+            return
         self._scrolled_text.configure(state='normal')
-        self._scrolled_text.insert(tk.END, '> ' + msg + '\n', record.levelname)
+        for level, msg in records:
+            self._scrolled_text.insert(tk.END, '> ' + msg + '\n',
+                                       logging.getLevelName(level))
         self._scrolled_text.configure(state='disabled')
         # Automatically scrolls to the bottom.
         self._scrolled_text.yview(tk.END)
@@ -1,92 +1,248 @@
 # -*- coding: utf-8 -*-
 
 import tkinter as tk
-import time
-import threading
 import datetime
-import logging
+import multiprocessing
+import time
 
 #from delay_sever.delay.config import DelayConfig
+from delay_server.gui.chart import Chart
 from delay_server.gui.logging_frame import LoggingFrame
+from delay_server.util.history import History
+from delay_server.util.log_ring import LogRing
+from delay_server.util.shared_stats import SharedStats
 
 
 class ServerApp(tk.Frame):
     """GUI for Delay Emulation Server.
+
+    The GUI runs in its own process, started with :func:`start_gui`, and
+    only reads the statistics and log messages the server publishes to
+    shared memory.
     """
 
     # Window dimensions in pixels
     _HEIGHT = 600
     _WIDTH = 800
 
-    def __init__(self, root):
+    # Time span of the charts in seconds.
+    _CHART_WINDOW = 3600
+
+    # Statistic and title of each chart.
+    _CHARTS = (('msgs', 'Queue depth (msgs)'),
+               ('rate_in', 'Frames/s received'),
+               ('bytes', 'Buffer memory in use'))
+
+    def __init__(self, root, stats: SharedStats, log_ring: LogRing,
+                 refresh: float = 1.0):
+        """Initialize GUI.
+
+        Args:
+            root (tk.Tk): Root window.
+            stats (SharedStats): Statistics published by the server.
+            log_ring (LogRing): Log messages written by the server.
+            refresh (float): Time between display updates in seconds.
+        """
         super().__init__(root)
         self._root = root
+        self._stats = stats
+        self._log_ring = log_ring
+        self._refresh_ms = max(1, int(refresh * 1000))
         self._root.title('Delay Emulation Server')
         self._root.geometry(f'{self._WIDTH}x{self._HEIGHT}')
         self._root.minsize(self._WIDTH, self._HEIGHT)
         self._root.configure(background='black')
 
         self._date_str = tk.StringVar()
+        self._met_str = tk.StringVar()
+        self._inspect_str = tk.StringVar()
+
+        # Text shown by each label, to only update those that changed.
+        self._shown = {}
+
+        # Last statistics displayed and their sequence number.
+        self._last_stats = None
+        self._stats_seq = None
+
+        # History of each charted statistic of each link.
+        self._history = {(link, key): History()
+                         for link in self._stats.links
+                         for key, _ in self._CHARTS}
+
         self._create_widgets()
-        self._start_update_threads()
+
+        # Update the display from the Tk main loop.
+        self._after_id = self._root.after(0, self._update_display)
 
         # Register function to call when closing the application.
         self._root.protocol('WM_DELETE_WINDOW', self._on_close)
 
     def _on_close(self):
         """Called when closing the application."""
-        self._timer.cancel()
+        self._root.after_cancel(self._after_id)
         self._root.destroy()
 
     def _create_widgets(self):
         display_frame = tk.Frame(self._root, width=self._WIDTH, height=300, bg="orange")
         display_frame.pack(fill=tk.BOTH, expand=True)
 
-        stats_frame = tk.Frame(self._root, width=200, height=300, bg="green")
+        stats_frame = tk.Frame(self._root, width=320, height=300, bg="green")
         stats_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=False)
 
+        # One label per link.
+        self._link_str = {}
+        for name in self._stats.links:
+            self._link_str[name] = tk.StringVar()
+            link_label = tk.Label(stats_frame,
+                                  textvariable=self._link_str[name],
+                                  justify=tk.LEFT, anchor="nw", bg="green")
+            link_label.pack(fill=tk.X, expand=False)
+
+        # One chart per statistic with a line per link.
+        self._charts = {key: Chart(stats_frame, title, self._stats.links)
+                        for key, title in self._CHARTS}
+
         log_frame = tk.Frame(self._root, bg="blue")
         log_frame.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        self._log_frame = LoggingFrame(log_frame)
+        self._log_frame = LoggingFrame(log_frame, self._log_ring)
 
-        met_label = tk.Label(display_frame, text="MET = 2021-06-15 12:34:56")
+        met_label = tk.Label(display_frame, textvariable=self._met_str)
         met_label.place(relx=0.5, height=20, y=10, anchor="c")
 
         self._lbl1 = tk.Label(display_frame, textvariable=self._date_str)
         self._lbl1.place(relx=0.5, rely=0.5, anchor="c")
 
+        # Oldest and newest messages in flight with their countdown.
+        inspect_label = tk.Label(display_frame,
+                                 textvariable=self._inspect_str,
+                                 justify=tk.LEFT, anchor="nw",
+                                 font='TkFixedFont', bg="orange")
+        inspect_label.place(x=10, y=30)
+
         #button = tk.Button(display_frame, text="Click me!", command=self.do_something)
         #button.place(relx=0.6, rely=0.6, anchor="c")
-        
-    def _start_update_threads(self):
-        self._timer = threading.Timer(1.0, self._update_display)
-        self._timer.setDaemon(True)
-        self._timer.start()
-
 
     def _update_display(self):
-        # Catch RuntimeErrors if the application is closed while the 
-        # timer is still running.
-        try:
-            curr_time = datetime.datetime.today()
-            curr_time_str = curr_time.strftime('%Y-%m-%d %H:%M:%S')
-            self._date_str.set(curr_time_str)
-    
-            self._log_frame.update()
-            logger = logging.getLogger()
-            logger.error('ERROR')
-            logger.warning('WARNING')
-            logger.info('INFO')
-            logger.debug('DEBUG')
-            logger.critical('CRITICAL')
-        except RuntimeError:
-            pass
-            
-        self._timer = threading.Timer(1.0, self._update_display)
-        self._timer.setDaemon(True)
-        self._timer.start()
-
-if __name__ == '__main__':
+        """Refresh the display and schedule the next refresh."""
+        curr_time = datetime.datetime.today()
+        self._set(self._date_str, curr_time.strftime('%Y-%m-%d %H:%M:%S'))
+
+        # Nothing to redraw until the server publishes new statistics.
+        stats = self._stats.read()
+        if stats is not None and stats['seq'] != self._stats_seq:
+            self._last_stats = stats
+            self._stats_seq = stats['seq']
+            self._set(self._met_str, self._format_met(stats))
+            for name, link in stats['links'].items():
+                self._set(self._link_str[name],
+                          self._format_link(name, link))
+            self._update_charts(stats)
+
+        # Countdowns move on between updates from the server.
+        if self._last_stats is not None:
+            self._set(self._inspect_str,
+                      self._format_inspector(self._last_stats, time.time()))
+
+        self._log_frame.update()
+        self._after_id = self._root.after(self._refresh_ms,
+                                          self._update_display)
+
+    def _update_charts(self, stats: dict) -> None:
+        """Add the new statistics to the history and redraw the charts."""
+        now = stats['updated']
+        for name, link in stats['links'].items():
+            for key, _ in self._CHARTS:
+                self._history[(name, key)].add(now, link[key])
+
+        start = now - self._CHART_WINDOW
+        for key, chart in self._charts.items():
+            series = {}
+            for name in stats['links']:
+                _, times, values = self._history[(name, key)].series(
+                    self._CHART_WINDOW, now)
+                series[name] = (times, values)
+            chart.update(series, start, now)
+
+    def _set(self, var: tk.StringVar, text: str) -> None:
+        """Update a label only if its text changed."""
+        if self._shown.get(str(var)) != text:
+            self._shown[str(var)] = text
+            var.set(text)
+
+    @staticmethod
+    def _format_met(stats: dict) -> str:
+        """Return mission elapsed time and current delay."""
+        met = datetime.timedelta(seconds=int(stats['met']))
+        return f"MET = {met}   Delay = {stats['delay']:.1f} sec"
+
+    @staticmethod
+    def _format_inspector(stats: dict, now: float) -> str:
+        """Return the oldest and newest messages in flight of each link,
+        with the time left until their release."""
+        elapsed = now - stats['updated']
+        lines = []
+        for name, link in stats['links'].items():
+            for title in ('oldest', 'newest'):
+                if not link[title]:
+                    continue
+                lines.append(f"{name} {title}:")
+                for entry in link[title]:
+                    remaining = max(0, int(entry['remaining'] - elapsed))
+                    lines.append(f"  #{entry['index']:<8d} "
+                                 f"{entry['size']:6d} B  release in "
+                                 f"{datetime.timedelta(seconds=remaining)}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _format_link(name: str, link: dict) -> str:
+        """Return queue depth against the budget and rates of a link."""
+        lines = [f"{name}: {link['msgs']}/{link['max_msgs']} msgs",
+                 f"  {link['bytes']}/{link['max_bytes']} bytes "
+                 f"({link['fill']:.0%})",
+                 f"  {link['rate_in']:.0f} in, "
+                 f"{link['rate_out']:.0f} out frames/s",
+                 f"  dropped {link['dropped_oldest']} oldest, "
+                 f"{link['dropped_newest']} newest"]
+        if link['backpressure']:
+            lines.append("  BACKPRESSURE")
+        return "\n".join(lines)
+
+
+def run_gui(stats_name: str, log_name: str, refresh: float = 1.0) -> None:
+    """Attach to the shared memory published by the server and run the GUI
+    until the window is closed.
+
+    Args:
+        stats_name (str): Name of the :class:`SharedStats` block.
+        log_name (str): Name of the :class:`LogRing`.
+        refresh (float): Time between display updates in seconds.
+    """
+    stats = SharedStats(stats_name)
+    log_ring = LogRing(log_name)
     root = tk.Tk()
-    app = ServerApp(root)
+    app = ServerApp(root, stats, log_ring, refresh)
     app.mainloop()
+    stats.close()
+    log_ring.close()
+
+
+def start_gui(stats_name: str, log_name: str,
+              refresh: float = 1.0) -> multiprocessing.Process:
+    """Run the GUI in a new process.
+
+    The process is spawned rather than forked so that it does not inherit
+    the state of the proxy threads.
+
+    Args:
+        stats_name (str): Name of the :class:`SharedStats` block.
+        log_name (str): Name of the :class:`LogRing`.
+        refresh (float): Time between display updates in seconds.
+
+    Returns:
+        multiprocessing.Process: GUI process.
+    """
+    process = multiprocessing.get_context('spawn').Process(
+        target=run_gui, args=(stats_name, log_name, refresh), name='gui',
+        daemon=True)
+    process.start()
+    return process
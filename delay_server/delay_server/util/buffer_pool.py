@@ -0,0 +1,176 @@
+"""Pool of fixed-size frame buffers."""
+import collections
+import logging
+import threading
+
+
+class FrameBuffer:
+    """Fixed-size buffer holding one frame received from a socket.
+
+    Buffers are obtained from :meth:`BufferPool.acquire` and filled by
+    :class:`delay_common.codec.FrameDecoder`. The owner must call
+    :meth:`release` once the frame is no longer needed to return the buffer
+    to its pool.
+
+    The buffer holds the complete frame as received (header, data and
+    footer). Attribute :attr:`size` is the number of bytes filled and
+    the data section is delimited by :attr:`start` and :attr:`end`.
+    Attribute :attr:`version` is the protocol version of the frame (see
+    :mod:`delay_common.codec`) and :attr:`timestamp` the kernel arrival
+    time, if known.
+    """
+
+    __slots__ = ('_pool', 'buffer', 'view', 'size', 'start', 'end',
+                 'in_pool', 'version', 'timestamp')
+
+    def __init__(self, pool: 'BufferPool', capacity: int):
+        """Initialize an empty buffer.
+
+        Args:
+            pool (BufferPool): Pool that owns this buffer.
+            capacity (int): Buffer size in bytes.
+        """
+        self._pool = pool
+        self.buffer = bytearray(capacity)
+        self.view = memoryview(self.buffer)
+        self.size = 0
+        self.start = 0
+        self.end = 0
+        self.in_pool = False
+        self.version = 1
+        self.timestamp = None
+
+    @property
+    def capacity(self) -> int:
+        """Size in bytes of the buffer, which is the memory held by the
+        frame whatever its length."""
+        return len(self.buffer)
+
+    @property
+    def data(self) -> memoryview:
+        """View of the data section. Only valid until :meth:`release`."""
+        return self.view[self.start:self.end]
+
+    @property
+    def packet(self) -> memoryview:
+        """View of the complete frame as received. Only valid until
+        :meth:`release`."""
+        return self.view[:self.size]
+
+    def release(self) -> None:
+        """Return buffer to the pool."""
+        self._pool.release(self)
+
+    def __len__(self) -> int:
+        """Return length of the data section."""
+        return self.end - self.start
+
+
+class BufferPool:
+    """Thread-safe pool of :class:`FrameBuffer` objects.
+
+    Buffers are preallocated and recycled to avoid allocating and copying
+    data for every frame. If the pool runs out, new buffers are allocated
+    and added to the pool once released. Buffers released while the pool
+    already holds ``max_free`` free buffers are dropped, so the pool
+    shrinks back after a burst.
+    """
+
+    # Least number of free buffers kept by default.
+    MIN_FREE = 256
+
+    def __init__(self, capacity: int, count: int = 64,
+                 logger: logging.Logger = None, max_free: int = None):
+        """Initialize pool.
+
+        Args:
+            capacity (int): Size in bytes of each buffer.
+            count (int): Number of buffers to preallocate.
+            logger (logging.Logger): Logger associated with parent class.
+            max_free (int): Optional; Most free buffers kept. Defaults to
+                the larger of count and :attr:`MIN_FREE`.
+
+        Raises:
+            ValueError: Invalid capacity, count or max_free.
+        """
+        if max_free is None:
+            max_free = max(count, self.MIN_FREE)
+        if capacity <= 0 or count < 0 or max_free < count:
+            raise ValueError("Invalid buffer pool dimensions.")
+
+        self._capacity = capacity
+        self._max_free = max_free
+
+        # Free buffers. Deque append/pop are atomic so no lock is needed.
+        self._free = collections.deque()
+
+        # Total number of buffers held by the pool or its users. Buffers
+        # are acquired and released by different threads.
+        self._allocated = 0
+        self._allocated_lock = threading.Lock()
+
+        self._logger = logger
+        if self._logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+
+        for _ in range(count):
+            self._free.append(self._allocate())
+
+    @property
+    def capacity(self) -> int:
+        """Size in bytes of each buffer."""
+        return self._capacity
+
+    @property
+    def allocated(self) -> int:
+        """Total number of buffers created by the pool."""
+        return self._allocated
+
+    @property
+    def max_free(self) -> int:
+        """Most free buffers kept by the pool."""
+        return self._max_free
+
+    def __len__(self) -> int:
+        """Return number of free buffers."""
+        return len(self._free)
+
+    def acquire(self) -> FrameBuffer:
+        """Get a free buffer from the pool.
+
+        Returns:
+            FrameBuffer: Empty buffer.
+        """
+        try:
+            buf = self._free.pop()
+        except IndexError:
+            buf = self._allocate()
+            self._logger.debug('Buffer pool grew to %d.', self._allocated)
+        buf.in_pool = False
+        buf.size = buf.start = buf.end = 0
+        buf.version = 1
+        buf.timestamp = None
+        return buf
+
+    def release(self, buf: FrameBuffer) -> None:
+        """Return a buffer to the pool. Releasing it twice has no effect.
+
+        Args:
+            buf (FrameBuffer): Buffer obtained from :meth:`acquire`.
+        """
+        if not buf.in_pool:
+            buf.in_pool = True
+            if len(self._free) < self._max_free:
+                self._free.append(buf)
+            else:
+                # Drop the buffer. It is freed once unreferenced.
+                with self._allocated_lock:
+                    self._allocated -= 1
+
+    def _allocate(self) -> FrameBuffer:
+        """Create a new buffer owned by the pool."""
+        with self._allocated_lock:
+            self._allocated += 1
+        buf = FrameBuffer(self, self._capacity)
+        buf.in_pool = True
+        return buf
@@ -0,0 +1,284 @@
+"""Capture ingress traffic to a file and read it back for replay.
+
+A capture file starts with :data:`MAGIC` followed by one record per frame:
+
++----------------+-----------+-----------+-------------------------+
+| Timestamp      | Link      | Length    | Frame                   |
+| (8 bytes, ns)  | (1 byte)  | (4 bytes) | (as received)           |
++----------------+-----------+-----------+-------------------------+
+
+Timestamps are :py:func:`time.monotonic_ns` at ingress. Link names are
+declared inline by a record with link :data:`LINK_DEFINITION` whose data is
+the link ID followed by the name. When the capture is closed an index
+with the timestamp and offset of every frame and the link names is
+appended, followed by a fixed size trailer. Readers load the index with a
+single copy so that captures of millions of frames open instantly. If the
+trailer is missing (e.g. the server crashed) the index is rebuilt by
+scanning the records.
+"""
+import array
+import bisect
+import logging
+import mmap
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b'DLYCAP01'
+RECORD = struct.Struct('! q B I')
+RECORD_SIZE = RECORD.size
+TRAILER = struct.Struct('! Q Q 8s')
+TRAILER_MAGIC = b'DLYIDX01'
+
+# Link ID of records declaring a link name.
+LINK_DEFINITION = 0xFF
+
+
+def _to_bytes(values: array.array) -> bytes:
+    """Serialize an index array in little-endian order."""
+    if sys.byteorder == 'big':
+        values = array.array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode: str, data) -> array.array:
+    """Deserialize an index array written by :func:`_to_bytes`."""
+    values = array.array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+class CaptureWriter:
+    """Record frames to a capture file from a background thread.
+
+    :meth:`record` only copies the frame into a pending list. The writer
+    thread wakes up periodically, or once enough frames are pending, and
+    writes them with a single call.
+    """
+
+    # Maximum time (in sec) frames wait before being written.
+    _FLUSH_INTERVAL = 0.1
+
+    # Number of pending frames that triggers an early write.
+    _BATCH = 4096
+
+    def __init__(self, path: str, logger: logging.Logger = None):
+        """Create the capture file and start the writer thread.
+
+        Args:
+            path (str): Capture file. Overwritten if it exists.
+            logger (logging.Logger): Logger associated with parent class.
+        """
+        self._logger = logger
+        if self._logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+
+        self._file = open(path, 'wb')
+        self._file.write(MAGIC)
+        self._offset = len(MAGIC)
+
+        # Index of every frame written. Only used by the writer thread.
+        self._timestamps = array.array('q')
+        self._offsets = array.array('Q')
+
+        # Link IDs assigned so far. Protected by the lock.
+        self._links = {}
+
+        self._cond = threading.Condition()
+        self._pending = []
+        self._stop = False
+        self._thread = threading.Thread(target=self._run,
+                                        name='capture_writer', daemon=True)
+        self._thread.start()
+
+    def __len__(self) -> int:
+        """Return number of frames written so far."""
+        return len(self._offsets)
+
+    def record(self, link: str, data, timestamp: int = None) -> None:
+        """Queue a frame to be written.
+
+        Args:
+            link (str): Name of the link the frame was received on.
+            data (bytes-like): Frame as received.
+            timestamp (int): Optional; Ingress time
+                (:py:func:`time.monotonic_ns`). Defaults to now.
+        """
+        if timestamp is None:
+            timestamp = time.monotonic_ns()
+        with self._cond:
+            link_id = self._links.get(link)
+            if link_id is None:
+                link_id = len(self._links)
+                if link_id >= LINK_DEFINITION:
+                    raise ValueError("Too many links in capture.")
+                self._links[link] = link_id
+                self._pending.append(
+                    (timestamp, LINK_DEFINITION,
+                     bytes([link_id]) + link.encode('utf-8')))
+            self._pending.append((timestamp, link_id, bytes(data)))
+            if len(self._pending) >= self._BATCH:
+                self._cond.notify()
+
+    def close(self) -> None:
+        """Write pending frames and the index, then close the file."""
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+        self._thread.join()
+
+        index_offset = self._offset
+        links = bytearray(struct.pack('! H', len(self._links)))
+        for name, link_id in self._links.items():
+            raw_name = name.encode('utf-8')
+            links += struct.pack('! B B', link_id, len(raw_name)) + raw_name
+        self._file.write(_to_bytes(self._timestamps))
+        self._file.write(_to_bytes(self._offsets))
+        self._file.write(links)
+        self._file.write(TRAILER.pack(index_offset, len(self._offsets),
+                                      TRAILER_MAGIC))
+        self._file.close()
+        self._logger.info('Captured %d frames.', len(self._offsets))
+
+    def _run(self) -> None:
+        """Writer thread."""
+        while True:
+            with self._cond:
+                if not self._stop and len(self._pending) < self._BATCH:
+                    self._cond.wait(self._FLUSH_INTERVAL)
+                pending = self._pending
+                self._pending = []
+                stop = self._stop
+            if pending:
+                self._write(pending)
+            if stop:
+                break
+
+    def _write(self, pending: list) -> None:
+        """Write a batch of records."""
+        buf = bytearray()
+        for timestamp, link_id, data in pending:
+            if link_id != LINK_DEFINITION:
+                self._timestamps.append(timestamp)
+                self._offsets.append(self._offset + len(buf))
+            buf += RECORD.pack(timestamp, link_id, len(data))
+            buf += data
+        self._file.write(buf)
+        self._offset += len(buf)
+
+
+class CaptureReader:
+    """Memory-mapped capture file.
+
+    Frames are indexed by position. Use :meth:`find` to seek by timestamp.
+    """
+
+    def __init__(self, path: str):
+        """Open a capture and load or rebuild its index.
+
+        Args:
+            path (str): Capture file.
+
+        Raises:
+            ValueError: Not a capture file.
+        """
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0,
+                                  access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError("Empty capture file.")
+        if self._map[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError("Not a capture file.")
+
+        self.links = {}
+        self.indexed = self._load_index()
+        if not self.indexed:
+            self._scan()
+
+    def _load_index(self) -> bool:
+        """Load the index written when the capture was closed."""
+        if len(self._map) < len(MAGIC) + TRAILER.size:
+            return False
+        index_offset, count, magic = \
+            TRAILER.unpack_from(self._map, len(self._map) - TRAILER.size)
+        if magic != TRAILER_MAGIC:
+            return False
+        pos = index_offset
+        self.timestamps = _from_bytes('q', self._map[pos:pos + 8 * count])
+        pos += 8 * count
+        self._offsets = _from_bytes('Q', self._map[pos:pos + 8 * count])
+        pos += 8 * count
+        num_links = struct.unpack_from('! H', self._map, pos)[0]
+        pos += 2
+        for _ in range(num_links):
+            link_id, name_len = struct.unpack_from('! B B', self._map, pos)
+            pos += 2
+            self.links[link_id] = self._map[pos:pos + name_len].decode()
+            pos += name_len
+        self._end = index_offset
+        return True
+
+    def _scan(self) -> None:
+        """Rebuild the index by reading every record. Stops at the first
+        incomplete record."""
+        self.timestamps = array.array('q')
+        self._offsets = array.array('Q')
+        pos = len(MAGIC)
+        length = len(self._map)
+        while pos + RECORD_SIZE <= length:
+            timestamp, link_id, size = RECORD.unpack_from(self._map, pos)
+            end = pos + RECORD_SIZE + size
+            if end > length:
+                break
+            if link_id == LINK_DEFINITION:
+                data = self._map[pos + RECORD_SIZE:end]
+                self.links[data[0]] = data[1:].decode()
+            else:
+                self.timestamps.append(timestamp)
+                self._offsets.append(pos)
+            pos = end
+        self._end = pos
+
+    def __len__(self) -> int:
+        """Return number of frames."""
+        return len(self._offsets)
+
+    def __getitem__(self, index: int) -> tuple:
+        """Return a frame.
+
+        Args:
+            index (int): Frame position.
+
+        Returns:
+            tuple: Timestamp (ns), link name and :class:`memoryview` of the
+                frame. The view is only valid until :meth:`close`.
+        """
+        pos = self._offsets[index]
+        timestamp, link_id, size = RECORD.unpack_from(self._map, pos)
+        start = pos + RECORD_SIZE
+        with memoryview(self._map) as view:
+            data = view[start:start + size]
+        return timestamp, self.links.get(link_id), data
+
+    def find(self, timestamp: int) -> int:
+        """Return position of the first frame at or after timestamp (ns)."""
+        return bisect.bisect_left(self.timestamps, timestamp)
+
+    @property
+    def duration(self) -> float:
+        """Time (in sec) between the first and last frame."""
+        if len(self.timestamps) < 2:
+            return 0.0
+        return (self.timestamps[-1] - self.timestamps[0]) / 1e9
+
+    def close(self) -> None:
+        """Unmap and close the capture file."""
+        self._map.close()
+        self._file.close()
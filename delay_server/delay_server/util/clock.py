@@ -0,0 +1,129 @@
+"""Clocks used to read and wait on time.
+
+Every component that reads the time or waits takes a clock so that tests
+and benchmarks can replace real time with a :class:`SimulatedClock` and run
+a whole mission timeline in milliseconds.
+"""
+import threading
+import time
+
+
+class Clock:
+    """Real time clock based on :py:func:`time.monotonic`."""
+
+    def monotonic(self) -> float:
+        """Return the current time in seconds."""
+        return time.monotonic()
+
+    def monotonic_ns(self) -> int:
+        """Return the current time in nanoseconds."""
+        return time.monotonic_ns()
+
+    def sleep(self, secs: float) -> None:
+        """Wait for secs seconds."""
+        time.sleep(secs)
+
+    def from_realtime_ns(self, realtime_ns: int) -> float:
+        """Convert a wall clock time, such as a kernel timestamp, to this
+        clock.
+
+        Args:
+            realtime_ns (int): Time since the epoch in nanoseconds.
+
+        Returns:
+            float: Equivalent :meth:`monotonic` time in seconds.
+        """
+        return (time.monotonic_ns() - time.time_ns() + realtime_ns) / 1e9
+
+    def wait(self, event: threading.Event, timeout: float = None) -> bool:
+        """Wait for an event or until timeout seconds elapse.
+
+        Returns:
+            bool: True if the event is set.
+        """
+        return event.wait(timeout)
+
+
+class SimulatedClock(Clock):
+    """Clock that only moves when told to.
+
+    Time starts at ``start`` and moves forward with :meth:`advance`. With
+    ``auto_advance`` enabled, :meth:`sleep` and :meth:`wait` advance the
+    clock themselves and return immediately, which suits single-threaded
+    tests. Otherwise they block until another thread advances the clock
+    past the deadline.
+    """
+
+    # Real time (in sec) between checks of an event while waiting.
+    _POLL = 0.001
+
+    def __init__(self, start: float = 0.0, auto_advance: bool = True):
+        """Initialize.
+
+        Args:
+            start (float): Initial time in seconds.
+            auto_advance (bool): Sleeping advances the clock.
+        """
+        self._now = start
+        self._auto_advance = auto_advance
+        self._cond = threading.Condition()
+
+    def monotonic(self) -> float:
+        """Return the simulated time in seconds."""
+        return self._now
+
+    def monotonic_ns(self) -> int:
+        """Return the simulated time in nanoseconds."""
+        return int(self._now * 1e9)
+
+    def from_realtime_ns(self, realtime_ns: int) -> float:
+        """Wall clock times cannot be mapped to simulated time. Returns the
+        current simulated time."""
+        return self._now
+
+    def advance(self, secs: float) -> float:
+        """Move the clock forward.
+
+        Args:
+            secs (float): Seconds to advance. Cannot be negative.
+
+        Returns:
+            float: New time.
+
+        Raises:
+            ValueError: secs is negative.
+        """
+        if secs < 0:
+            raise ValueError("Clock cannot go backwards.")
+        with self._cond:
+            self._now += secs
+            self._cond.notify_all()
+        return self._now
+
+    def sleep(self, secs: float) -> None:
+        """Wait until the clock advances by secs seconds."""
+        if self._auto_advance:
+            self.advance(max(secs, 0))
+            return
+        deadline = self._now + secs
+        with self._cond:
+            self._cond.wait_for(lambda: self._now >= deadline)
+
+    def wait(self, event: threading.Event, timeout: float = None) -> bool:
+        """Wait for an event or until the clock advances by timeout."""
+        if event.is_set():
+            return True
+        if timeout is None:
+            return event.wait()
+        if self._auto_advance:
+            self.advance(max(timeout, 0))
+            return event.is_set()
+        deadline = self._now + timeout
+        while not event.is_set() and self._now < deadline:
+            with self._cond:
+                self._cond.wait(self._POLL)
+        return event.is_set()
+
+
+# Clock used unless another is provided.
+REAL_CLOCK = Clock()
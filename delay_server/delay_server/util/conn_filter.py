@@ -0,0 +1,187 @@
+"""Accept or reject client connections by address.
+
+The allow and deny rules are compiled once into a binary trie of network
+prefixes per address family. Matching an address walks at most as many
+bits as the longest prefix, so the cost of each ``accept()`` does not grow
+with the number of rules. The most specific matching rule wins, which lets
+an allow rule open a hole in a broader deny rule.
+"""
+import logging
+import socket
+
+
+def parse_pattern(pattern: str):
+    """Convert an address pattern to a network.
+
+    Args:
+        pattern (str): Address, network such as ``10.0.0.0/8`` or IPv4
+            address with trailing wildcards such as ``192.168.1.*``.
+
+    Returns:
+        ipaddress.IPv4Network or ipaddress.IPv6Network: Network matched.
+
+    Raises:
+        ValueError: Invalid pattern.
+    """
+    # Imported here so that a server without rules does not load it.
+    import ipaddress  # pylint: disable=C0415
+
+    pattern = pattern.strip()
+    if '*' in pattern:
+        octets = pattern.split('.')
+        fixed = [octet for octet in octets if octet != '*']
+        if len(octets) != 4 or octets[:len(fixed)] != fixed or \
+                not all(octet.isdigit() for octet in fixed):
+            raise ValueError("Invalid address pattern " + pattern)
+        pattern = '.'.join(fixed + ['0'] * (4 - len(fixed))) + \
+            '/' + str(8 * len(fixed))
+    return ipaddress.ip_network(pattern, strict=False)
+
+
+class _Trie:
+    """Binary trie of network prefixes of one address family.
+
+    Each node is a list holding the child for a 0 bit, the child for a 1
+    bit and the index of the rule ending at that node.
+    """
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.depth = 0
+        self.root = [None, None, None]
+
+    def insert(self, network, rule: int) -> None:
+        """Add a network. A later rule for the same network replaces an
+        earlier one."""
+        node = self.root
+        address = int(network.network_address)
+        for i in range(network.prefixlen):
+            bit = (address >> (self.bits - 1 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        node[2] = rule
+        self.depth = max(self.depth, network.prefixlen)
+
+    def match(self, address: int) -> int:
+        """Return the rule of the longest prefix matching an address, or
+        :class:`None`."""
+        node = self.root
+        rule = node[2]
+        shift = self.bits - 1
+        for _ in range(self.depth):
+            node = node[(address >> shift) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                rule = node[2]
+            shift -= 1
+        return rule
+
+
+class ConnectionFilter:
+    """Allow and deny rules applied to client addresses."""
+
+    ALLOW = 'allow'
+    DENY = 'deny'
+
+    def __init__(self, allow: tuple = (), deny: tuple = (),
+                 logger: logging.Logger = None):
+        """Compile the rules.
+
+        Args:
+            allow (tuple): Address patterns to accept. See
+                :func:`parse_pattern`.
+            deny (tuple): Address patterns to reject.
+            logger (logging.Logger): Logger associated with parent class.
+
+        Raises:
+            ValueError: Invalid pattern.
+        """
+        self._logger = logger
+        if self._logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+        self._rules = None
+        self.update(allow, deny)
+
+    def update(self, allow: tuple = (), deny: tuple = ()) -> None:
+        """Replace the rules. Hit counts of rules that are kept carry over.
+
+        The new rules are compiled before they are swapped in, so
+        connections accepted meanwhile use either the old or the new rules.
+
+        Args:
+            allow (tuple): Address patterns to accept.
+            deny (tuple): Address patterns to reject.
+
+        Raises:
+            ValueError: Invalid pattern. The previous rules are kept.
+        """
+        rules = [(self.ALLOW, pattern) for pattern in allow] + \
+                [(self.DENY, pattern) for pattern in deny]
+        tries = {socket.AF_INET: _Trie(32), socket.AF_INET6: _Trie(128)}
+        for i, (_, pattern) in enumerate(rules):
+            network = parse_pattern(pattern)
+            family = socket.AF_INET if network.version == 4 \
+                else socket.AF_INET6
+            tries[family].insert(network, i)
+
+        hits = [0] * len(rules)
+        if self._rules is not None:
+            previous = dict(zip(self._rules[0], self._rules[2]))
+            hits = [previous.get(rule, 0) for rule in rules]
+        accepted = self._rules[3] if self._rules is not None else [0]
+        self._rules = (rules, tries, hits, accepted)
+        self._logger.info('Connection filter: %d allow, %d deny rules.',
+                          len(allow), len(deny))
+
+    def allowed(self, host: str) -> bool:
+        """Check a client address and count the hit.
+
+        Args:
+            host (str): Client IP address, as returned by ``accept()``.
+
+        Returns:
+            bool: True if the connection is accepted.
+        """
+        rules, tries, hits, accepted = self._rules
+        try:
+            address = int.from_bytes(socket.inet_pton(socket.AF_INET, host),
+                                     'big')
+            rule = tries[socket.AF_INET].match(address)
+        except OSError:
+            try:
+                packed = socket.inet_pton(socket.AF_INET6, host.split('%')[0])
+            except OSError:
+                self._logger.warning('Rejected invalid address %s', host)
+                return False
+            if packed[:12] == b'\0' * 10 + b'\xff' * 2:
+                # IPv4-mapped IPv6 address.
+                rule = tries[socket.AF_INET].match(
+                    int.from_bytes(packed[12:], 'big'))
+            else:
+                rule = tries[socket.AF_INET6].match(
+                    int.from_bytes(packed, 'big'))
+
+        if rule is None:
+            accepted[0] += 1
+            return True
+        hits[rule] += 1
+        return rules[rule][0] == self.ALLOW
+
+    def stats(self) -> dict:
+        """Return the hit count of each rule.
+
+        Returns:
+            dict: Key ``rules`` lists dicts with the ``action``, ``pattern``
+                and ``hits`` of each rule. ``unmatched`` counts the
+                connections accepted without matching any rule.
+        """
+        rules, _, hits, accepted = self._rules
+        return dict(rules=[dict(action=action, pattern=pattern, hits=count)
+                           for (action, pattern), count in zip(rules, hits)],
+                    unmatched=accepted[0])
+
+    def __len__(self) -> int:
+        """Return number of rules."""
+        return len(self._rules[0])
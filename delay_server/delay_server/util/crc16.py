@@ -1,3 +1,6 @@
+from delay_common.codec import crc16
+
+
 class CRC16:
     """Implementation of CRC-16 CCITT-FALSE Algorithm."""
 
@@ -9,7 +12,8 @@ class CRC16:
         """Calculate CRC16 on the given data.
 
         Args:
-            data (bytes or bytearray): Data to compute CRC on. Cannot be None.
+            data (bytes, bytearray or memoryview): Data to compute CRC on.
+                Cannot be None.
             crc (int): Seed value. If not provided defaults to 0xFFFF.
 
         Returns:
@@ -17,26 +21,18 @@ class CRC16:
 
         Raises:
             AttributeError: Data is None.
-            TypeError: Data is neither a :class:`bytes` or :class:`bytearray`.
+            TypeError: Data is not a :class:`bytes`, :class:`bytearray` or
+                :class:`memoryview`.
         """
         if data is None:
             raise AttributeError("Variable 'data' is None.")
 
-        if not isinstance(data, (bytes, bytearray)):
-            raise TypeError("Cannot compute CRC on " + type(data))
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            raise TypeError("Cannot compute CRC on " + str(type(data)))
 
         # Use default seed if none is provided.
         if crc is None:
             crc = CRC16.__CRC_CCITT_INIT
 
-        # Compute CRC.
-        for byte in data:
-            crc ^= (byte << 8)
-            for _ in range(0, 8):
-                if crc & 0x8000:
-                    crc = (crc << 1) ^ CRC16.__CRC_CCITT_POLY
-                else:
-                    crc = (crc << 1)
-            crc &= 0xFFFF
-
-        return crc
+        # Compute CRC. Polynomial is __CRC_CCITT_POLY.
+        return crc16(data, crc)
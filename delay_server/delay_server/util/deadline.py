@@ -0,0 +1,146 @@
+"""Low-jitter waiting for a deadline.
+
+Sleeping in Python, whether with :py:func:`time.sleep` or a ``select``
+timeout, can overshoot by a millisecond or more when the host is loaded.
+:class:`DeadlineWaiter` sleeps until shortly before the deadline and spins
+on the clock for the remainder. The spin budget follows the oversleep
+measured on previous waits, with a cap set by the precision level, so CPU
+is only burnt when the sleeps are actually late.
+"""
+import time
+
+from delay_server.delay.delay import CommDelay
+from delay_server.util.clock import Clock
+
+
+class DeadlineWaiter:
+    """Wait for deadlines with a hybrid sleep-then-spin strategy.
+
+    The expected oversleep is tracked like a TCP round trip estimate: a
+    smoothed mean plus four times the smoothed deviation. That estimate is
+    the spin budget, limited by the precision level:
+
+    - :attr:`PRECISION_LOW`: Never spin. Lowest CPU use.
+    - :attr:`PRECISION_MEDIUM`: Spin for up to 1 ms.
+    - :attr:`PRECISION_HIGH`: Spin for up to 5 ms.
+    """
+
+    # Precision levels and their maximum spin budget (in sec).
+    PRECISION_LOW = 'low'
+    PRECISION_MEDIUM = 'medium'
+    PRECISION_HIGH = 'high'
+    PRECISIONS = {PRECISION_LOW: 0.0,
+                  PRECISION_MEDIUM: 0.001,
+                  PRECISION_HIGH: 0.005}
+
+    # Gain of the smoothed oversleep mean and deviation.
+    _ALPHA = 0.125
+    _BETA = 0.25
+
+    def __init__(self, clock: Clock = None,
+                 precision: str = PRECISION_MEDIUM, max_sleep: float = 0.01):
+        """Initialize.
+
+        Args:
+            clock (Clock): Optional; Clock the deadlines refer to. Defaults
+                to the clock of :class:`delay_server.delay.delay.CommDelay`
+                at the time of each wait.
+            precision (str): Precision level. One of :attr:`PRECISIONS`.
+            max_sleep (float): Longest single sleep (in sec). Bounds how late
+                a wait notices a deadline that moved earlier, for example
+                because a message was queued or the delay changed.
+
+        Raises:
+            ValueError: Invalid precision level.
+        """
+        if precision not in self.PRECISIONS:
+            raise ValueError("Invalid precision " + str(precision))
+        self._clock = clock
+        self._precision = precision
+        self._max_spin = self.PRECISIONS[precision]
+        self._max_sleep = max_sleep
+
+        # Smoothed oversleep mean and deviation (in sec).
+        self._oversleep = 0.0
+        self._deviation = 0.0
+
+        # Number of waits that spun and total time spent spinning (in sec).
+        self.spins = 0
+        self.spin_time = 0.0
+
+    @property
+    def clock(self) -> Clock:
+        """Clock the deadlines refer to."""
+        if self._clock is None:
+            return CommDelay().clock
+        return self._clock
+
+    @property
+    def precision(self) -> str:
+        """Precision level."""
+        return self._precision
+
+    @property
+    def spin_budget(self) -> float:
+        """Time (in sec) before a deadline at which sleeping stops."""
+        return min(self._max_spin, self._oversleep + 4 * self._deviation)
+
+    def wait(self, deadline: float = None, sleep=None) -> bool:
+        """Wait until a deadline, or for up to the maximum sleep.
+
+        Args:
+            deadline (float): Optional; Deadline in the clock time. If not
+                provided, sleep for the maximum sleep.
+            sleep (callable): Optional; Function called with the number of
+                seconds to sleep. Use it to do useful work while waiting,
+                such as polling sockets. It may return early. Defaults to
+                the clock sleep.
+
+        Returns:
+            bool: True if the deadline was reached.
+        """
+        clock = self.clock
+        if sleep is None:
+            sleep = clock.sleep
+
+        if deadline is None:
+            sleep(self._max_sleep)
+            return False
+
+        budget = self.spin_budget
+        now = clock.monotonic()
+        coarse = deadline - budget - now
+        if coarse > 0:
+            target = now + min(coarse, self._max_sleep)
+            sleep(target - now)
+            now = clock.monotonic()
+            # Sleeps cut short by the caller say nothing about oversleep.
+            oversleep = now - target
+            if oversleep >= 0:
+                self._calibrate(oversleep)
+            if now < deadline - budget:
+                return False
+
+        if now < deadline and budget > 0:
+            self._spin(clock, deadline, budget)
+        return clock.monotonic() >= deadline
+
+    def _spin(self, clock: Clock, deadline: float, budget: float) -> None:
+        """Busy wait until the deadline. Gives up after twice the budget of
+        real time in case the clock does not move on its own."""
+        deadline_ns = int(deadline * 1e9)
+        start = time.perf_counter_ns()
+        give_up = start + int(2 * budget * 1e9)
+        monotonic_ns = clock.monotonic_ns
+        perf_counter_ns = time.perf_counter_ns
+        while monotonic_ns() < deadline_ns:
+            if perf_counter_ns() > give_up:
+                break
+        self.spins += 1
+        self.spin_time += (time.perf_counter_ns() - start) / 1e9
+
+    def _calibrate(self, oversleep: float) -> None:
+        """Update the smoothed oversleep mean and deviation."""
+        self._deviation += self._BETA * \
+            (abs(oversleep - self._oversleep) - self._deviation)
+        self._oversleep += self._ALPHA * (oversleep - self._oversleep)
@@ -6,6 +6,11 @@ Exceptions
 @author: dario
 """
 
+# Exceptions raised by the packet codec shared with the Delay Client.
+# pylint: disable=W0611
+from delay_common.exceptions import SocketSendEmptyMessage, \
+    SocketSendPktInvalidLength
+
 
 class LockError(Exception):
     """Raised when there is a timeout after failing to obtain a
@@ -13,15 +18,6 @@ class LockError(Exception):
     pass
 
 
-class SocketSendEmptyMessage(Exception):
-    """Raised when trying to send an empty packet."""
-    pass
-
-
-class SocketSendPktInvalidLength(Exception):
-    """Raised when trying to send a packet with an invalid length."""
-    pass
-
 class SocketRecvEmptyMessage(Exception):
     """Raised when trying to receive an empty packet."""
     pass
@@ -30,3 +26,9 @@ class SocketRecvEmptyMessage(Exception):
 class SocketRecvPktInvalidLength(Exception):
     """Raised when trying to receive a packet with an invalid length."""
     pass
+
+
+class ConfigError(Exception):
+    """Raised when the config file is missing a required value or holds an
+    invalid one. The message lists every problem found."""
+    pass
@@ -0,0 +1,201 @@
+"""Safe compiler for arithmetic expressions such as dynamic delays.
+
+Expressions are parsed with :py:mod:`ast` and only arithmetic, numbers,
+the allowed variables and the functions and constants of :py:mod:`math`
+are accepted. The tree is compiled into a native Python function, so
+evaluating it costs about as much as a hand-written one, and nothing
+outside the whitelist can be reached from the config file.
+
+The syntax follows sympy for the common cases, so existing config files
+keep working: ``^`` is a power, and ``ln``, ``Abs``, ``Min``, ``Max``,
+``E`` and ``pi`` are understood. Expressions that call other functions
+(for example ``Piecewise`` or ``Heaviside``) fall back to sympy, which is
+only imported when such an expression is found. Only unknown function
+names fall back: any other syntax outside the whitelist is rejected, since
+sympy evaluates expressions with :py:func:`eval`.
+"""
+import ast
+import builtins
+import math
+
+# Functions and constants available to expressions.
+NAMESPACE = {name: getattr(math, name) for name in (
+    'acos', 'acosh', 'asin', 'asinh', 'atan', 'atan2', 'atanh', 'ceil',
+    'cos', 'cosh', 'degrees', 'exp', 'fabs', 'floor', 'fmod', 'hypot',
+    'log', 'log10', 'log2', 'radians', 'sin', 'sinh', 'sqrt', 'tan', 'tanh',
+    'e', 'pi', 'tau', 'inf')}
+NAMESPACE.update(abs=abs, min=min, max=max, pow=pow, round=round,
+                 ln=math.log, Abs=abs, Min=min, Max=max, E=math.e)
+
+# Operators accepted.
+_BIN_OPS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod,
+            ast.Pow)
+_UNARY_OPS = (ast.UAdd, ast.USub)
+
+
+class UnsupportedExpression(ValueError):
+    """Raised when an expression uses names or syntax outside the
+    whitelist."""
+    pass
+
+
+class UnknownFunction(UnsupportedExpression):
+    """Raised when the only problem with an expression is that it calls
+    functions outside the whitelist, which sympy may understand."""
+    pass
+
+
+class _Checker(ast.NodeTransformer):
+    """Reject anything outside the whitelist."""
+
+    def __init__(self, variables: tuple):
+        self._variables = variables
+        # Names of unknown functions called.
+        self.unknown = []
+
+    def generic_visit(self, node):
+        raise UnsupportedExpression(
+            type(node).__name__ + " is not allowed in expressions.")
+
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+
+    def visit_Constant(self, node):
+        if isinstance(node.value, bool) or \
+                not isinstance(node.value, (int, float)):
+            raise UnsupportedExpression(
+                repr(node.value) + " is not a number.")
+        return node
+
+    def visit_Name(self, node):
+        if node.id not in self._variables and node.id not in NAMESPACE:
+            raise UnsupportedExpression("Unknown name " + node.id)
+        return node
+
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, _BIN_OPS):
+            raise UnsupportedExpression(
+                type(node.op).__name__ + " is not allowed in expressions.")
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        return node
+
+    def visit_UnaryOp(self, node):
+        if not isinstance(node.op, _UNARY_OPS):
+            raise UnsupportedExpression(
+                type(node.op).__name__ + " is not allowed in expressions.")
+        node.operand = self.visit(node.operand)
+        return node
+
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name):
+            raise UnsupportedExpression("Only named functions are allowed.")
+        name = node.func.id
+        if name not in NAMESPACE or not callable(NAMESPACE[name]):
+            # Left to sympy unless it could reach Python internals.
+            if name in NAMESPACE or name.startswith('_') or \
+                    hasattr(builtins, name):
+                raise UnsupportedExpression("Unknown function " + name)
+            self.unknown.append(name)
+        if node.keywords:
+            raise UnsupportedExpression(
+                "Keyword arguments are not allowed in expressions.")
+        node.args = [self.visit(arg) for arg in node.args]
+        return node
+
+
+def compile_expression(expression: str, variables: tuple = ('t',)):
+    """Compile an expression into a function.
+
+    Args:
+        expression (str): Expression, such as ``(t - 100) + 0.1``.
+        variables (tuple): Names of the arguments of the function.
+
+    Returns:
+        callable: Function taking the variables as positional arguments.
+
+    Raises:
+        UnknownFunction: The expression only calls functions outside the
+            whitelist.
+        UnsupportedExpression: The expression uses names or syntax outside
+            the whitelist.
+        ValueError: Syntax error.
+    """
+    # Like sympy, treat ^ as a power with the precedence of **.
+    try:
+        tree = ast.parse(expression.strip().replace('^', '**'),
+                         '<expression>', 'eval')
+    except SyntaxError as e:
+        raise ValueError("Invalid expression " + expression) from e
+    checker = _Checker(tuple(variables))
+    body = checker.visit(tree).body
+    if checker.unknown:
+        raise UnknownFunction(
+            "Unknown function " + ", ".join(checker.unknown))
+
+    # Wrap the expression in a lambda so that evaluating it is a plain
+    # function call. Builtins are not reachable from the function.
+    args = ast.arguments(posonlyargs=[],
+                         args=[ast.arg(arg=name) for name in variables],
+                         kwonlyargs=[], kw_defaults=[], defaults=[])
+    func = ast.fix_missing_locations(
+        ast.Expression(ast.Lambda(args=args, body=body)))
+    namespace = dict(NAMESPACE, __builtins__={})
+    # pylint: disable=W0123
+    return eval(compile(func, '<expression>', 'eval'), namespace)
+
+
+def compile_sympy(expression: str, variables: tuple = ('t',)):
+    """Compile an expression with sympy. Imports sympy on first use.
+
+    Args:
+        expression (str): Expression in sympy syntax.
+        variables (tuple): Names of the arguments of the function.
+
+    Returns:
+        callable: Function taking the variables as positional arguments.
+
+    Raises:
+        ValueError: Invalid expression, or sympy is not installed.
+    """
+    try:
+        import sympy  # pylint: disable=C0415
+    except ImportError as e:
+        raise ValueError("sympy is required to evaluate " + expression) \
+            from e
+    symbols = sympy.symbols(variables)
+    if not isinstance(symbols, (list, tuple)):
+        symbols = (symbols,)
+    try:
+        parsed = sympy.sympify(expression)
+    except (sympy.SympifyError, TypeError) as e:
+        raise ValueError("Invalid expression " + expression) from e
+    if not parsed.free_symbols <= set(symbols):
+        raise ValueError("Unknown names in " + expression)
+    return sympy.lambdify(symbols, parsed, ['math', 'mpmath', 'sympy'])
+
+
+def compile_any(expression: str, variables: tuple = ('t',)):
+    """Compile an expression, falling back to sympy if it calls functions
+    not supported by :func:`compile_expression`.
+
+    Args:
+        expression (str): Expression.
+        variables (tuple): Names of the arguments of the function.
+
+    Returns:
+        callable: Function taking the variables as positional arguments.
+
+    Raises:
+        UnsupportedExpression: The expression uses syntax outside the
+            whitelist.
+        ValueError: Invalid expression.
+    """
+    try:
+        return compile_expression(expression, variables)
+    except UnknownFunction as e:
+        try:
+            return compile_sympy(expression, variables)
+        except ValueError as sympy_error:
+            raise UnsupportedExpression(f"{e}. {sympy_error}") from None
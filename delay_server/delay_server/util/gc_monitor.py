@@ -0,0 +1,207 @@
+"""Garbage collector tuning and allocation profiling for the data path.
+
+Every frame creates short-lived objects, so at high frame rates the cyclic
+garbage collector runs often, and a full collection walks every queued
+message. :func:`enable_hot_path` moves everything allocated during startup
+to the permanent generation with :py:func:`gc.freeze` and raises the
+collection thresholds. :class:`GcMonitor` measures the pause of every
+collection through :py:data:`gc.callbacks`, and :class:`AllocationProfiler`
+reports which lines allocate the most memory per frame.
+"""
+import collections
+import gc
+import logging
+import time
+
+
+def enable_hot_path(thresholds: tuple = (50000, 20, 100),
+                    logger: logging.Logger = None) -> tuple:
+    """Freeze startup objects and raise the collection thresholds.
+
+    The thresholds apply to the whole process, since the collector is
+    shared by every thread.
+
+    Args:
+        thresholds (tuple): Thresholds of generations 0, 1 and 2. See
+            :py:func:`gc.set_threshold`.
+        logger (logging.Logger): Logger associated with parent class.
+
+    Returns:
+        tuple: Previous thresholds.
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+    previous = gc.get_threshold()
+    gc.collect()
+    gc.freeze()
+    gc.set_threshold(*thresholds)
+    logger.info('GC hot path: froze %d objects, thresholds %s (was %s).',
+                gc.get_freeze_count(), thresholds, previous)
+    return previous
+
+
+def disable_hot_path(thresholds: tuple) -> None:
+    """Undo :func:`enable_hot_path`.
+
+    Args:
+        thresholds (tuple): Thresholds to restore.
+    """
+    gc.unfreeze()
+    gc.set_threshold(*thresholds)
+
+
+class GcMonitor:
+    """Record the pause caused by each garbage collection."""
+
+    # Number of recent pauses kept to compute percentiles.
+    _HISTORY = 1000
+
+    def __init__(self, warn_pause: float = 0.01,
+                 logger: logging.Logger = None):
+        """Initialize.
+
+        Args:
+            warn_pause (float): Log collections that pause longer than this
+                (in sec). Use :class:`None` to never log.
+            logger (logging.Logger): Logger associated with parent class.
+        """
+        self._warn_pause = warn_pause
+        self._logger = logger
+        if self._logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+
+        # Start time of the collection in progress.
+        self._start = None
+
+        # Collections and pauses (in sec) per generation.
+        self._collections = [0, 0, 0]
+        self._pause_total = [0.0, 0.0, 0.0]
+        self._pause_max = [0.0, 0.0, 0.0]
+        self._recent = collections.deque(maxlen=self._HISTORY)
+
+    def start(self) -> None:
+        """Start recording collections."""
+        if self._callback not in gc.callbacks:
+            gc.callbacks.append(self._callback)
+
+    def stop(self) -> None:
+        """Stop recording collections."""
+        if self._callback in gc.callbacks:
+            gc.callbacks.remove(self._callback)
+
+    def stats(self) -> dict:
+        """Return collection statistics.
+
+        Returns:
+            dict: Keys ``collections``, ``pause_total`` and ``pause_max``
+                hold a list with a value per generation. ``pause_p99`` is
+                the 99th percentile of recent pauses. Pauses are in seconds.
+        """
+        recent = sorted(self._recent)
+        p99 = 0.0
+        if recent:
+            p99 = recent[min(len(recent) - 1, int(len(recent) * 0.99))]
+        return dict(collections=list(self._collections),
+                    pause_total=list(self._pause_total),
+                    pause_max=list(self._pause_max),
+                    pause_p99=p99)
+
+    def _callback(self, phase: str, info: dict) -> None:
+        """Called by the collector before and after each collection."""
+        if phase == 'start':
+            self._start = time.perf_counter()
+            return
+        if self._start is None:
+            return
+        pause = time.perf_counter() - self._start
+        self._start = None
+        gen = info['generation']
+        self._collections[gen] += 1
+        self._pause_total[gen] += pause
+        self._pause_max[gen] = max(self._pause_max[gen], pause)
+        self._recent.append(pause)
+        if self._warn_pause is not None and pause > self._warn_pause:
+            self._logger.warning('GC generation %d paused %.1f ms '
+                                 '(collected %d).', gen, pause * 1e3,
+                                 info['collected'])
+
+
+class AllocationProfiler:
+    """Report the lines that allocate the most memory per frame.
+
+    Tracing allocations slows the server down, so it is only enabled on
+    request. Each :meth:`report` covers the memory allocated since the
+    previous one and still in use, such as queued messages.
+    """
+
+    def __init__(self, logger: logging.Logger = None):
+        """Initialize.
+
+        Args:
+            logger (logging.Logger): Logger associated with parent class.
+        """
+        self._logger = logger
+        if self._logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+        self._snapshot = None
+        self._frames = 0
+
+    def start(self, num_frames: int = 0) -> None:
+        """Start tracing allocations.
+
+        Args:
+            num_frames (int): Frames processed so far.
+        """
+        import tracemalloc  # pylint: disable=C0415
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self._snapshot = self._take_snapshot()
+        self._frames = num_frames
+
+    def stop(self) -> None:
+        """Stop tracing allocations."""
+        import tracemalloc  # pylint: disable=C0415
+        tracemalloc.stop()
+        self._snapshot = None
+
+    def report(self, num_frames: int, limit: int = 10) -> list:
+        """Log the top allocation sites since the previous report.
+
+        Args:
+            num_frames (int): Frames processed so far.
+            limit (int): Number of sites reported.
+
+        Returns:
+            list: Tuples with the site (file:line), bytes and memory blocks
+                per frame, largest first.
+
+        Raises:
+            RuntimeError: Profiler not started.
+        """
+        if self._snapshot is None:
+            raise RuntimeError("Allocation profiler not started.")
+        snapshot = self._take_snapshot()
+        frames = max(num_frames - self._frames, 1)
+        stats = [stat for stat in
+                 snapshot.compare_to(self._snapshot, 'lineno')
+                 if stat.size_diff > 0]
+        self._snapshot = snapshot
+        self._frames = num_frames
+
+        ret = []
+        for stat in stats[:limit]:
+            frame = stat.traceback[0]
+            ret.append((f"{frame.filename}:{frame.lineno}",
+                        stat.size_diff / frames, stat.count_diff / frames))
+        self._logger.info('Top allocations over %d frames:', frames)
+        for site, size, count in ret:
+            self._logger.info('%10.1f B %8.2f allocs per frame %s',
+                              size, count, site)
+        return ret
+
+    @staticmethod
+    def _take_snapshot():
+        """Take a snapshot without the allocations of tracemalloc."""
+        import tracemalloc  # pylint: disable=C0415
+        return tracemalloc.take_snapshot().filter_traces(
+            (tracemalloc.Filter(False, tracemalloc.__file__),))
@@ -0,0 +1,135 @@
+"""Bounded history of a statistic at several resolutions.
+
+Samples are averaged into buckets of 1 sec, 10 sec and 1 min, and each
+resolution keeps a fixed number of buckets in a :class:`RingBuffer`. Memory
+use does not grow with uptime, and a chart of any window up to a day only
+needs the few hundred points of the coarsest resolution that covers it.
+"""
+import bisect
+from array import array
+
+
+class RingBuffer:
+    """Fixed number of (time, value) points. The oldest point is overwritten
+    once the buffer is full."""
+
+    def __init__(self, size: int):
+        """Initialize.
+
+        Args:
+            size (int): Number of points.
+
+        Raises:
+            ValueError: Size is not positive.
+        """
+        if size < 1:
+            raise ValueError("Ring buffer size must be positive.")
+        self._times = array('d', bytes(8 * size))
+        self._values = array('d', bytes(8 * size))
+        self._size = size
+        # Index of the next point and number of points held.
+        self._next = 0
+        self._len = 0
+
+    @property
+    def size(self) -> int:
+        """Number of points held once full."""
+        return self._size
+
+    def append(self, time: float, value: float) -> None:
+        """Add a point, overwriting the oldest one if full."""
+        self._times[self._next] = time
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self._size
+        self._len = min(self._len + 1, self._size)
+
+    def points(self, since: float = None) -> tuple:
+        """Return the points, oldest first.
+
+        Args:
+            since (float): Optional; Only return points at or after this
+                time.
+
+        Returns:
+            tuple: List of times and list of values.
+        """
+        start = (self._next - self._len) % self._size
+        if start + self._len <= self._size:
+            times = self._times[start:start + self._len]
+            values = self._values[start:start + self._len]
+        else:
+            times = self._times[start:] + self._times[:self._next]
+            values = self._values[start:] + self._values[:self._next]
+        first = 0
+        if since is not None:
+            first = bisect.bisect_left(times, since)
+        return times[first:].tolist(), values[first:].tolist()
+
+    def __len__(self) -> int:
+        """Return number of points held."""
+        return self._len
+
+
+class History:
+    """History of a statistic downsampled to several resolutions."""
+
+    # Resolution (in sec) and number of points of each level: 5 min at
+    # 1 sec, 1 hour at 10 sec and 1 day at 1 min.
+    LEVELS = ((1, 300), (10, 360), (60, 1440))
+
+    def __init__(self, levels: tuple = LEVELS):
+        """Initialize.
+
+        Args:
+            levels (tuple): Resolution (in sec) and number of points of each
+                level, finest first.
+        """
+        self._levels = [(resolution, RingBuffer(size))
+                        for resolution, size in levels]
+
+        # Bucket being accumulated for each level: index, sum and count.
+        self._buckets = [None] * len(self._levels)
+
+    def add(self, time: float, value: float) -> None:
+        """Add a sample.
+
+        Args:
+            time (float): Sample time in seconds. Must not go backwards.
+            value (float): Sample value.
+        """
+        for i, (resolution, ring) in enumerate(self._levels):
+            index = int(time // resolution)
+            bucket = self._buckets[i]
+            if bucket is not None and bucket[0] == index:
+                bucket[1] += value
+                bucket[2] += 1
+                continue
+            if bucket is not None:
+                ring.append(bucket[0] * resolution, bucket[1] / bucket[2])
+            self._buckets[i] = [index, value, 1]
+
+    def series(self, window: float, now: float) -> tuple:
+        """Return the points over a time window.
+
+        Uses the finest resolution that covers the window, including the
+        bucket still being accumulated.
+
+        Args:
+            window (float): Length of the window in seconds.
+            now (float): End of the window.
+
+        Returns:
+            tuple: Resolution in seconds, list of times and list of values.
+        """
+        level = len(self._levels) - 1
+        for i, (resolution, ring) in enumerate(self._levels):
+            if resolution * ring.size >= window:
+                level = i
+                break
+        resolution, ring = self._levels[level]
+        times, values = ring.points(now - window)
+        bucket = self._buckets[level]
+        if bucket is not None:
+            times.append(bucket[0] * resolution)
+            values.append(bucket[1] / bucket[2])
+        return resolution, times, values
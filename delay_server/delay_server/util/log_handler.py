@@ -4,6 +4,8 @@
 import logging
 import queue
 
+from delay_server.util.log_ring import LogRing
+
 
 class QueueLogHandler(logging.Handler):
     """Log handler that saves messages to a therad-safe queue.
@@ -28,3 +30,28 @@ class QueueLogHandler(logging.Handler):
             new_record (logging.LogRecord): Log entry to add to the log.
         """
         self._queue.put(record)
+
+
+class LogRingHandler(logging.Handler):
+    """Log handler that writes messages to a shared memory ring.
+
+    Lets the GUI process display the server log. See
+    :class:`delay_server.util.log_ring.LogRing`.
+    """
+
+    def __init__(self, ring: LogRing):
+        """Initialize LogRingHandler with a ring created by the server.
+
+        Args:
+            ring (LogRing): Ring to write messages to.
+        """
+        super().__init__()
+        self._ring = ring
+
+    def emit(self, record: logging.LogRecord) -> None:
+        """Add new entries to the log.
+
+        Args:
+            record (logging.LogRecord): Log entry to add to the log.
+        """
+        self._ring.append(record.levelno, self.format(record))
@@ -0,0 +1,133 @@
+"""Ring buffer of log messages in shared memory.
+
+The server writes log messages into a fixed number of slots and the GUI
+process reads the ones it has not seen yet. The writer never waits for the
+reader: if the reader falls more than a full ring behind, the oldest
+messages are skipped and counted as dropped.
+
+Each slot starts with a sequence number that is odd while the slot is being
+written, so the reader can detect and skip a slot that was overwritten while
+it was copying it.
+
++--------+-------------------------------------------------------------+
+| Header | Magic, number of slots, slot size and messages written      |
++--------+-------------------------------------------------------------+
+| Slot   | Sequence, level, length and the message, UTF-8 encoded      |
++--------+-------------------------------------------------------------+
+| ...    |                                                             |
++--------+-------------------------------------------------------------+
+"""
+import struct
+from multiprocessing import shared_memory
+
+from delay_server.util.shared_stats import attach
+
+MAGIC = b'DLYLOG01'
+
+# Magic, number of slots, slot size and number of messages written.
+HEADER = struct.Struct('= 8s I I Q')
+COUNT = struct.Struct('= Q')
+COUNT_OFFSET = 16
+
+# Slot sequence number, log level and message length.
+SLOT = struct.Struct('= Q B H')
+
+
+class LogRing:
+    """Log messages in shared memory. There must only be one writer."""
+
+    def __init__(self, name: str = None, slots: int = 1024,
+                 slot_size: int = 256, create: bool = False):
+        """Create or attach to a ring.
+
+        Args:
+            name (str): Name of the ring. Optional when creating it.
+            slots (int): Number of messages held. Only used when creating it.
+            slot_size (int): Bytes per message, including the slot header.
+                Longer messages are truncated. Only used when creating it.
+            create (bool): Create the ring instead of attaching to it.
+
+        Raises:
+            FileNotFoundError: No ring with this name.
+            ValueError: Not a log ring or invalid size.
+        """
+        self._create = create
+        if create:
+            if slots < 1 or not SLOT.size < slot_size <= SLOT.size + 0xFFFF:
+                raise ValueError("Invalid log ring size.")
+            self._shm = shared_memory.SharedMemory(
+                name, True, HEADER.size + slots * slot_size)
+            HEADER.pack_into(self._shm.buf, 0, MAGIC, slots, slot_size, 0)
+        else:
+            self._shm = attach(name)
+            magic, slots, slot_size, _ = HEADER.unpack_from(self._shm.buf)
+            if magic != MAGIC:
+                self._shm.close()
+                raise ValueError("Not a log ring " + str(name))
+        self._slots = slots
+        self._slot_size = slot_size
+
+        # Next message to read, starting with those still in the ring, and
+        # number of messages skipped.
+        self._next = max(0, self._count() - slots)
+        self.dropped = 0
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory block."""
+        return self._shm.name
+
+    def append(self, level: int, msg: str) -> None:
+        """Write a message.
+
+        Args:
+            level (int): Log level, such as :py:data:`logging.INFO`.
+            msg (str): Message.
+        """
+        buf = self._shm.buf
+        count = self._count()
+        offset = HEADER.size + (count % self._slots) * self._slot_size
+        data = msg.encode('utf-8', 'replace')[:self._slot_size - SLOT.size]
+        level = min(level, 0xFF)
+        SLOT.pack_into(buf, offset, 2 * count + 1, level, len(data))
+        start = offset + SLOT.size
+        buf[start:start + len(data)] = data
+        SLOT.pack_into(buf, offset, 2 * count + 2, level, len(data))
+        COUNT.pack_into(buf, COUNT_OFFSET, count + 1)
+
+    def read(self) -> list:
+        """Return the messages written since the previous read.
+
+        Returns:
+            list: Tuples with the log level and message.
+        """
+        buf = self._shm.buf
+        count = self._count()
+        if count - self._next > self._slots:
+            self.dropped += count - self._next - self._slots
+            self._next = count - self._slots
+
+        ret = []
+        while self._next < count:
+            offset = HEADER.size + (self._next % self._slots) * self._slot_size
+            seq, level, length = SLOT.unpack_from(buf, offset)
+            start = offset + SLOT.size
+            data = bytes(buf[start:start + length])
+            if seq != 2 * self._next + 2 or \
+                    SLOT.unpack_from(buf, offset)[0] != seq:
+                # Overwritten while reading.
+                self.dropped += 1
+            else:
+                ret.append((level, data.decode('utf-8', 'replace')))
+            self._next += 1
+        return ret
+
+    def close(self) -> None:
+        """Detach from the ring. The creator also removes it."""
+        self._shm.close()
+        if self._create:
+            self._shm.unlink()
+
+    def _count(self) -> int:
+        """Return number of messages written."""
+        return COUNT.unpack_from(self._shm.buf, COUNT_OFFSET)[0]
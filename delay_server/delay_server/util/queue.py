@@ -1,7 +1,9 @@
-import time
 import logging
+import collections
+import itertools
 
 from delay_server.delay.delay import CommDelay
+from delay_server.util.clock import Clock
 from delay_server.util.lock import LockTimeout
 from delay_server.util.exceptions import LockError
 
@@ -10,7 +12,9 @@ class DelayQueue:
     """Thread-safe queue (first-in-first-out) with time delay pop operations.
 
     Objects are pushed into the queue by calling :meth:`push()`. The method
-    also adds a timestamp, :math:`t_{obj}`, given by :py:func:`time.monotonic`.
+    also adds a timestamp, :math:`t_{obj}`, given by the queue clock
+    (see :mod:`delay_server.util.clock`), unless the caller provides the time
+    the object was received.
 
     Objects are poppoed off the queue in by calling :py:meth:`pop()`.
     The method compares the object timestamp agains thte current time,
@@ -18,12 +22,41 @@ class DelayQueue:
     :class:`delay_server.delay.delay.CommDelay`. In order for an object to be
     removed from the queue it must satisfy:
     :math:`t_{current} - t_{obj} > t_{delay}`
+
+    The queue can optionally enforce a budget on the number of messages
+    and/or the number of bytes it holds. The fill level is the larger of the
+    two ratios against the budget. Crossing the high water mark is logged and
+    reported by :attr:`backpressure` so that the producer can stop reading
+    from its sockets. Once the fill level drops below the low water mark the
+    condition clears. If the budget is exhausted the overflow policy decides
+    which message is discarded:
+
+    - :attr:`POLICY_BACKPRESSURE`: Rely on the producer to stop reading.
+      Messages that still arrive once the budget is exhausted are dropped.
+    - :attr:`POLICY_DROP_OLDEST`: Discard the oldest messages to make room.
+    - :attr:`POLICY_DROP_NEWEST`: Discard the incoming message.
+
+    Objects that hold pooled resources, such as
+    :class:`delay_server.util.buffer_pool.FrameBuffer`, are released when
+    they are discarded by :meth:`clear` or the overflow policy.
     """
 
     # Default timeout (in sec) for waiting for lock.
     _TIMEOUT = 0.25
 
-    def __init__(self, logger: logging.Logger = None, timeout: int = None):
+    # Maximum number of entries returned by snapshot().
+    MAX_PAGE = 1000
+
+    # Overflow policies.
+    POLICY_BACKPRESSURE = 'backpressure'
+    POLICY_DROP_OLDEST = 'drop_oldest'
+    POLICY_DROP_NEWEST = 'drop_newest'
+    POLICIES = (POLICY_BACKPRESSURE, POLICY_DROP_OLDEST, POLICY_DROP_NEWEST)
+
+    def __init__(self, logger: logging.Logger = None, timeout: int = None,
+                 max_bytes: int = None, max_msgs: int = None,
+                 high_water: float = 0.9, low_water: float = 0.7,
+                 policy: str = POLICY_BACKPRESSURE, clock: Clock = None):
         """Initialize a DelayQueue object.
 
         Args:
@@ -31,19 +64,51 @@ class DelayQueue:
                 not provided, then get a logger based on the class name.
             timeout (int): Optional; Timeout in seconds for accessing lock for
                 queue operations. If not provided, defaults to 0.1sec.
+            max_bytes (int): Optional; Maximum number of bytes queued.
+                Frames count the full capacity of their buffer. Use
+                :class:`None` or 0 for no limit.
+            max_msgs (int): Optional; Maximum number of messages queued.
+                Use :class:`None` or 0 for no limit.
+            high_water (float): Fill ratio (0-1] at which backpressure
+                is applied.
+            low_water (float): Fill ratio [0-1) at which backpressure
+                is released. Must not exceed high_water.
+            policy (str): Overflow policy. One of :attr:`POLICIES`.
+            clock (Clock): Optional; Clock used to timestamp messages. If
+                not provided, use the clock of
+                :class:`delay_server.delay.delay.CommDelay` at the time,
+                so that it follows :meth:`CommDelay.set_clock`.
 
         Returns:
             bool: A DelayQueue object.
+
+        Raises:
+            ValueError: Invalid budget, water marks or policy.
         """
+        if policy not in self.POLICIES:
+            raise ValueError("Invalid queue overflow policy " + str(policy))
+
+        if not 0 <= low_water <= high_water <= 1:
+            raise ValueError("Queue water marks must satisfy "
+                             "0 <= low_water <= high_water <= 1.")
+
+        if (max_bytes is not None and max_bytes < 0) or \
+                (max_msgs is not None and max_msgs < 0):
+            raise ValueError("Queue budget cannot be negative.")
+
         # Lock to make the queue thread safe.
         self._lock = LockTimeout()
 
         # Data structure to store first-in-first-out queue.
-        self._list = []
+        self._list = collections.deque()
 
         # Delay configuration.
         self._delay = CommDelay()
 
+        # Clock used to timestamp and release messages. If None, use the
+        # shared clock.
+        self._clock = clock
+
         # Assign a logger
         self._logger = logger
         if self._logger is None:
@@ -53,6 +118,31 @@ class DelayQueue:
         if timeout is not None:
             self._TIMEOUT = timeout
 
+        # Queue budget. Zero is treated as no limit.
+        self._max_bytes = max_bytes or None
+        self._max_msgs = max_msgs or None
+        self._high_water = high_water
+        self._low_water = low_water
+        self._policy = policy
+
+        # Number of bytes currently queued.
+        self._bytes = 0
+
+        # Set while the fill level is between the high and low water marks.
+        self._above_high_water = False
+
+        # Number of messages discarded by the overflow policy.
+        self._dropped_oldest = 0
+        self._dropped_newest = 0
+
+        # Release error (time popped after it was due) and ingress lag (time
+        # pushed after it was received) of the messages released.
+        self._released = 0
+        self._release_error_sum = 0.0
+        self._release_error_max = 0.0
+        self._ingress_lag_sum = 0.0
+        self._ingress_lag_max = 0.0
+
     def clear(self) -> int:
         """Clear the queue. Logs number of messages deleted.
 
@@ -66,7 +156,11 @@ class DelayQueue:
             raise LockError("Failed to get lock to clear queue.")
         length = len(self._list)
         self._logger.info('Clear %d from queue.', length)
+        for entry in self._list:
+            self._discard(entry['data'])
         self._list.clear()
+        self._bytes = 0
+        self._update_water_mark()
         self._lock.release()
         return length
 
@@ -87,17 +181,102 @@ class DelayQueue:
 
         ret = None
         if len(self._list) > 0:
-            delta = time.monotonic() - self._list[0]['timestamp']
-            if delta >= self._delay.time:
-                ret = self._list.pop(0)['data']
+            now = self.clock.monotonic()
+            delay = self._delay.time
+            delta = now - self._list[0]['timestamp']
+            if delta >= delay:
+                entry = self._list.popleft()
+                self._bytes -= entry['size']
+                self._update_water_mark()
+                self._record_release(delta - delay,
+                                     entry['pushed'] - entry['timestamp'])
+                ret = entry['data']
+        self._lock.release()
+        return ret
+
+    def next_deadline(self) -> float:
+        """Return when the oldest message is due for release.
+
+        Returns:
+            float: Time in the queue clock at which :meth:`pop` releases the
+                oldest message with the current delay, or :class:`None` if
+                the queue is empty.
+
+        Raises:
+            LockError: Failed to obtain lock for queue.
+        """
+        if not self._lock.acquire(blocking=True, timeout=self._TIMEOUT):
+            raise LockError("Failed to get lock to read queue deadline.")
+
+        ret = None
+        if len(self._list) > 0:
+            ret = self._list[0]['timestamp'] + self._delay.time
         self._lock.release()
         return ret
 
-    def push(self, obj: object) -> int:
+    def snapshot(self, start: int = 0, count: int = 10) -> dict:
+        """Return a page of queued messages and aggregate statistics.
+
+        Only the timestamps and sizes of the page are copied while holding
+        the lock, walking the queue from its nearer end, so pages at either
+        end of a long queue are cheap.
+
+        Args:
+            start (int): Position of the first message, oldest first.
+                Negative values count from the newest message, so -10 is the
+                page with the 10 newest messages.
+            count (int): Number of messages. Limited to :attr:`MAX_PAGE`.
+
+        Returns:
+            dict: Keys ``msgs`` and ``bytes`` with the queue totals,
+                ``delay`` and ``now`` in the queue clock, and ``entries``,
+                a list with a dict per message with its ``index``, ``size``,
+                ``ingress`` time and time ``remaining`` until release.
+
+        Raises:
+            LockError: Failed to obtain lock for queue.
+        """
+        count = max(0, min(count, self.MAX_PAGE))
+        delay = self._delay.time
+
+        if not self._lock.acquire(blocking=True, timeout=self._TIMEOUT):
+            raise LockError("Failed to get lock to inspect queue.")
+        length = len(self._list)
+        num_bytes = self._bytes
+        if start < 0:
+            start = max(0, length + start)
+        start = min(start, length)
+        count = min(count, length - start)
+        # Walk the deque once from the nearer end. Indexing a deque is
+        # linear in the distance to its nearer end for every entry.
+        if start > length - start - count:
+            skip = length - start - count
+            page = [(entry['timestamp'], entry['size']) for entry in
+                    itertools.islice(reversed(self._list), skip,
+                                     skip + count)]
+            page.reverse()
+        else:
+            page = [(entry['timestamp'], entry['size']) for entry in
+                    itertools.islice(self._list, start, start + count)]
+        now = self.clock.monotonic()
+        self._lock.release()
+
+        entries = [dict(index=start + i, size=size, ingress=timestamp,
+                        remaining=timestamp + delay - now)
+                   for i, (timestamp, size) in enumerate(page)]
+        return dict(msgs=length, bytes=num_bytes, delay=delay, now=now,
+                    entries=entries)
+
+    def push(self, obj: object, timestamp: float = None) -> int:
         """Push :class:`object` into the queue.
 
+        If the queue budget is exhausted, the overflow policy is applied and
+        the discarded message is counted. See class description.
+
         Args:
             obj (object): Data to push into the queue. Cannot be None.
+            timestamp (float): Optional; Time the object was received, in the
+                queue clock. Defaults to now.
 
         Returns:
             int: Queue size
@@ -109,15 +288,191 @@ class DelayQueue:
         if obj is None:
             raise AttributeError('Push value cannot be None.')
 
+        size = self._sizeof(obj)
+
         if not self._lock.acquire(blocking=True, timeout=self._TIMEOUT):
             raise LockError("Failed to get lock to push into the queue.")
 
-        self._list.append(dict(timestamp=time.monotonic(), data=obj))
+        if self._fits(size, len(self._list)):
+            self._append(obj, size, timestamp)
+        elif self._policy == self.POLICY_DROP_OLDEST and \
+                self._fits(size, 0, 0):
+            while not self._fits(size, len(self._list)):
+                entry = self._list.popleft()
+                self._bytes -= entry['size']
+                self._dropped_oldest += 1
+                self._discard(entry['data'])
+            self._logger.debug('Queue full. Dropped oldest (total=%d).',
+                               self._dropped_oldest)
+            self._append(obj, size, timestamp)
+        else:
+            self._dropped_newest += 1
+            self._discard(obj)
+            self._logger.debug('Queue full. Dropped newest (total=%d).',
+                               self._dropped_newest)
+
         length = len(self._list)
         self._lock.release()
 
         return length
 
+    @property
+    def backpressure(self) -> bool:
+        """True if producers should stop reading to let the queue drain.
+
+        Only applies to the :attr:`POLICY_BACKPRESSURE` overflow policy.
+        Set when the fill level reaches the high water mark and cleared once
+        it drops below the low water mark.
+        """
+        return self._policy == self.POLICY_BACKPRESSURE and \
+            self._above_high_water
+
+    @property
+    def clock(self) -> Clock:
+        """Clock used to timestamp and release messages."""
+        if self._clock is None:
+            return self._delay.clock
+        return self._clock
+
+    @property
+    def shared_clock(self) -> bool:
+        """True if the queue follows the clock of
+        :class:`delay_server.delay.delay.CommDelay`."""
+        return self._clock is None
+
+    def stats(self) -> dict:
+        """Return the current queue depth against its budget.
+
+        Returns:
+            dict: Queue statistics with keys ``msgs``, ``bytes``,
+                ``max_msgs``, ``max_bytes``, ``fill``, ``high_water``,
+                ``low_water``, ``policy``, ``backpressure``,
+                ``dropped_oldest``, ``dropped_newest``, ``released`` and the
+                mean and max in seconds of the ``release_error`` (time
+                popped after due) and ``ingress_lag`` (time pushed after
+                received) of released messages.
+
+        Raises:
+            LockError: Failed to obtain lock for queue.
+        """
+        if not self._lock.acquire(blocking=True, timeout=self._TIMEOUT):
+            raise LockError("Failed to get lock to get queue stats.")
+
+        ret = dict(msgs=len(self._list),
+                   bytes=self._bytes,
+                   max_msgs=self._max_msgs,
+                   max_bytes=self._max_bytes,
+                   fill=self._fill(),
+                   high_water=self._high_water,
+                   low_water=self._low_water,
+                   policy=self._policy,
+                   backpressure=self.backpressure,
+                   dropped_oldest=self._dropped_oldest,
+                   dropped_newest=self._dropped_newest,
+                   released=self._released,
+                   release_error_mean=self._mean(self._release_error_sum),
+                   release_error_max=self._release_error_max,
+                   ingress_lag_mean=self._mean(self._ingress_lag_sum),
+                   ingress_lag_max=self._ingress_lag_max)
+        self._lock.release()
+        return ret
+
+    @staticmethod
+    def _sizeof(obj: object) -> int:
+        """Return number of bytes counted against the budget for obj.
+
+        Frames count the capacity of their pool buffer rather than their
+        length, since that is the memory they hold while queued.
+        """
+        capacity = getattr(obj, 'capacity', None)
+        if capacity is not None:
+            return capacity
+        try:
+            return len(obj)
+        except TypeError:
+            return 0
+
+    @staticmethod
+    def _discard(obj: object) -> None:
+        """Release pooled resources held by a discarded object."""
+        release = getattr(obj, 'release', None)
+        if callable(release):
+            release()
+
+    def _fits(self, size: int, msgs: int, num_bytes: int = None) -> bool:
+        """Check if a message of the given size fits within the budget.
+
+        Args:
+            size (int): Size of the new message.
+            msgs (int): Number of messages already queued.
+            num_bytes (int): Number of bytes already queued. Defaults to the
+                current queue contents.
+
+        Returns:
+            bool: True if the message can be queued.
+        """
+        if num_bytes is None:
+            num_bytes = self._bytes
+        if self._max_msgs is not None and msgs + 1 > self._max_msgs:
+            return False
+        if self._max_bytes is not None and num_bytes + size > self._max_bytes:
+            return False
+        return True
+
+    def _append(self, obj: object, size: int,
+                timestamp: float = None) -> None:
+        """Append message to the queue. Must be called holding the lock."""
+        now = self.clock.monotonic()
+        if timestamp is None:
+            timestamp = now
+        self._list.append(dict(timestamp=timestamp, pushed=now, size=size,
+                               data=obj))
+        self._bytes += size
+        self._update_water_mark()
+
+    def _record_release(self, error: float, lag: float) -> None:
+        """Accumulate release statistics. Must be called holding the lock."""
+        self._released += 1
+        self._release_error_sum += error
+        self._release_error_max = max(self._release_error_max, error)
+        self._ingress_lag_sum += lag
+        self._ingress_lag_max = max(self._ingress_lag_max, lag)
+
+    def _mean(self, total: float) -> float:
+        """Return mean over released messages. Must be called holding the
+        lock."""
+        if self._released == 0:
+            return 0.0
+        return total / self._released
+
+    def _fill(self) -> float:
+        """Return fill ratio against the budget. Zero if there is no budget.
+        Must be called holding the lock."""
+        fill = 0.0
+        if self._max_msgs is not None:
+            fill = len(self._list) / self._max_msgs
+        if self._max_bytes is not None:
+            fill = max(fill, self._bytes / self._max_bytes)
+        return fill
+
+    def _update_water_mark(self) -> None:
+        """Update and log water mark transitions. Must be called holding the
+        lock."""
+        fill = self._fill()
+        if not self._above_high_water and fill >= self._high_water and \
+                fill > 0:
+            self._above_high_water = True
+            self._logger.warning('Queue above high water mark '
+                                 '(msgs=%d/%s, bytes=%d/%s).',
+                                 len(self._list), self._max_msgs,
+                                 self._bytes, self._max_bytes)
+        elif self._above_high_water and fill < self._low_water:
+            self._above_high_water = False
+            self._logger.info('Queue below low water mark '
+                              '(msgs=%d/%s, bytes=%d/%s).',
+                              len(self._list), self._max_msgs,
+                              self._bytes, self._max_bytes)
+
     def __len__(self) -> int:
         """Return queue size.
 
@@ -137,6 +492,9 @@ class DelayQueue:
     def __str__(self) -> str:
         """Return string representation of queue contents.
 
+        The lock is only held to copy the list of entries. Use
+        :meth:`snapshot` to inspect long queues.
+
         Returns:
             str: Concatenate the string representation of all objects in the
                 queue. If the item is a :class:`bytes` or :class:`bytearray`
@@ -147,13 +505,13 @@ class DelayQueue:
         """
         if not self._lock.acquire(blocking=True, timeout=self._TIMEOUT):
             raise LockError("Failed to get lock to see queue contents.")
+        entries = list(self._list)
+        self._lock.release()
 
-        ret = "["
-        for i in self._list:
-            if isinstance(i['data'], (bytes, bytearray)):
-                ret += str(len(i['data'])) + ", "
+        items = []
+        for entry in entries:
+            if isinstance(entry['data'], (bytes, bytearray)):
+                items.append(str(len(entry['data'])) + ", ")
             else:
-                ret += str(i['data']) + ", "
-        ret += "]"
-        self._lock.release()
-        return ret
+                items.append(str(entry['data']) + ", ")
+        return "[" + "".join(items) + "]"
@@ -0,0 +1,110 @@
+"""CPU affinity and scheduling policy of the calling thread.
+
+On Linux, :py:func:`os.sched_setaffinity` and :py:func:`os.sched_setscheduler`
+with a PID of 0 apply to the calling thread only, so each proxy thread can
+pin itself to its own cores and request a real-time policy. Both calls are
+optional: on other platforms, or without the privileges needed for a
+real-time policy, the thread keeps the scheduling it has and a warning is
+logged.
+"""
+import logging
+import os
+
+# Scheduling policies by config name. Only those available on the platform.
+POLICIES = {name: getattr(os, attr)
+            for name, attr in (('other', 'SCHED_OTHER'),
+                               ('fifo', 'SCHED_FIFO'),
+                               ('rr', 'SCHED_RR'))
+            if hasattr(os, attr)}
+
+
+def parse_cpus(text: str) -> set:
+    """Parse a list of CPUs such as ``0,2`` or ``2-3``.
+
+    Args:
+        text (str): Comma separated CPU numbers or ranges.
+
+    Returns:
+        set: CPU numbers, or :class:`None` if the text is empty.
+
+    Raises:
+        ValueError: Invalid CPU list.
+    """
+    cpus = set()
+    for item in text.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        first, _, last = item.partition('-')
+        first = int(first)
+        last = int(last) if last else first
+        if first < 0 or last < first:
+            raise ValueError("Invalid CPU range " + item)
+        cpus.update(range(first, last + 1))
+    return cpus or None
+
+
+def describe() -> str:
+    """Return the scheduling policy, priority and affinity of the calling
+    thread, or an empty string if the platform does not report them."""
+    try:
+        policy = os.sched_getscheduler(0)
+        priority = os.sched_getparam(0).sched_priority
+        cpus = sorted(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        return ''
+    names = {value: name for name, value in POLICIES.items()}
+    return f"policy={names.get(policy, policy)} priority={priority} " \
+           f"cpus={','.join(str(cpu) for cpu in cpus)}"
+
+
+def set_thread_sched(cpus: set = None, policy: str = None,
+                     priority: int = 0,
+                     logger: logging.Logger = None) -> bool:
+    """Set the CPU affinity and scheduling policy of the calling thread.
+
+    Failures are logged and otherwise ignored so that the thread can keep
+    running with the default scheduling.
+
+    Args:
+        cpus (set): Optional; CPUs the thread may run on.
+        policy (str): Optional; Scheduling policy. One of :data:`POLICIES`.
+        priority (int): Static priority for the ``fifo`` and ``rr``
+            policies.
+        logger (logging.Logger): Logger associated with parent class.
+
+    Returns:
+        bool: True if every requested setting was applied.
+    """
+    if logger is None:
+        logger = logging.getLogger(__name__)
+
+    ret = True
+    if cpus:
+        try:
+            os.sched_setaffinity(0, cpus)
+        except AttributeError:
+            logger.warning('CPU affinity not supported.')
+            ret = False
+        except (OSError, ValueError) as e:
+            logger.warning('Failed to set CPU affinity to %s: %s',
+                           sorted(cpus), e)
+            ret = False
+
+    if policy is not None:
+        try:
+            os.sched_setscheduler(0, POLICIES[policy],
+                                  os.sched_param(priority))
+        except KeyError:
+            logger.warning('Scheduling policy "%s" not supported.', policy)
+            ret = False
+        except AttributeError:
+            logger.warning('Scheduling policies not supported.')
+            ret = False
+        except (OSError, ValueError) as e:
+            logger.warning('Failed to set scheduling policy %s (priority '
+                           '%d): %s', policy, priority, e)
+            ret = False
+
+    logger.info('Scheduling %s', describe() or 'unknown')
+    return ret
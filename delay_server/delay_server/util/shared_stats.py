@@ -0,0 +1,305 @@
+"""Server statistics shared with the GUI process.
+
+The GUI runs in its own process so that redraws never compete with the
+proxy threads for the interpreter. The server publishes its statistics to a
+block of :py:mod:`multiprocessing.shared_memory` that the GUI reads without
+writing to it.
+
+The block is protected by a sequence lock: the writer makes the sequence
+number odd before it updates the block and even once done. A reader copies
+the block and retries if the sequence number was odd or changed while it
+was copying, so neither side ever waits on the other.
+
++--------+----------------------------------------------------------------+
+| Header | Magic, sequence, number of links, update time, delay and MET   |
++--------+----------------------------------------------------------------+
+| Link   | Name, queue depth and budget, fill, rates, drops, backpressure |
+|        | and the oldest and newest messages in flight                   |
++--------+----------------------------------------------------------------+
+| ...    | One record per link                                            |
++--------+----------------------------------------------------------------+
+"""
+import logging
+import struct
+import threading
+import time
+from multiprocessing import shared_memory
+
+from delay_server.delay.delay import CommDelay
+from delay_server.util.exceptions import LockError
+
+MAGIC = b'DLYSTAT1'
+
+# Magic, sequence, number of links, update time (epoch), delay and MET.
+HEADER = struct.Struct('= 8s Q I d d d')
+
+# Sequence number within the header.
+SEQ = struct.Struct('= Q')
+SEQ_OFFSET = 8
+
+# Link name, msgs, bytes, max_msgs, max_bytes, fill, rate_in, rate_out,
+# dropped_oldest, dropped_newest and backpressure.
+LINK = struct.Struct('= 16s Q Q Q Q d d d Q Q ?')
+LINK_FIELDS = ('msgs', 'bytes', 'max_msgs', 'max_bytes', 'fill', 'rate_in',
+               'rate_out', 'dropped_oldest', 'dropped_newest', 'backpressure')
+
+# Number of oldest and newest messages in flight published per link.
+INSPECT = 5
+
+# Number of oldest and newest messages that follow the link record.
+COUNTS = struct.Struct('= B B')
+
+# Queue position, size, age and time until release (in sec) of a message.
+ENTRY = struct.Struct('= Q I d d')
+ENTRY_FIELDS = ('index', 'size', 'age', 'remaining')
+
+# Size of the record of each link.
+LINK_STRIDE = LINK.size + COUNTS.size + 2 * INSPECT * ENTRY.size
+
+
+def attach(name: str) -> shared_memory.SharedMemory:
+    """Attach to an existing shared memory block without taking ownership,
+    so that it is not removed when this process exits."""
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # Python < 3.13. Blocks are only tracked by the process that
+        # created them when attached from a child process.
+        return shared_memory.SharedMemory(name)
+
+
+class SharedStats:
+    """Statistics block in shared memory.
+
+    The server creates the block and calls :meth:`write`. The GUI attaches
+    to it by name and calls :meth:`read`. There must only be one writer.
+    """
+
+    # Attempts to get a consistent copy before giving up.
+    _RETRIES = 100
+
+    def __init__(self, name: str = None, links: tuple = (),
+                 create: bool = False):
+        """Create or attach to a statistics block.
+
+        Args:
+            name (str): Name of the block. Optional when creating it.
+            links (tuple): Names of the links. Only used when creating it.
+            create (bool): Create the block instead of attaching to it.
+
+        Raises:
+            FileNotFoundError: No block with this name.
+            ValueError: Not a statistics block, or link name too long.
+        """
+        self._create = create
+        if create:
+            names = [link.encode() for link in links]
+            if any(len(link) > 16 for link in names):
+                raise ValueError("Link names are limited to 16 bytes.")
+            size = HEADER.size + LINK_STRIDE * len(names)
+            self._shm = shared_memory.SharedMemory(name, True, size)
+            HEADER.pack_into(self._shm.buf, 0, MAGIC, 0, len(names), 0, 0, 0)
+            for i, link in enumerate(names):
+                LINK.pack_into(self._shm.buf, HEADER.size + i * LINK_STRIDE,
+                               link, *([0] * (len(LINK_FIELDS) - 1)), False)
+            self._links = list(links)
+        else:
+            self._shm = attach(name)
+            header = HEADER.unpack_from(self._shm.buf)
+            if header[0] != MAGIC:
+                self._shm.close()
+                raise ValueError("Not a statistics block " + str(name))
+            self._links = []
+            for i in range(header[2]):
+                link = LINK.unpack_from(self._shm.buf,
+                                        HEADER.size + i * LINK_STRIDE)[0]
+                self._links.append(link.rstrip(b'\0').decode())
+
+    @property
+    def name(self) -> str:
+        """Name of the shared memory block."""
+        return self._shm.name
+
+    @property
+    def links(self) -> list:
+        """Names of the links."""
+        return list(self._links)
+
+    def write(self, delay: float, met: float, links: dict) -> None:
+        """Publish new statistics.
+
+        Args:
+            delay (float): Current delay in seconds.
+            met (float): Mission elapsed time in seconds.
+            links (dict): Statistics of each link, with the keys in
+                :data:`LINK_FIELDS`. Missing links and keys are left as
+                they were. The optional keys ``oldest`` and ``newest`` list
+                up to :data:`INSPECT` messages in flight as dicts with the
+                keys in :data:`ENTRY_FIELDS`.
+        """
+        buf = self._shm.buf
+        seq = SEQ.unpack_from(buf, SEQ_OFFSET)[0]
+        SEQ.pack_into(buf, SEQ_OFFSET, seq + 1)
+        HEADER.pack_into(buf, 0, MAGIC, seq + 1, len(self._links),
+                         time.time(), delay, met)
+        for i, link in enumerate(self._links):
+            stats = links.get(link)
+            if stats is None:
+                continue
+            offset = HEADER.size + i * LINK_STRIDE
+            values = list(LINK.unpack_from(buf, offset))
+            for j, field in enumerate(LINK_FIELDS):
+                if stats.get(field) is not None:
+                    values[j + 1] = stats[field]
+            LINK.pack_into(buf, offset, *values)
+            if 'oldest' in stats or 'newest' in stats:
+                self._write_entries(offset + LINK.size,
+                                    stats.get('oldest', [])[:INSPECT],
+                                    stats.get('newest', [])[-INSPECT:])
+        SEQ.pack_into(buf, SEQ_OFFSET, seq + 2)
+
+    def _write_entries(self, offset: int, oldest: list,
+                       newest: list) -> None:
+        """Write the oldest and newest messages of a link."""
+        buf = self._shm.buf
+        COUNTS.pack_into(buf, offset, len(oldest), len(newest))
+        offset += COUNTS.size
+        for i, entry in enumerate(oldest + newest):
+            if i == len(oldest):
+                offset += (INSPECT - len(oldest)) * ENTRY.size
+            ENTRY.pack_into(buf, offset,
+                            *(entry[field] for field in ENTRY_FIELDS))
+            offset += ENTRY.size
+
+    def read(self) -> dict:
+        """Return a consistent copy of the statistics.
+
+        Returns:
+            dict: Keys ``seq``, ``updated`` (epoch), ``delay``, ``met`` and
+                ``links``, which maps each link name to a dict with the keys
+                in :data:`LINK_FIELDS`, ``oldest`` and ``newest``.
+                :class:`None` if the writer kept updating the block.
+        """
+        buf = self._shm.buf
+        for _ in range(self._RETRIES):
+            seq = SEQ.unpack_from(buf, SEQ_OFFSET)[0]
+            if seq % 2:
+                time.sleep(0)
+                continue
+            data = bytes(buf)
+            if SEQ.unpack_from(buf, SEQ_OFFSET)[0] != seq:
+                continue
+            _, _, num_links, updated, delay, met = HEADER.unpack_from(data)
+            links = {}
+            for i in range(num_links):
+                offset = HEADER.size + i * LINK_STRIDE
+                values = LINK.unpack_from(data, offset)
+                link = dict(zip(LINK_FIELDS, values[1:]))
+                offset += LINK.size
+                num_oldest, num_newest = COUNTS.unpack_from(data, offset)
+                offset += COUNTS.size
+                link['oldest'] = [
+                    dict(zip(ENTRY_FIELDS, ENTRY.unpack_from(
+                        data, offset + j * ENTRY.size)))
+                    for j in range(num_oldest)]
+                offset += INSPECT * ENTRY.size
+                link['newest'] = [
+                    dict(zip(ENTRY_FIELDS, ENTRY.unpack_from(
+                        data, offset + j * ENTRY.size)))
+                    for j in range(num_newest)]
+                links[values[0].rstrip(b'\0').decode()] = link
+            return dict(seq=seq, updated=updated, delay=delay, met=met,
+                        links=links)
+        return None
+
+    def close(self) -> None:
+        """Detach from the block. The creator also removes it."""
+        self._shm.close()
+        if self._create:
+            self._shm.unlink()
+
+
+class StatsPublisher:
+    """Thread that periodically publishes the statistics of each proxy."""
+
+    def __init__(self, stats: SharedStats, proxies: dict,
+                 interval: float = 1.0, logger: logging.Logger = None):
+        """Initialize.
+
+        Args:
+            stats (SharedStats): Block to publish to.
+            proxies (dict): Map of link name to
+                :class:`delay_server.delay.proxy.DelayProxy`.
+            interval (float): Time between updates in seconds.
+            logger (logging.Logger): Logger associated with parent class.
+        """
+        self._stats = stats
+        self._proxies = proxies
+        self._interval = interval
+        self._logger = logger
+        if self._logger is None:
+            self._logger = logging.getLogger(self.__class__.__name__)
+        self._delay = CommDelay()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Frames received and released by each link at the last update.
+        self._counts = {}
+        self._last = None
+
+    def start(self) -> None:
+        """Start publishing."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='stats_publisher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop publishing."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def publish(self) -> None:
+        """Publish the current statistics."""
+        now = self._delay.clock.monotonic()
+        elapsed = None if self._last is None else now - self._last
+        self._last = now
+
+        links = {}
+        for name, proxy in self._proxies.items():
+            stats = proxy.get_queue_stats()
+            received = proxy.get_received_count()
+            released = stats['released']
+            prev = self._counts.get(name)
+            self._counts[name] = (received, released)
+            if prev is not None and elapsed:
+                stats['rate_in'] = (received - prev[0]) / elapsed
+                stats['rate_out'] = (released - prev[1]) / elapsed
+            stats['max_msgs'] = stats['max_msgs'] or 0
+            stats['max_bytes'] = stats['max_bytes'] or 0
+            stats['oldest'] = self._entries(
+                proxy.get_queue_snapshot(0, INSPECT))
+            stats['newest'] = self._entries(
+                proxy.get_queue_snapshot(-INSPECT, INSPECT))
+            links[name] = stats
+        self._stats.write(self._delay.time, self._delay.mission_time, links)
+
+    @staticmethod
+    def _entries(snapshot: dict) -> list:
+        """Convert a queue snapshot to the entries published."""
+        now = snapshot['now']
+        return [dict(index=entry['index'], size=entry['size'],
+                     age=now - entry['ingress'],
+                     remaining=entry['remaining'])
+                for entry in snapshot['entries']]
+
+    def _run(self) -> None:
+        """Publisher thread."""
+        while not self._stop.is_set():
+            try:
+                self.publish()
+            except LockError as e:
+                self._logger.debug('Skipped stats update: %s', e)
+            self._delay.clock.wait(self._stop, self._interval)
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Packet protocol conformance for the Delay Server."""
+import unittest
+import socket
+import sys
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.delay.socket import DelayServerSocket
+from delay_common.conformance import CodecConformance
+from delay_server.util.exceptions import SocketSendEmptyMessage, \
+    SocketSendPktInvalidLength
+
+
+@unittest.skipIf(sys.platform.startswith("win"),
+                 "Will not work on Windows")
+class TestCodecConformance(CodecConformance, TestClass):
+    """Run the shared conformance suite on DelayServerSocket."""
+
+    def setUp(self):
+        self._server = DelayServerSocket()
+        self._sock_send, self._sock_recv = socket.socketpair()
+
+    def tearDown(self):
+        self._sock_send.close()
+        self._sock_recv.close()
+        self._server._sock.close()
+
+    def encode(self, data: bytes) -> bytes:
+        try:
+            num_bytes = self._server._send_packet(self._sock_send, data)
+        except (SocketSendEmptyMessage, SocketSendPktInvalidLength):
+            return None
+        return self._sock_recv.recv(num_bytes, socket.MSG_WAITALL)
+
+    def decode(self, chunks: list) -> list:
+        ret = []
+        for chunk in chunks:
+            self._sock_send.sendall(chunk)
+            for frame in self._server._recv_packets(self._sock_recv):
+                ret.append(bytes(frame.data))
+                frame.release()
+        return ret
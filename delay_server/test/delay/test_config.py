@@ -1,10 +1,13 @@
 """Test for delay.config module."""
+import dataclasses
 import mock
 import configparser
 
 # pylint: disable=E0401
 from test.test_custom_class import TestClass
-from delay_server.delay.config import DelayConfig
+from delay_server.delay.config import DelayConfig, parse_config, \
+    check_reject
+from delay_server.util.exceptions import ConfigError
 
 
 class TestDelayConfig(TestClass):
@@ -56,3 +59,89 @@ class TestDelayConfig(TestClass):
     def test_repr(self):
         rtr = self._config.__repr__()
         self.assertIsNotNone(rtr)
+
+    def _parser(self):
+        """Return a parser holding the default config file."""
+        parser = configparser.ConfigParser()
+        parser.optionxform = str
+        parser.read('config.ini')
+        return parser
+
+    def test_snapshot(self):
+        self.assertTrue(self._config._read_config())
+        snapshot = self._config.snapshot
+        self.assertEqual(snapshot.link('mcc').port_recv, 1000)
+        self.assertEqual(snapshot.link('mcc').port_send, 1002)
+        self.assertEqual(snapshot.link('hab').port_recv, 1001)
+        self.assertEqual(snapshot.link('hab').display_name, 'LMAH')
+        self.assertRaises(KeyError, snapshot.link, 'dummy')
+        self.assertEqual(snapshot.reject, ())
+        self.assertEqual(snapshot.queue.policy, 'backpressure')
+        self.assertEqual(snapshot.gc.thresholds, (50000, 20, 100))
+        self.assertAlmostEqual(snapshot.gc.warn_pause, 0.01)
+        self.assertIsNone(snapshot.proxy.producer_cpus)
+        self.assertEqual(snapshot.proxy.max_message_len, 64 << 20)
+        self.assertIsNone(snapshot.mission.start_time)
+        self.assertEqual(snapshot.delay_schedule, ((0, '0'),))
+        self.assertEqual(snapshot.overrides, (('Test Override 1', 300.0),
+                                              ('Test Override 2', 1200.0)))
+
+        # Snapshot is cached and read-only.
+        self.assertIs(self._config.snapshot, snapshot)
+        with self.assertRaises(dataclasses.FrozenInstanceError):
+            snapshot.queue.max_msgs = 1
+
+        # No snapshot if the file failed to load.
+        self.assertFalse(self._config._read_config("dummy.ini"))
+        self.assertRaises(ConfigError, lambda: self._config.snapshot)
+        self.assertTrue(self._config._read_config())
+
+    def test_parse_config(self):
+        parser = self._parser()
+        parser.set('network', 'reject', '192.168.1.*, 10.0.0.0/8')
+        parser.set('proxy', 'producer_cpus', '0-1')
+        parser.set('proxy', 'sched_policy', 'fifo')
+        parser.set('mission', 'start_time', '2021-02-28 10:00:00')
+        parser.set('dynamic_delay', '100', '(t - 100) + 0.1')
+        snapshot = parse_config(parser)
+        self.assertEqual(snapshot.reject, ('192.168.1.*', '10.0.0.0/8'))
+        self.assertEqual(snapshot.proxy.producer_cpus, frozenset((0, 1)))
+        self.assertEqual(snapshot.proxy.sched_policy, 'fifo')
+        self.assertEqual(snapshot.mission.start_time.hour, 10)
+        self.assertEqual(snapshot.delay_schedule,
+                         ((0, '0'), (100, '(t - 100) + 0.1')))
+
+    def test_parse_config_errors(self):
+        parser = self._parser()
+        parser.set('queue', 'max_msgs', 'many')
+        parser.set('queue', 'low_water', '0.95')
+        parser.set('network', 'hab_port_send', '1000')
+        parser.set('network', 'reject', '192.*.1.1')
+        parser.set('proxy', 'release_precision', 'extreme')
+        parser.set('gc', 'thresholds', '1, 2')
+        parser.set('dynamic_delay', 'later', '1')
+        parser.set('dynamic_delay', '100', 't +')
+        parser.set('dynamic_delay', '200', 't.real')
+        parser.remove_option('gui', 'enabled')
+        with self.assertRaises(ConfigError) as context:
+            parse_config(parser)
+        errors = str(context.exception).splitlines()
+        self.assertEqual(len(errors), 10)
+        self.assertIn('config[dynamic_delay][100] = "t +" - Expected delay '
+                      'expression in terms of t (Invalid expression t +).',
+                      errors)
+        self.assertIn('config[queue][max_msgs] = "many" - Expected int >= 0.',
+                      errors)
+        self.assertIn('Did not find config[gui][enabled]', errors)
+        for error in errors:
+            self._logger.info(error)
+
+    def test_check_reject(self):
+        self.assertTrue(check_reject('192.168.1.1'))
+        self.assertTrue(check_reject('192.168.*.*'))
+        self.assertTrue(check_reject('10.0.0.0/8'))
+        self.assertTrue(check_reject('::1'))
+        self.assertFalse(check_reject('192.168.*'))
+        self.assertFalse(check_reject('*.168.1.1'))
+        self.assertFalse(check_reject('192.168.1.256'))
+        self.assertFalse(check_reject('host'))
@@ -0,0 +1,113 @@
+""" Test for delay.config_watcher module. """
+import datetime
+import os
+import shutil
+import tempfile
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.delay.config import DelayConfig
+from delay_server.delay.config_watcher import ConfigWatcher
+from delay_server.delay.delay import CommDelay
+
+
+class TestConfigWatcher(TestClass):
+    """Test class for config reloads."""
+
+    def setUp(self):
+        CommDelay().clear_override()
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._dir.name, 'config.ini')
+        shutil.copy('config.ini', self._path)
+        self._config = DelayConfig()
+        self.assertTrue(self._config._read_config(self._path))
+        self._watcher = ConfigWatcher(self._config)
+        self._snapshots = []
+        self._watcher.add_listener(self._snapshots.append)
+
+    def tearDown(self):
+        CommDelay().set_schedule()
+        CommDelay().set_start_time()
+        self._config._read_config()
+        self._dir.cleanup()
+
+    def _edit(self, old: str, new: str) -> None:
+        """Replace text in the config file and bump its modification
+        time."""
+        with open(self._path) as file:
+            text = file.read()
+        self.assertIn(old, text)
+        with open(self._path, 'w') as file:
+            file.write(text.replace(old, new))
+        stat = os.stat(self._path)
+        os.utime(self._path, ns=(stat.st_atime_ns,
+                                 stat.st_mtime_ns + 1000000000))
+
+    def test_unchanged(self):
+        self.assertFalse(self._watcher.check())
+        self.assertEqual(self._watcher.reloads, 0)
+
+    def test_reload(self):
+        old = self._config.snapshot
+        self._edit('\n0 = 0\n', '\n0 = 25\n')
+        self._edit('reject = \n', 'reject = 10.0.0.*\n')
+        with self.assertLogs('ConfigWatcher', 'INFO') as logs:
+            self.assertTrue(self._watcher.check())
+        self.assertEqual(self._watcher.reloads, 1)
+        self.assertEqual(CommDelay().time, 25)
+
+        new = self._config.snapshot
+        self.assertIsNot(new, old)
+        self.assertEqual(new.reject, ('10.0.0.*',))
+        self.assertEqual(self._snapshots, [new])
+        self.assertEqual(self._config.get('network', 'reject'), '10.0.0.*')
+        self.assertTrue(any("delay_schedule: ((0, '0'),) -> ((0, '25'),)"
+                            in line for line in logs.output))
+
+        # Settings that need a restart are reported.
+        self._edit('max_msgs = 1000000', 'max_msgs = 10')
+        with self.assertLogs('ConfigWatcher', 'WARNING') as logs:
+            self.assertTrue(self._watcher.check())
+        self.assertIn('queue.max_msgs: 1000000 -> 10 (applies after restart)',
+                      logs.output[0])
+
+    def test_start_time(self):
+        start = datetime.datetime.now() - datetime.timedelta(seconds=100)
+        self._edit('start_time = \n',
+                   start.strftime('start_time = %Y-%m-%d %H:%M:%S\n'))
+        with self.assertLogs('ConfigWatcher', 'INFO') as logs:
+            self.assertTrue(self._watcher.check())
+        self.assertAlmostEqual(CommDelay().mission_time, 100, delta=2)
+        self.assertFalse(any('restart' in line for line in logs.output))
+
+        # Reloads without changes to the start time keep the mission time.
+        self._edit('reject = \n', 'reject = 10.0.0.*\n')
+        self.assertTrue(self._watcher.check())
+        self.assertAlmostEqual(CommDelay().mission_time, 100, delta=2)
+
+    def test_invalid(self):
+        old = self._config.snapshot
+        self._edit('max_msgs = 1000000', 'max_msgs = many')
+        with self.assertLogs('ConfigWatcher', 'ERROR'):
+            self.assertFalse(self._watcher.check())
+        self.assertEqual(self._watcher.failures, 1)
+        self.assertIs(self._config.snapshot, old)
+        self.assertEqual(self._config.get('queue', 'max_msgs'), '1000000')
+        self.assertEqual(self._snapshots, [])
+
+        # Invalid delay expressions are rejected before anything is applied.
+        self._edit('max_msgs = many', 'max_msgs = 1000000')
+        self._edit('\n0 = 0\n', '\n0 = 5\n100 = t +\n')
+        with self.assertLogs('ConfigWatcher', 'ERROR'):
+            self.assertFalse(self._watcher.check())
+        self.assertIs(self._config.snapshot, old)
+        self.assertEqual(CommDelay().time, 0)
+
+        # Missing file keeps the config.
+        os.remove(self._path)
+        self.assertFalse(self._watcher.check())
+        self.assertIs(self._config.snapshot, old)
+
+    def test_thread(self):
+        self._watcher.start()
+        self._watcher.stop()
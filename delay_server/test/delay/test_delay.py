@@ -1,7 +1,11 @@
 """ Test for delay.config module. """
+import datetime
+
 # pylint: disable=E0401
 from test.test_custom_class import TestClass
-from delay_server.delay.delay import CommDelay
+from delay_server.delay.delay import CommDelay, DelaySchedule, \
+    compile_delay
+from delay_server.util.clock import SimulatedClock, REAL_CLOCK
 
 
 class TestCommDelay(TestClass):
@@ -46,3 +50,68 @@ class TestCommDelay(TestClass):
         self.assertEqual(config.time, 5)
         config.clear_override()
         self.assertEqual(config.time, 0)
+
+    def test_clock(self):
+        config = CommDelay()
+        self.assertIs(config.clock, REAL_CLOCK)
+
+        # Mission time restarts with the new clock.
+        clock = SimulatedClock(50)
+        config.set_clock(clock)
+        self.assertIs(config.clock, clock)
+        self.assertEqual(config.mission_time, 0)
+        clock.advance(1200)
+        self.assertEqual(config.mission_time, 1200)
+        config.set_clock()
+        self.assertIs(config.clock, REAL_CLOCK)
+
+    def test_start_time(self):
+        config = CommDelay()
+        config.set_schedule(DelaySchedule(((100, '30'), (0, '10'))))
+
+        # Mission time counts from the configured start time.
+        config.set_start_time(datetime.datetime.now() -
+                              datetime.timedelta(seconds=150))
+        self.assertAlmostEqual(config.mission_time, 150, delta=1)
+        self.assertEqual(config.time, 30)
+
+        # Replacing the clock keeps the start time.
+        config.set_clock()
+        self.assertAlmostEqual(config.mission_time, 150, delta=1)
+
+        # Defaults to now.
+        config.set_start_time()
+        self.assertAlmostEqual(config.mission_time, 0, delta=1)
+        self.assertEqual(config.time, 10)
+        config.set_schedule()
+
+    def test_schedule(self):
+        config = CommDelay()
+        clock = SimulatedClock(0)
+        config.set_clock(clock)
+
+        schedule = DelaySchedule(((100, '30'), (0, '10')))
+        self.assertEqual(len(schedule), 2)
+        self.assertEqual(schedule.delay(-1), 0)
+        self.assertEqual(schedule.delay(0), 10)
+        self.assertEqual(schedule.delay(99.9), 10)
+        self.assertEqual(schedule.delay(100), 30)
+        self.assertEqual(DelaySchedule(((0, '-5'),)).delay(1), 0)
+
+        # Delay follows the mission time unless overridden.
+        self.assertTrue(config.set_schedule(schedule))
+        self.assertEqual(config.time, 10)
+        clock.advance(150)
+        self.assertEqual(config.time, 30)
+        self.assertTrue(config.set_override(5.0))
+        self.assertEqual(config.time, 5)
+        config.clear_override()
+        self.assertTrue(config.set_schedule())
+        self.assertEqual(config.time, 0)
+        config.set_clock()
+
+    def test_compile_delay(self):
+        self.assertEqual(compile_delay('300')(5), 300)
+        self.assertEqual(compile_delay(' 1.5 ')(5), 1.5)
+        self.assertRaises(ValueError, compile_delay, 't +')
+        self.assertRaises(ValueError, DelaySchedule, ((0, 't +'),))
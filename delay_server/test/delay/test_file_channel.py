@@ -0,0 +1,191 @@
+""" Test for delay.file_channel module. """
+import os
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.delay.delay import CommDelay
+from delay_server.delay.file_channel import FileChannel, SpoolEntry
+from delay_server.util.clock import SimulatedClock
+from delay_server.util.queue import DelayQueue
+from delay_common import file_transfer
+
+
+@unittest.skipIf(sys.platform.startswith("win"),
+                 "Will not work on Windows")
+class TestFileChannel(TestClass):
+    """Test class for file channel."""
+
+    def setUp(self):
+        CommDelay().set_override(None)
+        self._dir = tempfile.TemporaryDirectory()
+        self._spool = os.path.join(self._dir.name, 'spool')
+        self._channel = FileChannel('test', self._spool)
+        self._sock = FileChannel._listen(0)
+        self._address = ('127.0.0.1', self._sock.getsockname()[1])
+
+        self._src = os.path.join(self._dir.name, 'science.dat')
+        self._data = os.urandom(300000)
+        with open(self._src, 'wb') as file:
+            file.write(self._data)
+        self._crc = file_transfer.checksum(self._src)
+
+    def tearDown(self):
+        self._sock.close()
+        self._dir.cleanup()
+
+    def _upload(self, path: str, name: str = None) -> int:
+        """Send a file while the channel receives it. Returns bytes sent."""
+        ret = []
+        client = socket.create_connection(self._address)
+
+        def send():
+            try:
+                ret.append(file_transfer.send_file(client, path, name))
+            except (OSError, ValueError) as e:
+                ret.append(e)
+
+        thread = threading.Thread(target=send)
+        thread.start()
+        uploads = {}
+        while thread.is_alive() or uploads:
+            self._channel._accept_and_recv(self._sock, uploads)
+            if not thread.is_alive():
+                client.close()
+        thread.join()
+        return ret[0]
+
+    def test_init(self):
+        self.assertTrue(os.path.isdir(self._spool))
+        self.assertEqual(self._channel.stats()['files_in'], 0)
+
+    def test_spool(self):
+        self.assertEqual(self._upload(self._src), len(self._data))
+        entry = self._channel._queue.pop()
+        self.assertEqual(entry.name, 'science.dat')
+        self.assertEqual(entry.size, len(self._data))
+        self.assertEqual(entry.crc, self._crc)
+        with open(entry.path, 'rb') as file:
+            self.assertEqual(file.read(), self._data)
+        self.assertEqual(os.listdir(self._spool),
+                         [os.path.basename(entry.path)])
+
+        stats = self._channel.stats()
+        self.assertEqual(stats['files_in'], 1)
+        self.assertEqual(stats['bytes_in'], len(self._data))
+        self.assertGreater(stats['rate_in'], 0)
+
+        # Released entries delete the file.
+        entry.release()
+        entry.release()
+        self.assertEqual(os.listdir(self._spool), [])
+
+    def test_clock(self):
+        # Delay counts from the start of the transfer in the queue clock.
+        clock = SimulatedClock(100)
+        self._channel = FileChannel('test', self._spool,
+                                    DelayQueue(clock=clock))
+        CommDelay().set_override(10)
+        try:
+            self.assertEqual(self._upload(self._src), len(self._data))
+            clock.advance(9)
+            self.assertIsNone(self._channel._queue.pop())
+            clock.advance(1)
+            entry = self._channel._queue.pop()
+            self.assertEqual(entry.ingress, 100)
+            entry.release()
+        finally:
+            CommDelay().set_override(None)
+
+    def _part(self, data: bytes, size: int, crc: int) -> str:
+        """Write a partial file as left by an interrupted transfer."""
+        path = self._channel._part_path('science.dat', size, crc)
+        with open(path, 'wb') as file:
+            file.write(data)
+        return path
+
+    def test_resume(self):
+        # Interrupted transfer left part of the file in the spool.
+        half = len(self._data) // 2
+        self._part(self._data[:half], len(self._data), self._crc)
+
+        self.assertEqual(self._upload(self._src), len(self._data) - half)
+        entry = self._channel._queue.pop()
+        with open(entry.path, 'rb') as file:
+            self.assertEqual(file.read(), self._data)
+        entry.release()
+
+    def test_resume_other_file(self):
+        # Partial files of another file with the same name are discarded.
+        stale = (self._part(b'\x00' * 1000, len(self._data), self._crc ^ 1),
+                 self._part(b'\x00' * 1000, len(self._data) + 1, self._crc))
+        self.assertEqual(self._upload(self._src), len(self._data))
+        for path in stale:
+            self.assertFalse(os.path.exists(path))
+        entry = self._channel._queue.pop()
+        with open(entry.path, 'rb') as file:
+            self.assertEqual(file.read(), self._data)
+        entry.release()
+
+        # Files that do not match their checksum are not queued.
+        self._part(b'\x00' * len(self._data), len(self._data), self._crc)
+        self.assertEqual(self._upload(self._src), 0)
+        self.assertEqual(len(self._channel._queue), 0)
+        self.assertEqual(os.listdir(self._spool), [])
+
+    def test_invalid_name(self):
+        with self.assertRaises(ValueError):
+            file_transfer.encode_header('../etc/passwd', 1, 0)
+
+        # Server closes the connection.
+        client = socket.create_connection(self._address)
+        client.sendall(file_transfer.HEADER.pack(file_transfer.MAGIC, 2, 10,
+                                                 0) + b'..')
+        uploads = {}
+        while not uploads:
+            self._channel._accept_and_recv(self._sock, uploads)
+        while uploads:
+            self._channel._accept_and_recv(self._sock, uploads)
+        self.assertEqual(client.recv(8), b'')
+        self.assertEqual(len(self._channel._queue), 0)
+        client.close()
+
+    def test_send(self):
+        path = os.path.join(self._spool, 'science.dat.1')
+        with open(path, 'wb') as file:
+            file.write(self._data)
+        entry = SpoolEntry('science.dat', path, len(self._data), self._crc, 0)
+
+        # Files are only counted when delivered.
+        clients = []
+        self.assertEqual(
+            self._channel._accept_and_send(self._sock, clients, entry), 0)
+        self.assertEqual(self._channel.stats()['files_out'], 0)
+
+        client = socket.create_connection(self._address)
+        while not clients:
+            self._channel._accept_and_send(self._sock, clients)
+
+        dest = os.path.join(self._dir.name, 'dest')
+        os.mkdir(dest)
+        ret = []
+        thread = threading.Thread(
+            target=lambda: ret.append(file_transfer.recv_file(client, dest)))
+        thread.start()
+        self.assertEqual(
+            self._channel._accept_and_send(self._sock, clients, entry), 1)
+        thread.join()
+        with open(ret[0], 'rb') as file:
+            self.assertEqual(file.read(), self._data)
+        self.assertEqual(self._channel.stats()['files_out'], 1)
+        self.assertEqual(self._channel.stats()['bytes_out'], len(self._data))
+
+        # Client disconnected.
+        client.close()
+        self._channel._accept_and_send(self._sock, clients)
+        self.assertEqual(clients, [])
+        entry.release()
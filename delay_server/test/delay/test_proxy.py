@@ -0,0 +1,149 @@
+""" Test for delay.proxy module. """
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.delay.delay import CommDelay
+from delay_server.delay.proxy import DelayProxy
+from delay_server.util.capture import CaptureWriter, CaptureReader
+from delay_common import codec
+from delay_common.fragment import encode_fragments
+
+
+def _free_port() -> int:
+    """Return a port that is free at the moment."""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+@unittest.skipIf(sys.platform.startswith("win"),
+                 "Will not work on Windows")
+class TestDelayProxy(TestClass):
+    """Test class for proxy."""
+
+    def setUp(self):
+        CommDelay().set_override(0)
+        self._proxy = DelayProxy('test')
+        self._ports = (_free_port(), _free_port())
+
+    def tearDown(self):
+        self._proxy.stop_proxy()
+        CommDelay().clear_override()
+
+    def test_relay(self):
+        self._proxy.start_proxy(*self._ports)
+        receiver = socket.create_connection(('127.0.0.1', self._ports[1]), 1)
+        sender = socket.create_connection(('127.0.0.1', self._ports[0]), 1)
+
+        # Wait for the consumer to accept the receiver.
+        packet = codec.FrameEncoder().encode_bytes(b'\x01\x02\x03')
+        receiver.settimeout(0.05)
+        data = b''
+        for _ in range(100):
+            sender.sendall(packet)
+            try:
+                data = receiver.recv(len(packet), socket.MSG_WAITALL)
+                break
+            except socket.timeout:
+                pass
+        self.assertEqual(data, packet)
+
+        # Client connections are closed when the proxy stops.
+        receiver.settimeout(1)
+        self._proxy.stop_proxy()
+        while receiver.recv(4096):
+            pass
+        sender.settimeout(1)
+        self.assertEqual(sender.recv(1), b'')
+        receiver.close()
+        sender.close()
+
+    def test_capture(self):
+        # Packets are recorded as received, including each fragment.
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'test.dcap')
+            capture = CaptureWriter(path)
+            self._proxy = DelayProxy('test', capture=capture)
+            self._proxy.start_proxy(*self._ports)
+            encoder = codec.FrameEncoder()
+            packets = [encoder.encode_bytes(codec.HELLO_V2)]
+            packets += [encoder.encode_bytes(i) for i in
+                        encode_fragments(3, os.urandom(20000))]
+            sender = socket.create_connection(('127.0.0.1', self._ports[0]),
+                                              1)
+            for packet in packets:
+                sender.sendall(packet)
+            for _ in range(200):
+                if self._proxy.get_received_count():
+                    break
+                time.sleep(0.005)
+            self.assertEqual(self._proxy.get_received_count(), 1)
+            self._proxy.stop_proxy()
+            sender.close()
+            capture.close()
+
+            reader = CaptureReader(path)
+            self.assertEqual([bytes(reader[i][2]) for i in
+                              range(len(reader))], packets)
+            reader.close()
+
+    def test_stop_restart(self):
+        for _ in range(3):
+            self._proxy.start_proxy(*self._ports)
+            start = time.perf_counter()
+            self._proxy.stop_proxy()
+            self.assertLess(time.perf_counter() - start, DelayProxy._TIMEOUT)
+            self.assertIsNone(self._proxy._producer)
+            self.assertIsNone(self._proxy._consumer)
+
+        # Stopping a stopped proxy is harmless.
+        self.assertTrue(self._proxy.stop_proxy())
+
+    def test_stop_timeout(self):
+        # Block the consumer thread while it waits for the next message.
+        blocked = threading.Event()
+        self._proxy._waiter.wait = lambda *args: blocked.wait()
+        self._proxy._TIMEOUT = 0.05
+        self._proxy.start_proxy(*self._ports)
+        time.sleep(0.05)
+
+        # The port of the thread still running is left open.
+        with self.assertLogs('test', 'WARNING'):
+            self.assertFalse(self._proxy.stop_proxy())
+        self.assertIsNone(self._proxy._producer)
+        sock = self._proxy._consumer_sock
+        self.assertNotEqual(sock._sock.fileno(), -1)
+        with self.assertRaises(RuntimeError):
+            self._proxy.start_proxy(*self._ports)
+
+        # Closed once the thread returns.
+        blocked.set()
+        self.assertTrue(self._proxy.stop_proxy())
+        self.assertIsNone(self._proxy._consumer)
+        self.assertEqual(sock._sock.fileno(), -1)
+
+    def test_port_in_use(self):
+        busy = socket.socket()
+        busy.bind(('', self._ports[0]))
+        busy.listen()
+
+        # The error is raised before any thread starts and the other port
+        # is released.
+        with self.assertRaises(OSError):
+            self._proxy.start_proxy(*self._ports)
+        self.assertIsNone(self._proxy._producer)
+        self.assertIsNone(self._proxy._consumer)
+        busy.close()
+
+        self._proxy.start_proxy(*self._ports)
+        self._proxy.stop_proxy()
+
@@ -8,11 +8,16 @@ import struct
 import os
 import sys
 import logging
+import time
 
 # pylint: disable=E0401
 from test.test_custom_class import TestClass
 from delay_server.delay.socket import DelayServerSocket
 from delay_server.util.exceptions import *
+from delay_server.util.buffer_pool import BufferPool
+from delay_server.util.conn_filter import ConnectionFilter
+from delay_common import codec
+from delay_common.fragment import encode_fragments
 
 
 class TestSocketServer(TestClass):
@@ -59,8 +64,371 @@ class TestSocketServer(TestClass):
         self.assertEqual(sock._sock.gettimeout(), 5)
         sock.close()        
 
+    @unittest.skipIf(sys.platform.startswith("win"),
+                      "Will not work on Windows")
     def test_close(self):
-        pass
+        sock = DelayServerSocket()
+        sock.open(('127.0.0.1', 0))
+        client = socket.create_connection(sock._sock.getsockname())
+        sock.accept_and_send(None, 1)
+        self.assertEqual(len(sock._connections), 2)
+        server_side = sock._connections[1]
+
+        # Client connections are closed with the server socket.
+        sock.close()
+        self.assertEqual(sock._connections, [sock._sock])
+        self.assertEqual(server_side.fileno(), -1)
+        self.assertEqual(sock._sock.fileno(), -1)
+        self.assertEqual(client.recv(1), b'')
+        client.close()
+
+        # Closing twice or before opening is harmless.
+        sock.close()
+        DelayServerSocket().close()
+
+    @unittest.skipIf(sys.platform.startswith("win"),
+                      "Will not work on Windows")
+    def test_wakeup(self):
+        # Does nothing before the socket is opened.
+        sock = DelayServerSocket()
+        sock.wakeup()
+        sock.open(('127.0.0.1', 0))
+
+        # A pending wake-up ends the wait at once, then is cleared.
+        sock.wakeup()
+        sock.wakeup()
+        start = time.perf_counter()
+        self.assertEqual(sock.accept_and_send(None, 5), 0)
+        self.assertEqual(sock.accept_and_recv(), [])
+        self.assertLess(time.perf_counter() - start, 1)
+        self.assertEqual(sock._connections, [sock._sock])
+
+        sock.wakeup()
+        start = time.perf_counter()
+        self.assertEqual(sock.accept_and_recv(), [])
+        self.assertEqual(sock.accept_and_send(None, 0.05), 0)
+        self.assertGreaterEqual(time.perf_counter() - start, 0.04)
+
+        sock.close()
+        sock.wakeup()
+
+    def test_pause_recv(self):
+        sock = DelayServerSocket()
+        self.assertFalse(sock.recv_paused)
+        sock.pause_recv()
+        self.assertTrue(sock.recv_paused)
+        sock.pause_recv()
+        self.assertTrue(sock.recv_paused)
+        sock.resume_recv()
+        self.assertFalse(sock.recv_paused)
+        sock._sock.close()
+
+    @unittest.skipIf(sys.platform.startswith("win"),
+                      "Will not work on Windows")
+    def test_accept_and_recv_paused(self):
+        sock = DelayServerSocket()
+        sock.open(('127.0.0.1', 0))
+        sock_send, sock_recv = socket.socketpair()
+        sock._connections.append(sock_recv)
+        sock._send_packet(sock_send, bytearray(b'\x01\x02'))
+
+        # Client connections are not polled while paused.
+        sock.pause_recv()
+        self.assertEqual(sock.accept_and_recv(), [])
+
+        sock.resume_recv()
+        ret = sock.accept_and_recv()
+        self.assertEqual(len(ret), 1)
+        self.assertEqual(ret[0].data, b'\x01\x02')
+        ret[0].release()
+        sock_recv.close()
+        sock_send.close()
+        sock.close()
+
+    @unittest.skipIf(sys.platform.startswith("win"),
+                      "Will not work on Windows")
+    def test_accept_and_send(self):
+        # Frame as received by the producer.
+        producer = DelayServerSocket()
+        sock_send, sock_recv = socket.socketpair()
+        packet = producer._encoder.encode_bytes(b'\x01\x02\x03')
+        sock_send.sendall(packet)
+        frame = producer._recv_packets(sock_recv)[0]
+        sock_send.close()
+        sock_recv.close()
+        producer._sock.close()
+
+        for passthrough in (True, False):
+            sock = DelayServerSocket(passthrough=passthrough)
+            sock.open(('127.0.0.1', 0))
+            client_out, client_in = socket.socketpair()
+            sock._connections.append(client_out)
+
+            # Frame is forwarded verbatim to every client.
+            self.assertEqual(sock.accept_and_send(frame), 1)
+            self.assertEqual(client_in.recv(len(packet), socket.MSG_WAITALL),
+                             packet)
+
+            # Nothing to send.
+            self.assertEqual(sock.accept_and_send(), 0)
+
+            # Client disconnected.
+            client_in.close()
+            self.assertEqual(sock.accept_and_send(), 0)
+            self.assertEqual(sock._connections, [sock._sock])
+            self.assertEqual(sock.accept_and_send(frame), 0)
+            sock.close()
+        frame.release()
+
+    @unittest.skipIf(sys.platform.startswith("win"),
+                      "Will not work on Windows")
+    def test_accept_filter(self):
+        conn_filter = ConnectionFilter(deny=('127.0.0.*',))
+        sock = DelayServerSocket(conn_filter=conn_filter)
+        sock.open(('127.0.0.1', 0))
+        address = sock._sock.getsockname()
+
+        # Rejected connections are closed as soon as they are accepted.
+        client = socket.create_connection(address)
+        self.assertEqual(sock.accept_and_recv(), [])
+        self.assertEqual(sock._connections, [sock._sock])
+        self.assertEqual(sock.rejected, 1)
+        self.assertEqual(client.recv(1), b'')
+        client.close()
+
+        # Allowed once the rules change.
+        conn_filter.update(allow=('127.0.0.1',), deny=('127.0.0.*',))
+        client = socket.create_connection(address)
+        self.assertEqual(sock.accept_and_send(None, 1), 0)
+        self.assertEqual(len(sock._connections), 2)
+        self.assertEqual(sock.rejected, 1)
+        self.assertEqual(conn_filter.stats()['rules'][0]['hits'], 1)
+        self.assertEqual(conn_filter.stats()['rules'][1]['hits'], 1)
+        client.close()
+        sock._connections[1].close()
+        sock.close()
+
+    @unittest.skipIf(sys.platform.startswith("win"),
+                      "Will not work on Windows")
+    def test_accept_and_send_reverify(self):
+        pool = BufferPool(DelayServerSocket.HEADER_SIZE +
+                          DelayServerSocket.MAX_MSG_LEN, 1)
+        frame = pool.acquire()
+        packet = b'\x00\x00\x00\x03\x01\x54\x7E'
+        frame.view[:len(packet)] = packet
+        frame.size, frame.start, frame.end = len(packet), 4, 5
+
+        sock = DelayServerSocket(reverify=True)
+        sock.open(('127.0.0.1', 0))
+        client_out, client_in = socket.socketpair()
+        sock._connections.append(client_out)
+        self.assertEqual(sock.accept_and_send(frame), 1)
+        self.assertEqual(client_in.recv(len(packet)), packet)
+
+        # Corrupted while queued.
+        frame.view[4] = 0x02
+        self.assertEqual(sock.accept_and_send(frame), 0)
+        client_in.close()
+        sock.close()
+
+    @unittest.skipIf(sys.platform.startswith("win"),
+                      "Will not work on Windows")
+    def test_negotiate_v2(self):
+        sock = DelayServerSocket()
+        sock_send, sock_recv = socket.socketpair()
+        hello = sock._encoder.encode_bytes(codec.HELLO_V2)
+
+        # Batches from a version 1 client are plain data.
+        batch = codec.encode_batch(1, [b'ab', b'c'])
+        sock_send.sendall(sock._encoder.encode_bytes(batch))
+        frame = sock._recv_packets(sock_recv)[0]
+        self.assertEqual(frame.version, 1)
+        frame.release()
+
+        # Hello is echoed and not returned as a frame.
+        sock_send.sendall(hello)
+        self.assertEqual(sock._recv_packets(sock_recv), [])
+        self.assertEqual(sock_send.recv(len(hello)), hello)
+
+        sock_send.sendall(sock._encoder.encode_bytes(batch))
+        frame = sock._recv_packets(sock_recv)[0]
+        self.assertEqual(frame.version, 2)
+        self.assertEqual(frame.data, batch)
+        frame.release()
+
+        # Malformed batches are dropped.
+        sock_send.sendall(sock._encoder.encode_bytes(b'\x01\x02'))
+        self.assertEqual(sock._recv_packets(sock_recv), [])
+
+        sock_send.close()
+        sock_recv.close()
+        sock._sock.close()
+
+    @unittest.skipIf(sys.platform.startswith("win"),
+                      "Will not work on Windows")
+    def test_accept_and_send_v2(self):
+        encoder = codec.FrameEncoder()
+        pool = BufferPool(DelayServerSocket.HEADER_SIZE +
+                          DelayServerSocket.MAX_MSG_LEN, 2)
+
+        def make_frame(data, version):
+            frame = pool.acquire()
+            packet = encoder.encode_bytes(data)
+            frame.view[:len(packet)] = packet
+            frame.size, frame.start = len(packet), 4
+            frame.end = len(packet) - 2
+            frame.version = version
+            return frame
+
+        batch = codec.encode_batch(5, [b'ab', b'', b'c'])
+        v1_frame = make_frame(b'xyz', 1)
+        v2_frame = make_frame(batch, 2)
+
+        sock = DelayServerSocket()
+        sock.open(('127.0.0.1', 0))
+        v1_out, v1_in = socket.socketpair()
+        v2_out, v2_in = socket.socketpair()
+        sock._connections.extend([v1_out, v2_out])
+
+        # Client negotiates version 2 on the egress socket.
+        hello = encoder.encode_bytes(codec.HELLO_V2)
+        v2_in.sendall(hello)
+        self.assertEqual(sock.accept_and_send(), 0)
+        self.assertEqual(v2_in.recv(len(hello)), hello)
+
+        # Version 1 frame is wrapped in a batch for the version 2 client.
+        self.assertEqual(sock.accept_and_send(v1_frame), 2)
+        self.assertEqual(v1_in.recv(64), v1_frame.packet)
+        expected = encoder.encode_bytes(codec.encode_batch(0, [b'xyz']))
+        self.assertEqual(v2_in.recv(64), expected)
+
+        # Batch is split into packets for the version 1 client. Empty
+        # messages cannot be sent in version 1.
+        self.assertEqual(sock.accept_and_send(v2_frame), 2)
+        expected = encoder.encode_bytes(b'ab') + encoder.encode_bytes(b'c')
+        self.assertEqual(v1_in.recv(len(expected), socket.MSG_WAITALL),
+                         expected)
+        self.assertEqual(v2_in.recv(64), v2_frame.packet)
+
+        v1_frame.release()
+        v2_frame.release()
+        for i_sock in (v1_in, v2_in):
+            i_sock.close()
+        sock.close()
+
+    @unittest.skipIf(sys.platform.startswith("win"),
+                      "Will not work on Windows")
+    def test_large_message(self):
+        sock = DelayServerSocket()
+        sock.open(('127.0.0.1', 0))
+        sock_send, sock_recv = socket.socketpair()
+        sock._connections.append(sock_recv)
+        hello = sock._encoder.encode_bytes(codec.HELLO_V2)
+        sock_send.sendall(hello)
+        self.assertEqual(sock._recv_packets(sock_recv), [])
+        sock_send.recv(len(hello))
+
+        # Message is only returned once complete. Each fragment is seen
+        # as received.
+        packets = []
+        sock._on_packet = lambda packet, _: packets.append(bytes(packet))
+        msg = os.urandom(20000)
+        frags = [sock._encoder.encode_bytes(i)
+                 for i in encode_fragments(9, msg)]
+        for frag in frags[:-1]:
+            sock_send.sendall(frag)
+            self.assertEqual(sock._recv_packets(sock_recv), [])
+        sock_send.sendall(frags[-1])
+        ret = sock._recv_packets(sock_recv)
+        self.assertEqual(len(ret), 1)
+        self.assertEqual(ret[0].read(), msg)
+        self.assertEqual(packets, frags)
+        sock._on_packet = None
+
+        # Egress re-fragments the message for version 2 clients and skips
+        # version 1 clients.
+        v1_out, v1_in = socket.socketpair()
+        sock._connections.append(v1_out)
+        self.assertEqual(sock.accept_and_send(ret[0]), 1)
+        data = b''
+        while len(data) < len(b''.join(frags)):
+            data += sock_send.recv(65536)
+        self.assertEqual(data, b''.join(sock._encoder.encode_bytes(i)
+                                        for i in encode_fragments(0, msg)))
+        ret[0].release()
+
+        # Partial messages are discarded when the client disconnects.
+        sock_send.sendall(frags[0])
+        self.assertEqual(sock._recv_packets(sock_recv), [])
+        reassembler = sock._reassemblers[sock_recv]
+        sock_send.close()
+        self.assertEqual(sock._recv_packets(sock_recv), [])
+        self.assertEqual(reassembler.aborted, 1)
+        v1_in.close()
+        sock.close()
+
+        # Messages longer than the configured limit are dropped.
+        sock = DelayServerSocket(max_large_msg_len=len(msg) - 1)
+        sock_send, sock_recv = socket.socketpair()
+        sock_send.sendall(hello)
+        sock._recv_packets(sock_recv)
+        sock_send.sendall(b''.join(frags))
+        self.assertEqual(sock._recv_packets(sock_recv), [])
+        self.assertEqual(len(sock._reassemblers[sock_recv]), 0)
+        sock_send.close()
+        sock_recv.close()
+        sock._sock.close()
+
+    @unittest.skipUnless(DelayServerSocket.KERNEL_TIMESTAMPS,
+                         "Kernel timestamps not supported")
+    def test_kernel_timestamps(self):
+        for kernel_timestamps in (True, False):
+            sock = DelayServerSocket(kernel_timestamps=kernel_timestamps)
+            sock.open(('127.0.0.1', 0))
+            client = socket.create_connection(sock._sock.getsockname())
+            while len(sock._connections) < 2:
+                sock.accept_and_recv()
+
+            # The kernel may enable timestamps only after the first frame.
+            client.sendall(sock._encoder.encode_bytes(b'\x00'))
+            frames = []
+            while not frames:
+                frames = sock.accept_and_recv()
+            frames[0].release()
+            self.assertLessEqual(sock.untimed, 1)
+
+            sent = time.monotonic()
+            client.sendall(sock._encoder.encode_bytes(b'\x01'))
+            time.sleep(0.05)
+            frames = sock.accept_and_recv()
+            self.assertEqual(len(frames), 1)
+            if kernel_timestamps:
+                # Arrival time, not the time it was read.
+                self.assertAlmostEqual(frames[0].timestamp, sent, delta=0.02)
+            else:
+                self.assertIsNone(frames[0].timestamp)
+                self.assertEqual(sock.untimed, 0)
+            frames[0].release()
+            client.close()
+            sock.close()
+
+    @unittest.skipIf(sys.platform.startswith("win"),
+                      "Will not work on Windows")
+    def test_recv_disconnect(self):
+        sock = DelayServerSocket()
+        sock.open(('127.0.0.1', 0))
+        sock_send, sock_recv = socket.socketpair()
+        sock._connections.append(sock_recv)
+
+        # Partial packet is discarded when the client disconnects.
+        sock_send.sendall(b'\x00\x00\x00\x03\x01')
+        self.assertEqual(sock.accept_and_recv(), [])
+        self.assertIn(sock_recv, sock._decoders)
+        sock_send.close()
+        self.assertEqual(sock.accept_and_recv(), [])
+        self.assertNotIn(sock_recv, sock._connections)
+        self.assertNotIn(sock_recv, sock._decoders)
+        sock.close()
     
 
     # def test_receive(self):
@@ -170,6 +538,36 @@ class TestSocketServer(TestClass):
         # with mock.patch('struct.pack', mock_struct):
         #     self.assertEqual(self.__server._send(mock_send, msg), 7)
 
+    def test_send_partial(self):
+        sock = DelayServerSocket()
+        raw_data = bytearray(b'\x01\x02\x03')
+        pkt_len = DelayServerSocket.HEADER_SIZE + len(raw_data) + \
+            DelayServerSocket.FOOTER_SIZE
+
+        # Partial sends resume from the first unsent byte.
+        sent = []
+        mock_sock = mock.Mock()
+        def sendmsg(buffers):
+            data = b''.join(bytes(buf) for buf in buffers)
+            sent.append(data[:2])
+            return len(data[:2])
+        mock_sock.sendmsg.side_effect = sendmsg
+        self.assertEqual(sock._send_packet(mock_sock, raw_data), pkt_len)
+        packet = b''.join(sent)
+        self.assertEqual(packet, b'\x00\x00\x00\x05\x01\x02\x03\x2C\xBA')
+        self.assertEqual(mock_sock.sendmsg.call_count, 5)
+
+        # Report bytes actually sent if the socket times out.
+        mock_sock = mock.Mock()
+        mock_sock.sendmsg.side_effect = [6, socket.timeout()]
+        self.assertEqual(sock._send_packet(mock_sock, raw_data), 6)
+
+        # Fallback without scatter-gather support.
+        mock_sock = mock.Mock(spec=['sendall'])
+        self.assertEqual(sock._send_packet(mock_sock, raw_data), pkt_len)
+        self.assertEqual(mock_sock.sendall.call_count, 3)
+        sock._sock.close()
+
     @unittest.skipIf(sys.platform.startswith("win"),
                       "Will not work on Windows")
     def test_socketpair(self):
@@ -184,7 +582,9 @@ class TestSocketServer(TestClass):
             msg_len = len(raw_msg) + DelayServerSocket.HEADER_SIZE + \
                 DelayServerSocket.FOOTER_SIZE
             self.assertEqual(sock._send_packet(sock_send, raw_msg), msg_len)
-            ret = sock._recv_packet(sock_recv)
-            self.assertEqual(raw_msg, ret)
+            ret = sock._recv_packets(sock_recv)
+            self.assertEqual(len(ret), 1)
+            self.assertEqual(raw_msg, ret[0].data)
+            ret[0].release()
         sock_recv.close()
         sock_send.close()
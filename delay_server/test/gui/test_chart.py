@@ -0,0 +1,18 @@
+""" Test for gui.chart module. """
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.gui.chart import Chart
+
+
+class TestChart(TestClass):
+    """Test class for charts."""
+
+    def test_scale(self):
+        coords = Chart.scale([0, 5, 10], [0, 50, 100], 0, 10, 100, 110, 60,
+                             5)
+        self.assertEqual(coords, [5, 55, 55, 30, 105, 5])
+
+        # Flat line at the bottom if there are no values.
+        coords = Chart.scale([0, 10], [0, 0], 0, 10, 0, 100, 50)
+        self.assertEqual(coords, [0, 50, 100, 50])
@@ -0,0 +1,72 @@
+""" Test for util.buffer_pool module. """
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.util.buffer_pool import BufferPool
+
+
+class TestBufferPool(TestClass):
+    """Test class for main file."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+    def test_init(self):
+        pool = BufferPool(16, 4)
+        self.assertEqual(pool.capacity, 16)
+        self.assertEqual(pool.allocated, 4)
+        self.assertEqual(len(pool), 4)
+
+        with self.assertRaises(ValueError):
+            BufferPool(0)
+        with self.assertRaises(ValueError):
+            BufferPool(16, -1)
+
+    def test_acquire_release(self):
+        pool = BufferPool(16, 1)
+        buf = pool.acquire()
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(len(buf.buffer), 16)
+        self.assertEqual(len(buf), 0)
+
+        # Data section is a view over the buffer.
+        buf.view[2:5] = b'\x01\x02\x03'
+        buf.start, buf.end, buf.size = 2, 5, 7
+        self.assertEqual(len(buf), 3)
+        self.assertEqual(buf.data, b'\x01\x02\x03')
+
+        # Released buffers are recycled and reset.
+        buf.release()
+        self.assertEqual(len(pool), 1)
+        buf.release()
+        self.assertEqual(len(pool), 1)
+        other = pool.acquire()
+        self.assertIs(other, buf)
+        self.assertEqual(len(other), 0)
+        self.assertEqual(other.size, 0)
+
+    def test_grow(self):
+        pool = BufferPool(16, 1)
+        buf1 = pool.acquire()
+        buf2 = pool.acquire()
+        self.assertIsNot(buf1, buf2)
+        self.assertEqual(pool.allocated, 2)
+        buf1.release()
+        buf2.release()
+        self.assertEqual(len(pool), 2)
+
+    def test_trim(self):
+        pool = BufferPool(16, 1, max_free=2)
+        with self.assertRaises(ValueError):
+            BufferPool(16, 4, max_free=2)
+        self.assertEqual(BufferPool(16, 1).max_free, BufferPool.MIN_FREE)
+
+        # Buffers released beyond max_free are dropped.
+        bufs = [pool.acquire() for _ in range(4)]
+        self.assertEqual(pool.allocated, 4)
+        self.assertEqual(bufs[0].capacity, 16)
+        for buf in bufs:
+            buf.release()
+        self.assertEqual(len(pool), 2)
+        self.assertEqual(pool.allocated, 2)
+        bufs[3].release()
+        self.assertEqual(pool.allocated, 2)
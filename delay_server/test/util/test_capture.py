@@ -0,0 +1,111 @@
+""" Test for util.capture module. """
+import os
+import socket
+import sys
+import tempfile
+import time
+import unittest
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.util.capture import CaptureWriter, CaptureReader, \
+    TRAILER
+from benchmark.replay import replay
+
+
+class TestCapture(TestClass):
+    """Test class for capture files."""
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._dir.name, 'test.dcap')
+
+    def tearDown(self):
+        self._dir.cleanup()
+
+    def _write(self, frames: list) -> None:
+        writer = CaptureWriter(self._path)
+        for timestamp, link, data in frames:
+            writer.record(link, data, timestamp)
+        writer.close()
+        self.assertEqual(len(writer), len(frames))
+
+    def test_roundtrip(self):
+        frames = [(1000 * i, 'mcc' if i % 3 else 'hab', os.urandom(i + 1))
+                  for i in range(100)]
+        self._write(frames)
+
+        reader = CaptureReader(self._path)
+        self.assertTrue(reader.indexed)
+        self.assertEqual(len(reader), len(frames))
+        self.assertEqual(sorted(reader.links.values()), ['hab', 'mcc'])
+        for i, (timestamp, link, data) in enumerate(frames):
+            ret = reader[i]
+            self.assertEqual(ret[:2], (timestamp, link))
+            self.assertEqual(ret[2], data)
+            ret[2].release()
+        self.assertAlmostEqual(reader.duration, 99e-6)
+
+        # Seek by timestamp.
+        self.assertEqual(reader.find(0), 0)
+        self.assertEqual(reader.find(5000), 5)
+        self.assertEqual(reader.find(5001), 6)
+        self.assertEqual(reader.find(10 ** 9), len(frames))
+        reader.close()
+
+    def test_scan(self):
+        frames = [(i, 'mcc', b'\x01' * 10) for i in range(10)]
+        self._write(frames)
+
+        # Server stopped before the index was written and in the middle of
+        # writing the last frame.
+        with open(self._path, 'rb') as file:
+            data = file.read()
+        index_offset = TRAILER.unpack_from(data, len(data) - TRAILER.size)[0]
+        with open(self._path, 'wb') as file:
+            file.write(data[:index_offset - 1])
+
+        reader = CaptureReader(self._path)
+        self.assertFalse(reader.indexed)
+        self.assertEqual(len(reader), len(frames) - 1)
+        self.assertEqual(reader[8][:2], (8, 'mcc'))
+        reader.close()
+
+    def test_invalid(self):
+        with open(self._path, 'wb') as file:
+            file.write(b'not a capture')
+        with self.assertRaises(ValueError):
+            CaptureReader(self._path)
+
+    def test_background_write(self):
+        writer = CaptureWriter(self._path)
+        writer.record('mcc', b'\x01\x02')
+        deadline = time.monotonic() + 1
+        while len(writer) == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(writer), 1)
+        writer.close()
+
+    @unittest.skipIf(sys.platform.startswith("win"),
+                     "Will not work on Windows")
+    def test_replay(self):
+        frames = [(int(i * 2e7), 'mcc', bytes([i])) for i in range(5)]
+        frames.append((0, 'hab', b'\xff'))
+        self._write(frames)
+        reader = CaptureReader(self._path)
+        sock_send, sock_recv = socket.socketpair()
+
+        # 1x speed keeps the original 20 ms spacing. Unknown links are
+        # skipped.
+        start = time.monotonic()
+        self.assertEqual(replay(reader, {'mcc': sock_send}), 5)
+        self.assertGreaterEqual(time.monotonic() - start, 0.08)
+        self.assertEqual(sock_recv.recv(16), b'\x00\x01\x02\x03\x04')
+
+        # Accelerated from the third frame.
+        self.assertEqual(replay(reader, {'mcc': sock_send}, 0, 2, 2), 2)
+        self.assertEqual(sock_recv.recv(16), b'\x02\x03')
+
+        sock_send.close()
+        sock_recv.close()
+        reader.close()
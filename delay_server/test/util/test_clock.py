@@ -0,0 +1,64 @@
+""" Test for util.clock module. """
+import threading
+import time
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.util.clock import Clock, SimulatedClock
+
+
+class TestClock(TestClass):
+    """Test class for clocks."""
+
+    def test_real(self):
+        clock = Clock()
+        start = clock.monotonic()
+        clock.sleep(0.01)
+        self.assertGreaterEqual(clock.monotonic() - start, 0.01)
+        self.assertAlmostEqual(clock.monotonic_ns() / 1e9, time.monotonic(),
+                               places=1)
+        event = threading.Event()
+        self.assertFalse(clock.wait(event, 0))
+        event.set()
+        self.assertTrue(clock.wait(event, 1))
+
+    def test_simulated(self):
+        clock = SimulatedClock(10)
+        self.assertEqual(clock.monotonic(), 10)
+        self.assertEqual(clock.advance(5), 15)
+        self.assertEqual(clock.monotonic_ns(), 15 * 10 ** 9)
+        with self.assertRaises(ValueError):
+            clock.advance(-1)
+
+        # Sleeping a mission day returns immediately.
+        start = time.monotonic()
+        clock.sleep(86400)
+        self.assertEqual(clock.monotonic(), 86415)
+        event = threading.Event()
+        self.assertFalse(clock.wait(event, 60))
+        self.assertEqual(clock.monotonic(), 86475)
+        event.set()
+        self.assertTrue(clock.wait(event, 60))
+        self.assertEqual(clock.monotonic(), 86475)
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_simulated_blocking(self):
+        clock = SimulatedClock(auto_advance=False)
+        done = threading.Event()
+        event = threading.Event()
+
+        def sleeper():
+            clock.sleep(100)
+            self.assertFalse(clock.wait(event, 100))
+            done.set()
+
+        thread = threading.Thread(target=sleeper)
+        thread.start()
+        self.assertFalse(done.wait(0.01))
+        for _ in range(100):
+            clock.advance(50)
+            if done.wait(0.01):
+                break
+        self.assertTrue(done.is_set())
+        self.assertGreaterEqual(clock.monotonic(), 200)
+        thread.join()
@@ -0,0 +1,79 @@
+""" Test for util.conn_filter module. """
+import ipaddress
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.util.conn_filter import ConnectionFilter, parse_pattern
+
+
+class TestConnectionFilter(TestClass):
+    """Test class for connection filter."""
+
+    def test_parse_pattern(self):
+        self.assertEqual(parse_pattern('192.168.1.*'),
+                         ipaddress.ip_network('192.168.1.0/24'))
+        self.assertEqual(parse_pattern(' 10.*.*.* '),
+                         ipaddress.ip_network('10.0.0.0/8'))
+        self.assertEqual(parse_pattern('*.*.*.*'),
+                         ipaddress.ip_network('0.0.0.0/0'))
+        self.assertEqual(parse_pattern('10.1.2.3'),
+                         ipaddress.ip_network('10.1.2.3/32'))
+        self.assertEqual(parse_pattern('10.1.2.3/16'),
+                         ipaddress.ip_network('10.1.0.0/16'))
+        self.assertEqual(parse_pattern('fe80::/10').prefixlen, 10)
+        for pattern in ('192.168.*', '192.*.1.1', '192.168.1.x*',
+                        '300.1.*.*', 'host', ''):
+            with self.assertRaises(ValueError):
+                parse_pattern(pattern)
+
+    def test_empty(self):
+        conn_filter = ConnectionFilter()
+        self.assertEqual(len(conn_filter), 0)
+        self.assertTrue(conn_filter.allowed('127.0.0.1'))
+        self.assertTrue(conn_filter.allowed('::1'))
+        self.assertEqual(conn_filter.stats(), dict(rules=[], unmatched=2))
+
+    def test_allowed(self):
+        conn_filter = ConnectionFilter(
+            allow=('192.168.1.10', '10.1.*.*'),
+            deny=('192.168.1.*', '10.*.*.*', '10.1.2.0/24', '2001:db8::/32'))
+        self.assertEqual(len(conn_filter), 6)
+
+        # Most specific rule wins.
+        self.assertTrue(conn_filter.allowed('192.168.1.10'))
+        self.assertFalse(conn_filter.allowed('192.168.1.11'))
+        self.assertTrue(conn_filter.allowed('192.168.2.1'))
+        self.assertFalse(conn_filter.allowed('10.0.0.1'))
+        self.assertTrue(conn_filter.allowed('10.1.3.1'))
+        self.assertFalse(conn_filter.allowed('10.1.2.1'))
+
+        # IPv6, IPv4-mapped and invalid addresses.
+        self.assertFalse(conn_filter.allowed('2001:db8::1'))
+        self.assertTrue(conn_filter.allowed('2001:db9::1'))
+        self.assertFalse(conn_filter.allowed('::ffff:192.168.1.11'))
+        self.assertFalse(conn_filter.allowed('invalid'))
+
+        stats = conn_filter.stats()
+        self.assertEqual([rule['hits'] for rule in stats['rules']],
+                         [1, 1, 2, 1, 1, 1])
+        self.assertEqual(stats['rules'][2],
+                         dict(action='deny', pattern='192.168.1.*', hits=2))
+        self.assertEqual(stats['unmatched'], 2)
+
+    def test_update(self):
+        conn_filter = ConnectionFilter(deny=('10.*.*.*', '192.168.1.*'))
+        self.assertFalse(conn_filter.allowed('10.0.0.1'))
+        self.assertFalse(conn_filter.allowed('192.168.1.1'))
+
+        # Hit counts of kept rules carry over.
+        conn_filter.update(deny=('10.*.*.*',))
+        self.assertTrue(conn_filter.allowed('192.168.1.1'))
+        self.assertEqual(conn_filter.stats(),
+                         dict(rules=[dict(action='deny', pattern='10.*.*.*',
+                                          hits=1)], unmatched=1))
+
+        # Invalid rules leave the filter unchanged.
+        with self.assertRaises(ValueError):
+            conn_filter.update(deny=('10.*.*.*', 'invalid'))
+        self.assertFalse(conn_filter.allowed('10.0.0.2'))
+        self.assertEqual(len(conn_filter), 1)
@@ -0,0 +1,85 @@
+""" Test for util.deadline module. """
+import time
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.delay.delay import CommDelay
+from delay_server.util.clock import SimulatedClock
+from delay_server.util.deadline import DeadlineWaiter
+
+
+class TestDeadlineWaiter(TestClass):
+    """Test class for deadline waits."""
+
+    def test_invalid_precision(self):
+        with self.assertRaises(ValueError):
+            DeadlineWaiter(precision='exact')
+
+    def test_no_deadline(self):
+        sleeps = []
+        waiter = DeadlineWaiter(SimulatedClock(), max_sleep=0.02)
+        self.assertFalse(waiter.wait(None, sleeps.append))
+        self.assertEqual(sleeps, [0.02])
+
+    def test_low_precision(self):
+        clock = SimulatedClock()
+        waiter = DeadlineWaiter(clock, DeadlineWaiter.PRECISION_LOW, 1)
+
+        # Long waits are split into sleeps no longer than max_sleep.
+        self.assertFalse(waiter.wait(2.5))
+        self.assertEqual(clock.monotonic(), 1)
+        self.assertFalse(waiter.wait(2.5))
+        self.assertTrue(waiter.wait(2.5))
+        self.assertEqual(clock.monotonic(), 2.5)
+        self.assertEqual(waiter.spin_budget, 0)
+        self.assertEqual(waiter.spins, 0)
+
+    def test_calibration(self):
+        clock = SimulatedClock()
+
+        # Every sleep wakes up 2 ms late.
+        def late_sleep(secs):
+            clock.advance(secs + 0.002)
+
+        for precision, budget in ((DeadlineWaiter.PRECISION_LOW, 0),
+                                  (DeadlineWaiter.PRECISION_MEDIUM, 0.001),
+                                  (DeadlineWaiter.PRECISION_HIGH, 0.002)):
+            waiter = DeadlineWaiter(clock, precision)
+            for _ in range(100):
+                waiter.wait(clock.monotonic() + 0.02, late_sleep)
+            self.assertAlmostEqual(waiter.spin_budget, budget, places=4)
+
+        # An on-time sleep ends at the spin budget. The simulated clock does
+        # not move while spinning so the wait gives up and reports the
+        # deadline was not reached.
+        spins = waiter.spins
+        deadline = clock.monotonic() + 0.01
+        self.assertFalse(waiter.wait(deadline, clock.advance))
+        self.assertAlmostEqual(clock.monotonic(), deadline - 0.002, places=4)
+        self.assertEqual(waiter.spins, spins + 1)
+
+    def test_sleep_cut_short(self):
+        clock = SimulatedClock()
+        waiter = DeadlineWaiter(clock, DeadlineWaiter.PRECISION_HIGH)
+        self.assertFalse(waiter.wait(1, lambda secs: None))
+        self.assertEqual(waiter.spin_budget, 0)
+
+    def test_default_clock(self):
+        # Follows the clock of CommDelay set after the waiter was created.
+        waiter = DeadlineWaiter(precision=DeadlineWaiter.PRECISION_LOW)
+        clock = SimulatedClock()
+        CommDelay().set_clock(clock)
+        try:
+            self.assertIs(waiter.clock, clock)
+            self.assertTrue(waiter.wait(clock.monotonic() + 0.005,
+                                        clock.advance))
+        finally:
+            CommDelay().set_clock()
+
+    def test_real_clock(self):
+        waiter = DeadlineWaiter(precision=DeadlineWaiter.PRECISION_HIGH)
+        for _ in range(10):
+            deadline = time.monotonic() + 0.002
+            while not waiter.wait(deadline):
+                pass
+            self.assertGreaterEqual(time.monotonic(), deadline)
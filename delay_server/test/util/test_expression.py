@@ -0,0 +1,80 @@
+""" Test for util.expression module. """
+import math
+import sys
+import mock
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.util.expression import compile_expression, compile_any, \
+    UnsupportedExpression, UnknownFunction
+
+
+class TestExpression(TestClass):
+    """Test class for expression compiler."""
+
+    def test_compile(self):
+        self.assertEqual(compile_expression('300')(5), 300)
+        self.assertAlmostEqual(compile_expression('(t - 100) + 0.1')(150),
+                               50.1)
+        self.assertEqual(compile_expression('t^2 + t**2')(3), 18)
+        self.assertEqual(compile_expression('-t // 2 % 7')(3), 5)
+        self.assertAlmostEqual(compile_expression('sin(pi * t / 2)')(1), 1)
+        self.assertAlmostEqual(compile_expression('ln(E) + Max(t, 2)')(1), 3)
+        self.assertEqual(compile_expression('min(t, 600)')(1200), 600)
+        self.assertEqual(compile_expression('x * y', ('x', 'y'))(2, 3), 6)
+
+        # Code object is a plain function.
+        func = compile_expression('t + 1')
+        self.assertEqual(func.__code__.co_varnames, ('t',))
+
+    def test_rejected(self):
+        for expression in ('__import__("os")', 'open("f")', 't.real',
+                           '[t]', 't if t else 0', 't < 1', '"a"', 'True',
+                           'lambda: 0', 'x + 1', 'sin(x=1)', 'exp(t)(1)',
+                           't & 1', 'not t', '(t := 1)'):
+            with self.assertRaises(UnsupportedExpression, msg=expression):
+                compile_expression(expression)
+
+        # Syntax errors are plain ValueError.
+        with self.assertRaises(ValueError) as context:
+            compile_expression('t +')
+        self.assertNotIsInstance(context.exception, UnsupportedExpression)
+
+        # Builtins are not reachable from the compiled function.
+        func = compile_expression('t')
+        self.assertEqual(func.__globals__['__builtins__'], {})
+
+    def test_runtime_errors(self):
+        self.assertRaises(ZeroDivisionError, compile_expression('1 / t'), 0)
+        self.assertRaises(ValueError, compile_expression('sqrt(t)'), -1)
+        self.assertTrue(math.isinf(compile_expression('inf')(0)))
+
+    def test_compile_any(self):
+        # Supported expressions never import sympy.
+        with mock.patch.dict(sys.modules, {'sympy': None}):
+            self.assertEqual(compile_any('2 * t')(2), 4)
+            with self.assertRaises(UnsupportedExpression) as context:
+                compile_any('Heaviside(t - 5)')
+            self.assertIn('sympy is required', str(context.exception))
+            self.assertIn('Unknown function Heaviside',
+                          str(context.exception))
+
+    def test_compile_any_rejected(self):
+        # Only unknown functions in whitelisted syntax reach sympy, which
+        # evaluates the expression.
+        sympy = mock.MagicMock()
+        sympy.sympify.return_value.free_symbols = set()
+        with mock.patch.dict(sys.modules, {'sympy': sympy}):
+            for expression in ('t.real', "Heaviside(t).__class__",
+                               'Heaviside(t)[0]', 'Heaviside("t")',
+                               'Heaviside(lambda: 0)', 'exec(t)',
+                               '__import__(t)', 'Heaviside(t, x=1)',
+                               'Heaviside([i for i in t])'):
+                with self.assertRaises(UnsupportedExpression,
+                                       msg=expression) as context:
+                    compile_any(expression)
+                self.assertNotIsInstance(context.exception, UnknownFunction)
+            sympy.sympify.assert_not_called()
+
+            compile_any('Heaviside(t - 5) + sin(t)')
+            sympy.sympify.assert_called_once_with('Heaviside(t - 5) + sin(t)')
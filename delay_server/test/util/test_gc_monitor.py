@@ -0,0 +1,58 @@
+""" Test for util.gc_monitor module. """
+import gc
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.util.gc_monitor import GcMonitor, AllocationProfiler, \
+    enable_hot_path, disable_hot_path
+
+
+class TestGcMonitor(TestClass):
+    """Test class for garbage collector tuning and profiling."""
+
+    def test_monitor(self):
+        monitor = GcMonitor(warn_pause=0, logger=self._logger)
+        monitor.start()
+        monitor.start()
+        self.assertEqual(gc.callbacks.count(monitor._callback), 1)
+        with self.assertLogs(self._logger, 'WARNING'):
+            gc.collect()
+        monitor.stop()
+        self.assertNotIn(monitor._callback, gc.callbacks)
+
+        stats = monitor.stats()
+        self.assertGreaterEqual(stats['collections'][2], 1)
+        self.assertGreater(stats['pause_max'][2], 0)
+        self.assertGreaterEqual(stats['pause_total'][2],
+                                stats['pause_max'][2])
+        self.assertGreater(stats['pause_p99'], 0)
+
+        # Not recorded once stopped.
+        gc.collect()
+        self.assertEqual(monitor.stats()['collections'], stats['collections'])
+
+    def test_hot_path(self):
+        previous = enable_hot_path((10000, 30, 40), self._logger)
+        try:
+            self.assertEqual(gc.get_threshold(), (10000, 30, 40))
+            self.assertGreater(gc.get_freeze_count(), 0)
+        finally:
+            disable_hot_path(previous)
+        self.assertEqual(gc.get_threshold(), previous)
+        self.assertEqual(gc.get_freeze_count(), 0)
+
+    def test_profiler(self):
+        profiler = AllocationProfiler(self._logger)
+        with self.assertRaises(RuntimeError):
+            profiler.report(0)
+
+        profiler.start(10)
+        frames = [bytearray(1000) for _ in range(100)]
+        ret = profiler.report(110, 3)
+        profiler.stop()
+
+        site, size, count = ret[0]
+        self.assertIn('test_gc_monitor.py', site)
+        self.assertGreaterEqual(size, 1000)
+        self.assertGreaterEqual(count, 1)
+        self.assertEqual(len(frames), 100)
@@ -0,0 +1,50 @@
+""" Test for util.history module. """
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.util.history import RingBuffer, History
+
+
+class TestHistory(TestClass):
+    """Test class for downsampled history."""
+
+    def test_ring_buffer(self):
+        with self.assertRaises(ValueError):
+            RingBuffer(0)
+        ring = RingBuffer(3)
+        self.assertEqual(ring.points(), ([], []))
+        ring.append(1, 10)
+        ring.append(2, 20)
+        self.assertEqual(len(ring), 2)
+        self.assertEqual(ring.points(), ([1, 2], [10, 20]))
+
+        # Oldest points are overwritten.
+        for i in range(3, 6):
+            ring.append(i, i * 10)
+        self.assertEqual(len(ring), 3)
+        self.assertEqual(ring.points(), ([3, 4, 5], [30, 40, 50]))
+        self.assertEqual(ring.points(4), ([4, 5], [40, 50]))
+        self.assertEqual(ring.points(6), ([], []))
+
+    def test_downsampling(self):
+        history = History(((1, 5), (10, 4)))
+        for i in range(45):
+            history.add(i + 0.5, i)
+
+        # The 1 sec level covers the last 5 points plus the one being
+        # accumulated.
+        resolution, times, values = history.series(5, 45)
+        self.assertEqual(resolution, 1)
+        self.assertEqual(times, [40, 41, 42, 43, 44])
+        self.assertEqual(values, [40, 41, 42, 43, 44])
+
+        # Longer windows use the 10 sec averages.
+        resolution, times, values = history.series(40, 45)
+        self.assertEqual(resolution, 10)
+        self.assertEqual(times, [10, 20, 30, 40])
+        self.assertEqual(values, [14.5, 24.5, 34.5, 42])
+
+        # Memory is bounded by the number of points of each level.
+        for i in range(45, 10000):
+            history.add(i + 0.5, i)
+        self.assertEqual(len(history.series(10 ** 6, 10000)[1]), 5)
@@ -0,0 +1,58 @@
+""" Test for util.log_ring module. """
+import logging
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.util.log_ring import LogRing, SLOT
+from delay_server.util.log_handler import LogRingHandler
+
+
+class TestLogRing(TestClass):
+    """Test class for the shared memory log ring."""
+
+    def setUp(self):
+        self._ring = LogRing(slots=4, slot_size=32, create=True)
+
+    def tearDown(self):
+        self._ring.close()
+
+    def test_read(self):
+        self._ring.append(logging.INFO, 'first')
+        reader = LogRing(self._ring.name)
+        self._ring.append(logging.ERROR, 'second')
+
+        # Messages still in the ring are read when attaching.
+        self.assertEqual(reader.read(), [(logging.INFO, 'first'),
+                                         (logging.ERROR, 'second')])
+        self.assertEqual(reader.read(), [])
+
+        # Long messages are truncated.
+        self._ring.append(logging.DEBUG, 'x' * 100)
+        self.assertEqual(reader.read(),
+                         [(logging.DEBUG, 'x' * (32 - SLOT.size))])
+        reader.close()
+
+    def test_overrun(self):
+        reader = LogRing(self._ring.name)
+        for i in range(10):
+            self._ring.append(logging.INFO, str(i))
+        self.assertEqual([msg for _, msg in reader.read()],
+                         ['6', '7', '8', '9'])
+        self.assertEqual(reader.dropped, 6)
+        reader.close()
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            LogRing(slots=0, create=True)
+        with self.assertRaises(ValueError):
+            LogRing(slot_size=SLOT.size, create=True)
+
+    def test_handler(self):
+        logger = logging.getLogger('test_log_ring')
+        handler = LogRingHandler(self._ring)
+        logger.addHandler(handler)
+        logger.warning('Queue %s', 'full')
+        logger.removeHandler(handler)
+        reader = LogRing(self._ring.name)
+        self.assertEqual(reader.read(), [(logging.WARNING, 'Queue full')])
+        reader.close()
@@ -1,11 +1,11 @@
 """ Test for delay.queue module. """
-import time
-
 # pylint: disable=E0401
 from test.test_custom_class import TestClass
 from delay_server.delay.delay import CommDelay
 from delay_server.util.queue import DelayQueue
 from delay_server.util.exceptions import LockError
+from delay_server.util.buffer_pool import BufferPool
+from delay_server.util.clock import SimulatedClock
 
 
 class TestQueue(TestClass):
@@ -105,22 +105,44 @@ class TestQueue(TestClass):
         self.assertTrue(self.__queue._lock.release())
 
     def test_push_pop_with_delay(self):
-        self.assertEqual(len(self.__queue), 0)
+        clock = SimulatedClock()
+        queue = DelayQueue(self._logger, clock=clock)
 
-        delay = 0.1  # sec
+        delay = 1200  # sec
 
         c = CommDelay()
         c.set_override(delay)
         self.assertEqual(c.time, delay)
 
-        ret = self.__queue.push("test")
+        ret = queue.push("test")
         self.assertEqual(ret, 1)
-        ret = self.__queue.pop()
+        ret = queue.pop()
         self.assertIsNone(ret)
-        time.sleep(delay)
-        ret = self.__queue.pop()
+        clock.advance(delay - 0.001)
+        self.assertIsNone(queue.pop())
+        clock.sleep(0.001)
+        ret = queue.pop()
         self.assertEqual(ret, "test")
 
+    def test_default_clock(self):
+        # Queues follow the clock of CommDelay unless given one, even if it
+        # is replaced after the queue was created.
+        queue = DelayQueue(self._logger)
+        self.assertTrue(queue.shared_clock)
+        clock = SimulatedClock(100)
+        CommDelay().set_clock(clock)
+        try:
+            self.assertIs(queue.clock, clock)
+            CommDelay().set_override(10)
+            queue.push("test")
+            clock.advance(9)
+            self.assertIsNone(queue.pop())
+            clock.advance(1)
+            self.assertEqual(queue.pop(), "test")
+        finally:
+            CommDelay().set_clock()
+        self.assertFalse(DelayQueue(self._logger, clock=clock).shared_clock)
+
     def test_len(self):
         self.assertEqual(len(self.__queue), 0)
         self.assertEqual(self.__queue.push(b'\x05'), 1)
@@ -163,3 +185,236 @@ class TestQueue(TestClass):
         with self.assertRaises(LockError):
             self.__queue.__str__()
         self.assertTrue(self.__queue._lock.release())
+
+    def test_invalid_budget(self):
+        with self.assertRaises(ValueError):
+            DelayQueue(policy='dummy')
+        with self.assertRaises(ValueError):
+            DelayQueue(high_water=0.5, low_water=0.6)
+        with self.assertRaises(ValueError):
+            DelayQueue(high_water=1.5)
+        with self.assertRaises(ValueError):
+            DelayQueue(max_bytes=-1)
+
+    def test_drop_newest(self):
+        queue = DelayQueue(self._logger, max_msgs=3,
+                           policy=DelayQueue.POLICY_DROP_NEWEST)
+        for i in range(5):
+            queue.push(b'\x00' * (i + 1))
+        self.assertEqual(len(queue), 3)
+        stats = queue.stats()
+        self.assertEqual(stats['dropped_newest'], 2)
+        self.assertEqual(stats['dropped_oldest'], 0)
+        self.assertEqual(stats['bytes'], 6)
+        self.assertEqual(queue.pop(), b'\x00')
+
+        # Message larger than the byte budget is always dropped.
+        queue = DelayQueue(self._logger, max_bytes=4,
+                           policy=DelayQueue.POLICY_DROP_OLDEST)
+        self.assertEqual(queue.push(b'\x00' * 5), 0)
+        self.assertEqual(queue.stats()['dropped_newest'], 1)
+
+    def test_budget_capacity(self):
+        # Frames count the capacity of their buffer against the budget.
+        pool = BufferPool(100, 0)
+        queue = DelayQueue(self._logger, max_bytes=250,
+                           policy=DelayQueue.POLICY_DROP_NEWEST)
+        for _ in range(3):
+            buf = pool.acquire()
+            buf.end = 4
+            queue.push(buf)
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.stats()['bytes'], 200)
+        self.assertEqual(queue.stats()['dropped_newest'], 1)
+        queue.clear()
+        self.assertEqual(queue.stats()['bytes'], 0)
+
+    def test_drop_oldest(self):
+        queue = DelayQueue(self._logger, max_bytes=10,
+                           policy=DelayQueue.POLICY_DROP_OLDEST)
+        for i in range(4):
+            queue.push(bytes([i]) * 4)
+        self.assertEqual(len(queue), 2)
+        stats = queue.stats()
+        self.assertEqual(stats['dropped_oldest'], 2)
+        self.assertEqual(stats['bytes'], 8)
+        self.assertEqual(queue.pop(), b'\x02' * 4)
+        self.assertEqual(queue.pop(), b'\x03' * 4)
+        self.assertEqual(queue.stats()['bytes'], 0)
+
+    def test_backpressure(self):
+        queue = DelayQueue(self._logger, max_msgs=10, high_water=0.8,
+                           low_water=0.5)
+        self.assertFalse(queue.backpressure)
+
+        # Crossing the high water mark enables backpressure.
+        for i in range(8):
+            self.assertFalse(queue.backpressure)
+            queue.push(b'\x01')
+        self.assertTrue(queue.backpressure)
+        self.assertTrue(queue.stats()['backpressure'])
+
+        # Messages above the budget are dropped.
+        for i in range(4):
+            queue.push(b'\x01')
+        self.assertEqual(len(queue), 10)
+        self.assertEqual(queue.stats()['dropped_newest'], 2)
+
+        # Hysteresis until the low water mark is reached.
+        for i in range(5):
+            self.assertTrue(queue.backpressure)
+            self.assertIsNotNone(queue.pop())
+        self.assertEqual(queue.stats()['fill'], 0.5)
+        self.assertTrue(queue.backpressure)
+        self.assertIsNotNone(queue.pop())
+        self.assertFalse(queue.backpressure)
+
+        # Clear resets the condition.
+        for i in range(10):
+            queue.push(b'\x01')
+        self.assertTrue(queue.backpressure)
+        queue.clear()
+        self.assertFalse(queue.backpressure)
+
+        # Drop policies never request backpressure.
+        queue = DelayQueue(self._logger, max_msgs=1,
+                           policy=DelayQueue.POLICY_DROP_NEWEST)
+        queue.push(b'\x01')
+        self.assertFalse(queue.backpressure)
+
+    def test_stats(self):
+        stats = self.__queue.stats()
+        self.assertEqual(stats['msgs'], 0)
+        self.assertEqual(stats['bytes'], 0)
+        self.assertIsNone(stats['max_msgs'])
+        self.assertIsNone(stats['max_bytes'])
+        self.assertEqual(stats['fill'], 0)
+        self.assertEqual(stats['policy'], DelayQueue.POLICY_BACKPRESSURE)
+
+        self.__queue.push(b'\x01\x02')
+        self.__queue.push("test")
+        stats = self.__queue.stats()
+        self.assertEqual(stats['msgs'], 2)
+        self.assertEqual(stats['bytes'], 6)
+
+        self.assertTrue(self.__queue._lock.acquire())
+        with self.assertRaises(LockError):
+            self.__queue.stats()
+        self.assertTrue(self.__queue._lock.release())
+
+    def test_push_timestamp(self):
+        clock = SimulatedClock(100)
+        queue = DelayQueue(self._logger, clock=clock)
+        CommDelay().set_override(10)
+
+        # Received 3 sec before it was pushed.
+        queue.push("early", 97)
+        queue.push("now")
+        clock.advance(7)
+        self.assertEqual(queue.pop(), "early")
+        self.assertIsNone(queue.pop())
+        clock.advance(3.5)
+        self.assertEqual(queue.pop(), "now")
+
+        stats = queue.stats()
+        self.assertEqual(stats['released'], 2)
+        self.assertAlmostEqual(stats['release_error_mean'], 0.25)
+        self.assertAlmostEqual(stats['release_error_max'], 0.5)
+        self.assertAlmostEqual(stats['ingress_lag_mean'], 1.5)
+        self.assertAlmostEqual(stats['ingress_lag_max'], 3)
+
+    def test_next_deadline(self):
+        clock = SimulatedClock(100)
+        queue = DelayQueue(self._logger, clock=clock)
+        CommDelay().set_override(10)
+        self.assertIsNone(queue.next_deadline())
+
+        queue.push("first", 95)
+        queue.push("second")
+        self.assertEqual(queue.next_deadline(), 105)
+
+        # Follows changes to the delay.
+        CommDelay().set_override(20)
+        self.assertEqual(queue.next_deadline(), 115)
+        clock.advance(15)
+        self.assertEqual(queue.pop(), "first")
+        self.assertEqual(queue.next_deadline(), 120)
+
+        self.assertTrue(queue._lock.acquire())
+        with self.assertRaises(LockError):
+            queue.next_deadline()
+        self.assertTrue(queue._lock.release())
+
+    def test_snapshot(self):
+        clock = SimulatedClock(100)
+        queue = DelayQueue(self._logger, clock=clock)
+        CommDelay().set_override(10)
+        self.assertEqual(queue.snapshot()['entries'], [])
+        for i in range(20):
+            queue.push(b'\x00' * (i + 1))
+            clock.advance(1)
+
+        # Oldest messages.
+        ret = queue.snapshot(0, 3)
+        self.assertEqual(ret['msgs'], 20)
+        self.assertEqual(ret['bytes'], 210)
+        self.assertEqual(ret['delay'], 10)
+        self.assertEqual(ret['now'], 120)
+        self.assertEqual(ret['entries'],
+                         [dict(index=0, size=1, ingress=100, remaining=-10),
+                          dict(index=1, size=2, ingress=101, remaining=-9),
+                          dict(index=2, size=3, ingress=102, remaining=-8)])
+
+        # Newest messages, from either end.
+        for start in (-2, 18):
+            ret = queue.snapshot(start, 5)
+            self.assertEqual([e['index'] for e in ret['entries']], [18, 19])
+            self.assertEqual(ret['entries'][1]['remaining'], 9)
+        self.assertEqual([e['size'] for e in queue.snapshot(12, 3)['entries']],
+                         [13, 14, 15])
+
+        # Out of range and page size limit.
+        self.assertEqual(queue.snapshot(25)['entries'], [])
+        self.assertEqual(len(queue.snapshot(-50, 50)['entries']), 20)
+        queue.MAX_PAGE = 4
+        self.assertEqual(len(queue.snapshot(0, 50)['entries']), 4)
+
+        self.assertTrue(queue._lock.acquire())
+        with self.assertRaises(LockError):
+            queue.snapshot()
+        self.assertTrue(queue._lock.release())
+
+    def test_snapshot_large(self):
+        clock = SimulatedClock(0)
+        queue = DelayQueue(self._logger, clock=clock)
+        CommDelay().set_override(10)
+        for i in range(20000):
+            queue.push(b'\x00' * (i % 100 + 1))
+            clock.advance(0.001)
+
+        # Page in the middle of the queue.
+        ret = queue.snapshot(10010, 3)
+        self.assertEqual(ret['msgs'], 20000)
+        self.assertEqual([e['index'] for e in ret['entries']],
+                         [10010, 10011, 10012])
+        self.assertEqual([e['size'] for e in ret['entries']], [11, 12, 13])
+        self.assertAlmostEqual(ret['entries'][0]['ingress'], 10.01)
+
+        # Pages past the middle are read from the newest end.
+        ret = queue.snapshot(-3, 3)
+        self.assertEqual([e['index'] for e in ret['entries']],
+                         [19997, 19998, 19999])
+        self.assertEqual([e['size'] for e in ret['entries']], [98, 99, 100])
+
+    def test_release_discarded(self):
+        pool = BufferPool(8, 0)
+        queue = DelayQueue(self._logger, max_msgs=1,
+                           policy=DelayQueue.POLICY_DROP_OLDEST)
+        for _ in range(3):
+            buf = pool.acquire()
+            buf.end = 4
+            queue.push(buf)
+        self.assertEqual(pool.allocated, 2)
+        self.assertEqual(len(pool), 1)
+        queue.clear()
+        self.assertEqual(len(pool), 2)
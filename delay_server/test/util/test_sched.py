@@ -0,0 +1,65 @@
+""" Test for util.sched module. """
+import os
+import threading
+import unittest
+import mock
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.util.sched import parse_cpus, set_thread_sched, describe
+
+
+class TestSched(TestClass):
+    """Test class for thread scheduling."""
+
+    def test_parse_cpus(self):
+        self.assertIsNone(parse_cpus(''))
+        self.assertIsNone(parse_cpus(' , '))
+        self.assertEqual(parse_cpus('1'), {1})
+        self.assertEqual(parse_cpus('0, 2-4'), {0, 2, 3, 4})
+        for text in ('a', '3-1', '-1', '1-x'):
+            with self.assertRaises(ValueError):
+                parse_cpus(text)
+
+    def test_nothing_requested(self):
+        self.assertTrue(set_thread_sched(logger=self._logger))
+
+    @unittest.skipUnless(hasattr(os, 'sched_setaffinity'),
+                         "CPU affinity not supported")
+    def test_affinity(self):
+        cpus = os.sched_getaffinity(0)
+        cpu = min(cpus)
+        ret = {}
+
+        # Only the calling thread is pinned.
+        def run():
+            ret['ok'] = set_thread_sched({cpu}, logger=self._logger)
+            ret['cpus'] = os.sched_getaffinity(0)
+            ret['describe'] = describe()
+
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+        self.assertTrue(ret['ok'])
+        self.assertEqual(ret['cpus'], {cpu})
+        self.assertIn('cpus=' + str(cpu), ret['describe'])
+        self.assertEqual(os.sched_getaffinity(0), cpus)
+
+    @unittest.skipUnless(hasattr(os, 'sched_setaffinity'),
+                         "CPU affinity not supported")
+    def test_degrade(self):
+        # CPU that does not exist.
+        with self.assertLogs(self._logger, 'WARNING'):
+            self.assertFalse(set_thread_sched({1 << 16}, logger=self._logger))
+
+        # Unknown policy.
+        with self.assertLogs(self._logger, 'WARNING'):
+            self.assertFalse(set_thread_sched(policy='edf',
+                                              logger=self._logger))
+
+        # Real-time policy without privileges.
+        with mock.patch('os.sched_setscheduler',
+                        side_effect=PermissionError(1, 'Not permitted')):
+            with self.assertLogs(self._logger, 'WARNING'):
+                self.assertFalse(set_thread_sched(policy='fifo', priority=10,
+                                                  logger=self._logger))
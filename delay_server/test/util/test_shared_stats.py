@@ -0,0 +1,124 @@
+""" Test for util.shared_stats module. """
+import multiprocessing
+import sys
+import unittest
+
+# pylint: disable=E0401
+from test.test_custom_class import TestClass
+from delay_server.delay.delay import CommDelay
+from delay_server.delay.proxy import DelayProxy
+from delay_server.util.clock import SimulatedClock
+from delay_server.util.shared_stats import SharedStats, StatsPublisher, \
+    SEQ, SEQ_OFFSET
+
+
+def _read_stats(name: str, results) -> None:
+    """Read the statistics from another process."""
+    stats = SharedStats(name)
+    results.put(stats.read())
+    stats.close()
+
+
+class TestSharedStats(TestClass):
+    """Test class for the statistics block."""
+
+    def setUp(self):
+        self._stats = SharedStats(links=('mcc', 'hab'), create=True)
+
+    def tearDown(self):
+        self._stats.close()
+
+    def test_write_read(self):
+        reader = SharedStats(self._stats.name)
+        self.assertEqual(reader.links, ['mcc', 'hab'])
+        ret = reader.read()
+        self.assertEqual(ret['seq'], 0)
+        self.assertEqual(ret['links']['hab']['msgs'], 0)
+
+        self._stats.write(1200, 3600.5, {'mcc': dict(msgs=5, bytes=100,
+                                                     fill=0.5,
+                                                     backpressure=True)})
+        self._stats.write(1200, 3601.5, {'mcc': dict(msgs=6),
+                                         'other': dict(msgs=1)})
+        ret = reader.read()
+        self.assertEqual(ret['seq'], 4)
+        self.assertEqual(ret['delay'], 1200)
+        self.assertEqual(ret['met'], 3601.5)
+        self.assertEqual(ret['links']['mcc']['msgs'], 6)
+        self.assertEqual(ret['links']['mcc']['bytes'], 100)
+        self.assertEqual(ret['links']['mcc']['fill'], 0.5)
+        self.assertTrue(ret['links']['mcc']['backpressure'])
+        self.assertEqual(ret['links']['hab']['msgs'], 0)
+        self.assertEqual(ret['links']['mcc']['oldest'], [])
+
+        # Messages in flight.
+        entries = [dict(index=i, size=10 * i, age=i / 2, remaining=-i)
+                   for i in range(8)]
+        self._stats.write(1200, 3602.5, {'hab': dict(oldest=entries,
+                                                     newest=entries[6:])})
+        ret = reader.read()['links']['hab']
+        self.assertEqual(ret['oldest'], entries[:5])
+        self.assertEqual(ret['newest'], entries[6:])
+        reader.close()
+
+        # The reader does not remove the block.
+        reader = SharedStats(self._stats.name)
+        self.assertEqual(reader.links, ['mcc', 'hab'])
+        reader.close()
+
+    def test_write_in_progress(self):
+        reader = SharedStats(self._stats.name)
+        SEQ.pack_into(self._stats._shm.buf, SEQ_OFFSET, 1)
+        self.assertIsNone(reader.read())
+        SEQ.pack_into(self._stats._shm.buf, SEQ_OFFSET, 2)
+        self.assertEqual(reader.read()['seq'], 2)
+        reader.close()
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            SharedStats(links=('a' * 17,), create=True)
+        with self.assertRaises(FileNotFoundError):
+            SharedStats('no_such_stats_block')
+
+    @unittest.skipIf(sys.platform.startswith("win"),
+                     "Will not work on Windows")
+    def test_other_process(self):
+        self._stats.write(10, 20, {'hab': dict(msgs=3)})
+        ctx = multiprocessing.get_context('spawn')
+        results = ctx.Queue()
+        process = ctx.Process(target=_read_stats,
+                              args=(self._stats.name, results))
+        process.start()
+        ret = results.get(timeout=30)
+        process.join()
+        self.assertEqual(ret['links']['hab']['msgs'], 3)
+
+    def test_publisher(self):
+        clock = SimulatedClock(100)
+        CommDelay().set_clock(clock)
+        CommDelay().set_override(5)
+        try:
+            proxy = DelayProxy('mcc')
+            publisher = StatsPublisher(self._stats, {'mcc': proxy})
+            publisher.publish()
+            proxy._received = 20
+            proxy._queue.push(b'\x01\x02')
+            clock.advance(2)
+            proxy._queue.push(b'\x03')
+            publisher.publish()
+        finally:
+            CommDelay().set_override(None)
+            CommDelay().set_clock()
+
+        ret = self._stats.read()
+        self.assertEqual(ret['delay'], 5)
+        self.assertEqual(ret['met'], 2)
+        mcc = ret['links']['mcc']
+        self.assertEqual(mcc['msgs'], 2)
+        self.assertEqual(mcc['bytes'], 3)
+        self.assertEqual(mcc['rate_in'], 10)
+        self.assertEqual(mcc['rate_out'], 0)
+        self.assertEqual(mcc['oldest'],
+                         [dict(index=0, size=2, age=2, remaining=3),
+                          dict(index=1, size=1, age=0, remaining=5)])
+        self.assertEqual(mcc['newest'], mcc['oldest'])
@@ -14,6 +14,7 @@
 #
 import os
 import sys
+sys.path.insert(0, os.path.abspath('..'))
 sys.path.insert(0, os.path.abspath('../delay_server'))
 sys.path.insert(0, os.path.abspath('../delay_server/util'))
 sys.path.insert(0, os.path.abspath('../delay_server/delay'))
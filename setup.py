@@ -0,0 +1,14 @@
+"""Install the delay_common package shared by the Delay Server and Delay
+Client.
+
+Usage: ``pip install -e .`` from the root of the repository.
+"""
+from setuptools import setup
+
+setup(
+    name='delay_common',
+    version='1.0.0',
+    description='Packet codec shared by the Delay Server and Delay Client.',
+    packages=['delay_common'],
+    python_requires='>=3.8',
+)